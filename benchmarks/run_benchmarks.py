@@ -0,0 +1,364 @@
+# Benchmarks of ParaQuery on synthetic paraphrase databases (see synthetic.py),
+# which need neither the Europarl grammars nor NLTK's WordNet data. The
+# benchmarks are run in groups:
+#
+#   index: indexing the grammar from a sorted file, lazily and from unsorted shards
+#   queries: the latency of each construct of the query grammar
+#   counts: "show count" queries with and without group_by
+#   analyses: the variants of "analyze", without the analysis cache
+#
+# Each benchmark is run in a new process, so that its peak memory use
+# (ru_maxrss) can be measured, and each query and analysis is timed over
+# several runs, of which the median is the result and the first run is also
+# reported. The generated data and databases are kept in the working directory
+# and reused as long as the generator parameters are the same. The results can
+# be saved as a JSON baseline and compared with a baseline saved earlier: the
+# benchmarks whose time or peak memory use grew by more than the tolerance are
+# reported as regressions and the exit status is 1.
+#
+# Run it as: python benchmarks/run_benchmarks.py [options]
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import timeit
+from cStringIO import StringIO
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import para_wn
+import queryshell
+import synthetic
+
+GROUPS = ['index', 'queries', 'counts', 'analyses']
+
+# the benchmarks of the index group as (name, index argument), where the
+# argument is formatted with the paths of the generated data
+INDEXES = [('sorted', '{grammar}'), ('lazy', '{grammar} lazy'), ('sharded', '{shards}')]
+
+# the benchmarks of the other groups as (name, setup commands, timed command),
+# where the commands are formatted with some words of the synthetic grammar
+QUERIES = [
+    ('source', [], 'show source = "{word}"'),
+    ('source_wildcard', [], 'show source = "{prefix}*"'),
+    ('target', [], 'show target = "{word}"'),
+    ('prob', [], 'show prob > 0.5'),
+    ('source_prob', [], 'show source = "{word}" and prob > 0.01'),
+    ('length', [], 'show source is 2 words'),
+    ('length_difference', [], 'show source > target by 1 words'),
+    ('relation', [], 'show relation = "synonym"'),
+    ('source_relation', [], 'show source = "{word}" and relation != "not in WN"'),
+    ('distance', [], 'show distance = 2'),
+    ('pivot_count', [], 'show pivots = 1'),
+    ('pivot_include', [], 'show pivots include "{pivot}"'),
+    ('different', [], 'show different'),
+    ('most_probable', [], 'show most probable'),
+    ('least_probable', [], 'show least probable'),
+    ('top_per_source', [], 'show top 5 per source where prob > 0.01'),
+    ('paraphrase_count', [], 'show sources with > 20 paraphrases'),
+    ('source_lemma', [], 'show source lemma = "{word}"'),
+    ('same_pos', ['set same_pos on'], 'show source = "{prefix}*"'),
+    ('unique_tgt', ['set unique_tgt on'], 'show source = "{prefix}*"'),
+    ('explain', [], 'explain source = "{word}"'),
+    ('next', ['show prob > 0.01'], 'next'),
+]
+
+COUNTS = [
+    ('count', [], 'show count prob > 0.1'),
+    ('count_source', [], 'show count source = "{prefix}*"'),
+    ('count_top_per_source', [], 'show count top 5 per source'),
+    ('group_by_relation', ['set group_by relation'], 'show count prob > 0.1'),
+    ('group_by_source', ['set group_by source'], 'show count source = "{prefix}*"'),
+    ('group_by_pivotnum', ['set group_by pivotnum'], 'show count prob > 0.01'),
+]
+
+ANALYSES = [
+    ('limit', [], 'analyze source = "{prefix}*"'),
+    ('python', ['set limit 5000'], 'analyze prob > 0.01'),
+    ('all', [], 'analyze all prob > 0.01'),
+    ('top', [], 'analyze top 5'),
+    ('sample', [], 'analyze sample 1000'),
+    ('sample_stratified', [], 'analyze sample 1000 stratified'),
+    ('approx', [], 'analyze approx prob > 0.01'),
+    ('using_terms', [], 'analyze all using terms {terms}'),
+    ('using_terms_top', [], 'analyze top 5 using terms {terms}'),
+]
+
+# the number of terms in the terms file, the most frequent words
+NUM_TERMS = 50
+
+
+def _maxrss_kb(who):
+    maxrss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on Mac OS X and in kilobytes elsewhere
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
+
+def _child(queue, function, args):
+    # the shell writes its results to stdout and its errors to stderr
+    sys.stdout = open(os.devnull, 'w')
+    sys.stderr = StringIO()
+    try:
+        result = function(*args)
+        errors = [line.strip() for line in sys.stderr.getvalue().splitlines() if 'Error' in line]
+        if errors:
+            result = {'error': errors[0]}
+    except Exception as e:
+        result = {'error': '{}: {}'.format(type(e).__name__, e)}
+    result['maxrss_kb'] = _maxrss_kb(resource.RUSAGE_SELF)
+    # e.g., the processes that sort or analyze in parallel
+    children = _maxrss_kb(resource.RUSAGE_CHILDREN)
+    if children > 0:
+        result['children_maxrss_kb'] = children
+    queue.put(result)
+
+
+def run_in_process(function, *args):
+    """
+    Run the given function in a new process and return its result, a
+    dictionary, with the peak memory use of the process in kilobytes under
+    'maxrss_kb', or with an 'error' if the function failed or the shell
+    reported an error.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_child, args=(queue, function, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _shell(dbdir):
+    # a shell with the database in the given directory attached
+    os.chdir(dbdir)
+    app = queryshell.ParaQueryApp()
+    app.preloop()
+    # analyses are computed every time and their examples are reproducible
+    app.onecmd('set analysis_cache off')
+    app.onecmd('set seed 1')
+    return app
+
+
+def _time_index(dbdir, arg, num_rules):
+    if not os.path.exists(dbdir):
+        os.makedirs(dbdir)
+    if os.path.exists(os.path.join(dbdir, '.paradb')):
+        os.remove(os.path.join(dbdir, '.paradb'))
+    app = _shell(dbdir)
+    start = timeit.default_timer()
+    app.onecmd('index ' + arg)
+    seconds = timeit.default_timer() - start
+    # lazily indexed databases are annotated in the background afterwards
+    app._stop_annotator()
+    return {'seconds': seconds, 'rules_per_second': num_rules / seconds,
+            'db_bytes': os.path.getsize(os.path.join(dbdir, '.paradb'))}
+
+
+def _time_command(dbdir, setup, command, repeat):
+    # the first run is timed separately since it reads the database from disk
+    app = _shell(dbdir)
+    for cmd in setup:
+        app.onecmd(cmd)
+    times = []
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        app.onecmd(command)
+        times.append(timeit.default_timer() - start)
+    first = times[0]
+    times.sort()
+    return {'seconds': times[len(times) // 2], 'min': times[0], 'first': first, 'runs': repeat}
+
+
+def prepare(workdir, config):
+    """
+    Generate the synthetic grammar, its shards, the lexicon and the terms
+    file for the given generator parameters in the working directory,
+    unless they were already generated with the same parameters, and return
+    the paths of the data and the number of rules.
+    """
+    paths = {'grammar': os.path.join(workdir, 'grammar.gz'), 'shards': os.path.join(workdir, 'shards'),
+             'lexicon': os.path.join(workdir, 'lexicon'), 'terms': os.path.join(workdir, 'terms.txt')}
+    config_file = os.path.join(workdir, 'config.json')
+    if os.path.exists(config_file):
+        with open(config_file) as infile:
+            saved = json.load(infile)
+        if saved['config'] == config:
+            return paths, saved['rules']
+    if not os.path.exists(workdir):
+        os.makedirs(workdir)
+    sys.stderr.write('\n Generating the synthetic data in {} ...'.format(workdir))
+    grammar_args = dict([(name, value) for (name, value) in config.items() if name not in ['coverage', 'shards']])
+    num_rules = synthetic.write_grammar(paths['grammar'], **grammar_args)
+    synthetic.write_grammar(paths['shards'], config['shards'], **grammar_args)
+    synthetic.write_lexicon(paths['lexicon'], config['vocabulary'], config['coverage'], config['seed'])
+    with open(paths['terms'], 'w') as outfile:
+        outfile.writelines([synthetic.word(i) + '\n' for i in range(NUM_TERMS)])
+    # the databases of earlier runs are indexed from other data
+    for name, _ in INDEXES:
+        dbfile = os.path.join(workdir, 'index-' + name, '.paradb')
+        if os.path.exists(dbfile):
+            os.remove(dbfile)
+    with open(config_file, 'w') as outfile:
+        json.dump({'config': config, 'rules': num_rules}, outfile)
+    sys.stderr.write(' done ({} rules).\n'.format(num_rules))
+    return paths, num_rules
+
+
+def run(workdir, config, groups, repeat, report=sys.stdout):
+    """
+    Run the benchmarks of the given groups on the synthetic data generated
+    with the given parameters in the working directory and return the results
+    by benchmark name, e.g., 'queries.source'. Each result is written to
+    report as soon as it is available.
+    """
+    workdir = os.path.abspath(workdir)
+    paths, num_rules = prepare(workdir, config)
+    para_wn.use_lexicon(paths['lexicon'])
+    results = {}
+
+    def add(name, result):
+        results[name] = result
+        if 'error' in result:
+            report.write(' {:<36} error: {}\n'.format(name, result['error']))
+        else:
+            first = ' (first {:.4f})'.format(result['first']) if result.get('first') is not None else ''
+            report.write(' {:<36} {:10.4f} s{:<18} {:8.1f} MB\n'.format(name, result['seconds'], first, result['maxrss_kb'] / 1024.0))
+        report.flush()
+
+    dbdir = os.path.join(workdir, 'index-sorted')
+    for name, arg in INDEXES:
+        if 'index' in groups:
+            add('index.' + name, run_in_process(_time_index, os.path.join(workdir, 'index-' + name), arg.format(**paths), num_rules))
+    if set(groups) - set(['index']) and not os.path.exists(os.path.join(dbdir, '.paradb')):
+        result = run_in_process(_time_index, dbdir, paths['grammar'], num_rules)
+        if 'error' in result:
+            raise RuntimeError('cannot index the synthetic grammar: ' + result['error'])
+
+    words = {'word': synthetic.word(0), 'prefix': synthetic.word(0)[:3], 'pivot': synthetic.foreign_word(0), 'terms': paths['terms']}
+    for group, benchmarks in [('queries', QUERIES), ('counts', COUNTS), ('analyses', ANALYSES)]:
+        if group not in groups:
+            continue
+        for name, setup, command in benchmarks:
+            setup = [cmd.format(**words) for cmd in setup]
+            add(group + '.' + name, run_in_process(_time_command, dbdir, setup, command.format(**words), repeat))
+    return results
+
+
+def environment():
+    """Return a description of the machine and software the benchmarks are run with."""
+    env = {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform(),
+           'processor': platform.processor(), 'cpus': multiprocessing.cpu_count()}
+    try:
+        with open(os.devnull, 'w') as devnull:
+            env['revision'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                                                      cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return env
+
+
+def compare(results, baseline, tolerance, min_seconds, min_memory_kb):
+    """
+    Return the regressions of the results with respect to the baseline
+    results as (benchmark name, metric, baseline value, value), i.e., the
+    times and peak memory uses that grew by more than the tolerance (a
+    fraction) and by more than min_seconds or min_memory_kb.
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline or 'error' in results[name] or 'error' in baseline[name]:
+            continue
+        for metric, minimum in [('seconds', min_seconds), ('maxrss_kb', min_memory_kb)]:
+            old = baseline[name][metric]
+            new = results[name][metric]
+            if new > old * (1 + tolerance) and new - old > minimum:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def comparison_display(results, baseline):
+    # the times of the results next to those of the baseline
+    out = ['\n {:<36} {:>10} {:>10} {:>8}'.format('benchmark', 'baseline', 'current', 'change')]
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            out.append(' {:<36} {}'.format(name, 'only in the baseline' if name in baseline else 'not in the baseline'))
+        elif 'error' in results[name] or 'error' in baseline[name]:
+            out.append(' {:<36} {}'.format(name, 'error'))
+        else:
+            old = baseline[name]['seconds']
+            new = results[name]['seconds']
+            change = '{:+7.1f}%'.format(100.0 * (new - old) / old) if old > 0 else ''
+            out.append(' {:<36} {:10.4f} {:10.4f} {:>8}'.format(name, old, new, change))
+    return '\n'.join(out) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ParaQuery on synthetic paraphrase databases.')
+    parser.add_argument('-w', '--workdir', default='benchmark-data', help='the directory for the generated data and databases (default: %(default)s)')
+    parser.add_argument('-g', '--groups', default=','.join(GROUPS), help='the comma-separated groups of benchmarks to run (default: %(default)s)')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='the number of runs of each query and analysis (default: %(default)s)')
+    parser.add_argument('--shards', type=int, default=8, help='the number of shards of the grammar for the sharded index benchmark (default: %(default)s)')
+    for name, value in sorted(synthetic.DEFAULTS.items()):
+        parser.add_argument('--' + name.replace('_', '-'), type=type(value), default=value, help='the synthetic grammar parameter (default: %(default)s)')
+    parser.add_argument('-s', '--save', help='save the results as a JSON baseline in this file')
+    parser.add_argument('-c', '--compare', help='compare the results with the JSON baseline in this file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='the relative slowdown or memory growth reported as a regression (default: %(default)s)')
+    parser.add_argument('--min-seconds', type=float, default=0.005, help='the smallest slowdown in seconds reported as a regression (default: %(default)s)')
+    parser.add_argument('--min-memory', type=int, default=4096, help='the smallest memory growth in kilobytes reported as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    groups = [group.strip() for group in args.groups.split(',') if group.strip()]
+    if any([group not in GROUPS for group in groups]):
+        parser.error('the groups must be among: ' + ', '.join(GROUPS))
+    config = dict([(name, getattr(args, name)) for name in synthetic.DEFAULTS])
+    config['shards'] = args.shards
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare) as infile:
+                baseline = json.load(infile)
+        except (IOError, ValueError) as e:
+            sys.stderr.write('\n Error: cannot read the baseline {} ({}).\n\n'.format(args.compare, e))
+            sys.exit(1)
+        if baseline['config'] != config:
+            sys.stderr.write('\n Warning: the baseline was run with other synthetic grammar parameters.\n')
+
+    try:
+        results = run(args.workdir, config, groups, args.repeat)
+    except (IOError, ValueError, RuntimeError) as e:
+        sys.stderr.write('\n Error: {}.\n\n'.format(e))
+        sys.exit(1)
+
+    if args.save:
+        with open(args.save, 'w') as outfile:
+            json.dump({'created': str(datetime.now()), 'environment': environment(), 'config': config,
+                       'repeat': args.repeat, 'results': results}, outfile, indent=2, sort_keys=True)
+        sys.stderr.write('\n Saved the results to {}.\n'.format(args.save))
+
+    if baseline is not None:
+        # only the benchmarks of the groups that were run are compared
+        baseline_results = dict([(name, result) for (name, result) in baseline['results'].items() if name.split('.')[0] in groups])
+        sys.stdout.write(comparison_display(results, baseline_results))
+        regressions = compare(results, baseline_results, args.tolerance, args.min_seconds, args.min_memory)
+        if regressions:
+            sys.stdout.write('\n Regressions (more than {:.0%} worse):\n'.format(args.tolerance))
+            for name, metric, old, new in regressions:
+                if metric == 'seconds':
+                    sys.stdout.write('  {}: {:.4f} s -> {:.4f} s\n'.format(name, old, new))
+                else:
+                    sys.stdout.write('  {}: {:.1f} MB -> {:.1f} MB peak memory\n'.format(name, old / 1024.0, new / 1024.0))
+            sys.stdout.write('\n')
+            sys.exit(1)
+        sys.stdout.write('\n No regressions.\n\n')
+
+
+if __name__ == '__main__':
+    main()
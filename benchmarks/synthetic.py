@@ -0,0 +1,278 @@
+# Deterministic synthetic data for the benchmarks: pivoted paraphrase grammars
+# in the format read by para_reader and a small WordNet lexicon over the same
+# vocabulary in the format of para_lexicon, so that databases of any size can
+# be indexed and queried without the Europarl grammars or NLTK's WordNet data.
+#
+# The words are made up of syllables (word(i) is the i-th word) and are drawn
+# with Zipfian frequencies, so word(0) is the most frequent word, the number of
+# paraphrases of each source follows a truncated Zipfian distribution and the
+# phrase lengths a geometric one. The same parameters and seed always give the
+# same grammar and lexicon. The lexicon contains about the given fraction of
+# the vocabulary, with a hypernym hierarchy of the noun and verb synsets and
+# random holonym, meronym, antonym, derivation and pertainym pointers, so that
+# all the WordNet relations occur among the rules.
+#
+# Run it as: python benchmarks/synthetic.py [options] <grammar file or directory> [<lexicon directory>]
+
+import argparse
+import bisect
+import gzip
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import para_lexicon
+import para_pivot
+
+_SYLLABLES = ['ba', 'de', 'fi', 'go', 'ku', 'la', 'me', 'ni', 'po', 'ru',
+              'sa', 'te', 'vi', 'wo', 'zu', 'bra', 'cle', 'dri', 'flo', 'gru']
+_FOREIGN_SYLLABLES = ['an', 'che', 'dou', 'en', 'ie', 'lou', 'mon', 'oi', 'qui', 'tre']
+
+# the default parameters of the generated grammars
+DEFAULTS = {'sources': 10000, 'vocabulary': 5000, 'max_targets': 50, 'targets_zipf': 1.0,
+            'word_zipf': 1.0, 'max_length': 4, 'length_decay': 0.35, 'max_pivots': 8,
+            'identity': 0.3, 'coverage': 0.8, 'seed': 1}
+
+
+def _syllable_word(i, syllables):
+    # the i-th word of at least two syllables
+    word = ''
+    i += len(syllables)
+    while i > 0:
+        i, j = divmod(i, len(syllables))
+        word = syllables[j] + word
+    return word
+
+
+def word(i):
+    """Return the i-th word of the vocabulary, in decreasing order of frequency."""
+    return _syllable_word(i, _SYLLABLES)
+
+
+def foreign_word(i):
+    """Return the i-th word of the pivot vocabulary."""
+    return _syllable_word(i, _FOREIGN_SYLLABLES)
+
+
+class _Zipf:
+    # random draws of 0 ... n - 1 with probabilities proportional to 1 / (i + 1) ** exponent
+    def __init__(self, n, exponent, rng):
+        self._rng = rng
+        self._cumulative = []
+        total = 0.0
+        for i in range(n):
+            total += 1.0 / (i + 1) ** exponent
+            self._cumulative.append(total)
+
+    def draw(self):
+        return min(bisect.bisect(self._cumulative, self._rng.random() * self._cumulative[-1]), len(self._cumulative) - 1)
+
+
+def _length(rng, max_length, decay):
+    # 1 word with probability 1 - decay, 2 words with probability (1 - decay) * decay, ...
+    length = 1
+    while length < max_length and rng.random() < decay:
+        length += 1
+    return length
+
+
+def _phrase(rng, words, max_length, decay, word_fn=word):
+    return ' '.join([word_fn(words.draw()) for _ in range(_length(rng, max_length, decay))])
+
+
+def grammar_lines(sources=DEFAULTS['sources'], vocabulary=DEFAULTS['vocabulary'], max_targets=DEFAULTS['max_targets'],
+                  targets_zipf=DEFAULTS['targets_zipf'], word_zipf=DEFAULTS['word_zipf'], max_length=DEFAULTS['max_length'],
+                  length_decay=DEFAULTS['length_decay'], max_pivots=DEFAULTS['max_pivots'], identity=DEFAULTS['identity'],
+                  seed=DEFAULTS['seed']):
+    """
+    Yield the lines of a synthetic paraphrase grammar with the given number
+    of distinct sources, sorted by source and then by target. Each source has
+    1 to max_targets distinct targets, more for the most frequent words, and
+    each rule 1 to max_pivots pivots.
+    identity is the fraction of the sources that are also one of their own
+    targets, as in pivoted grammars.
+    """
+    rng = random.Random(seed)
+    words = _Zipf(vocabulary, word_zipf, rng)
+    num_targets = _Zipf(max_targets, targets_zipf, rng)
+    phrases = set()
+    attempts = 0
+    while len(phrases) < sources:
+        attempts += 1
+        if attempts > 100 * sources:
+            raise ValueError('cannot generate {} distinct sources from {} words'.format(sources, vocabulary))
+        phrases.add(_phrase(rng, words, max_length, length_decay))
+    ranks = dict([(word(i), i) for i in range(vocabulary)])
+    for source in sorted(phrases):
+        targets = set()
+        if rng.random() < identity:
+            targets.add(source)
+        wanted = num_targets.draw() + 1
+        if source in ranks:
+            # frequent words have more paraphrases
+            wanted = max(wanted, int(max_targets / (1 + ranks[source] / 10.0)))
+        attempts = 0
+        while len(targets) < wanted and attempts < 10 * wanted:
+            attempts += 1
+            targets.add(_phrase(rng, words, max_length, length_decay))
+        # skewed probabilities that sum up to 1 for each source
+        weights = dict([(target, rng.random() ** 3 + 1e-6) for target in sorted(targets)])
+        total = sum(weights.values())
+        for target in sorted(targets):
+            prob = weights[target] / total
+            num_pivots = int(max_pivots * rng.random() ** 2) + 1
+            shares = [rng.random() + 0.01 for _ in range(num_pivots)]
+            pivots = [(prob * share / sum(shares), _phrase(rng, words, 2, length_decay, foreign_word)) for share in shares]
+            yield para_pivot.format_rule(source, target, prob, rng.random() * 0.99 + 0.01, pivots)
+
+
+def write_grammar(path, shards=0, **kwargs):
+    """
+    Write a synthetic grammar (see grammar_lines()) to the given gzipped
+    file, or, if shards is positive, in that many gzipped files in the given
+    directory with the rules shuffled among and within them. Return the number
+    of rules.
+    """
+    if shards > 0:
+        rng = random.Random(kwargs.get('seed', DEFAULTS['seed']))
+        lines = list(grammar_lines(**kwargs))
+        rng.shuffle(lines)
+        if not os.path.exists(path):
+            os.makedirs(path)
+        for i in range(shards):
+            outfile = gzip.GzipFile(os.path.join(path, 'part-{:05d}.gz'.format(i)), 'wb')
+            outfile.writelines(lines[i::shards])
+            outfile.close()
+        return len(lines)
+    num_rules = 0
+    outfile = gzip.GzipFile(path, 'wb')
+    for line in grammar_lines(**kwargs):
+        outfile.write(line)
+        num_rules += 1
+    outfile.close()
+    return num_rules
+
+
+class _Lemma(object):
+    def __init__(self, name, synset):
+        self.name = name
+        self.synset = synset
+        self.pointers = {}
+
+    def __getattr__(self, method):
+        if method in para_lexicon.LEMMA_POINTERS:
+            return lambda: self.pointers.get(method, [])
+        raise AttributeError(method)
+
+
+class _Synset(object):
+    def __init__(self, pos, offset):
+        self.pos = pos
+        self.offset = offset
+        self.lemmas = []
+        self.pointers = {}
+
+    def __getattr__(self, method):
+        if method in para_lexicon.SYNSET_POINTERS:
+            return lambda: self.pointers.get(method, [])
+        raise AttributeError(method)
+
+
+class SyntheticWordNet:
+    """
+    A random WordNet over the words of the synthetic vocabulary, with the
+    parts of NLTK's WordNet corpus reader that para_lexicon.build() uses.
+    """
+
+    def __init__(self, vocabulary=DEFAULTS['vocabulary'], coverage=DEFAULTS['coverage'], seed=DEFAULTS['seed']):
+        rng = random.Random(seed)
+        words = [(i, word(i)) for i in range(vocabulary) if rng.random() < coverage]
+        self._synsets = []
+        synsets_by_pos = dict([(pos, []) for pos in para_lexicon.POS_LIST])
+        for i in range(max(1, int(len(words) / 1.5))):
+            pos = para_lexicon.POS_LIST[bisect.bisect([0.6, 0.8, 0.95], rng.random())]
+            synset = _Synset(pos, len(synsets_by_pos[pos]) * 100 + 1)
+            self._synsets.append(synset)
+            synsets_by_pos[pos].append(synset)
+        # every word is in at least one synset and frequent words have more
+        # senses, as in WordNet
+        for i, name in words:
+            num_senses = rng.randint(1, 2 + int(20 / (1 + i / 20.0)))
+            for synset in rng.sample(self._synsets, min(len(self._synsets), num_senses)):
+                synset.lemmas.append(_Lemma(name, synset))
+        self._synsets = [synset for synset in self._synsets if synset.lemmas]
+        for pos in para_lexicon.POS_LIST:
+            synsets_by_pos[pos] = [synset for synset in synsets_by_pos[pos] if synset.lemmas]
+
+        def link(a, pointer, b, reverse):
+            a.pointers.setdefault(pointer, []).append(b)
+            if reverse is not None:
+                b.pointers.setdefault(reverse, []).append(a)
+
+        # hypernym hierarchies with a few roots
+        for pos in [para_lexicon.NOUN, para_lexicon.VERB]:
+            synsets = synsets_by_pos[pos]
+            for k in range(min(3, len(synsets)), len(synsets)):
+                link(synsets[k], 'hypernyms', rng.choice(synsets[:k]), 'hyponyms')
+        nouns = synsets_by_pos[para_lexicon.NOUN]
+        for _ in range(len(nouns) // 10 if len(nouns) > 1 else 0):
+            a, b = rng.sample(nouns, 2)
+            kind = rng.choice(['member', 'substance', 'part'])
+            link(a, kind + '_holonyms', b, kind + '_meronyms')
+
+        def lemma_links(sources, targets, pointer, reverse, num):
+            for _ in range(num if sources and targets else 0):
+                a = rng.choice(rng.choice(sources).lemmas)
+                b = rng.choice(rng.choice(targets).lemmas)
+                if a is not b:
+                    link(a, pointer, b, reverse)
+
+        adjectives = synsets_by_pos[para_lexicon.ADJ]
+        verbs = synsets_by_pos[para_lexicon.VERB]
+        lemma_links(adjectives, adjectives, 'antonyms', 'antonyms', len(adjectives) // 5)
+        lemma_links(verbs, verbs, 'antonyms', 'antonyms', len(verbs) // 10)
+        lemma_links(nouns, verbs, 'derivationally_related_forms', 'derivationally_related_forms', len(verbs) // 2)
+        lemma_links(synsets_by_pos[para_lexicon.ADV], adjectives, 'pertainyms', None, len(synsets_by_pos[para_lexicon.ADV]) // 2)
+
+        self._lemma_pos_offset_map = {}
+        for synset in self._synsets:
+            for lemma in synset.lemmas:
+                self._lemma_pos_offset_map.setdefault(lemma.name, {}).setdefault(synset.pos, []).append(synset.offset)
+        self._exception_map = dict([(pos, {}) for pos in para_lexicon.POS_LIST])
+
+    def all_synsets(self):
+        return iter(self._synsets)
+
+
+def write_lexicon(path, vocabulary=DEFAULTS['vocabulary'], coverage=DEFAULTS['coverage'], seed=DEFAULTS['seed']):
+    """
+    Build a synthetic WordNet lexicon over the given vocabulary and save it in
+    the given directory for para_wn.use_lexicon(). Return the number of synsets.
+    """
+    return para_lexicon.build(path, SyntheticWordNet(vocabulary, coverage, seed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic paraphrase grammar and WordNet lexicon.')
+    parser.add_argument('grammar', help='the gzipped grammar file to write, or a directory with --shards')
+    parser.add_argument('lexicon', nargs='?', help='the directory to save the WordNet lexicon in')
+    parser.add_argument('--shards', type=int, default=0, help='write the rules shuffled into this many files in the grammar directory')
+    for name, value in sorted(DEFAULTS.items()):
+        parser.add_argument('--' + name.replace('_', '-'), type=type(value), default=value, help='(default: %(default)s)')
+    args = parser.parse_args()
+
+    num_rules = write_grammar(args.grammar, args.shards, sources=args.sources, vocabulary=args.vocabulary,
+                              max_targets=args.max_targets, targets_zipf=args.targets_zipf, word_zipf=args.word_zipf,
+                              max_length=args.max_length, length_decay=args.length_decay, max_pivots=args.max_pivots,
+                              identity=args.identity, seed=args.seed)
+    sys.stderr.write('\n Wrote {} paraphrase rules to {}.\n'.format(num_rules, args.grammar))
+    if args.lexicon:
+        num_synsets = write_lexicon(args.lexicon, args.vocabulary, args.coverage, args.seed)
+        sys.stderr.write(' Wrote a lexicon with {} synsets to {}.\n'.format(num_synsets, args.lexicon))
+    sys.stderr.write('\n')
+
+
+if __name__ == '__main__':
+    main()
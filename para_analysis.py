@@ -3,12 +3,13 @@
 
 import sys
 import math
+import multiprocessing
 import operator
-import random
 
-import nltk
+import para_sampling
+import para_stats
+import para_terms
 import para_wn as wn
-import scipy.stats as stats
 
 #can rename, but must sort in this order
 parts = ['top', 'middle', 'bottom']
@@ -19,6 +20,11 @@ intervals = 20
 pivots = 'pivots'
 distances = 'WN distances'
 per_source = 'per source side'
+# the z value for the 95% confidence intervals reported for samples
+confidence_z = 1.96
+# the percentiles and probabilities at which the score distribution is reported
+report_percentiles = [(n * 10.0) + 5 for n in range(10)]
+report_probabilities = [(p * 10.0/100.0) for p in range(10)]
 
 
 # TODO: hacky, may be replace with Decimal?
@@ -52,32 +58,47 @@ def get_score_distribution(rule_list):
 
 
 def normalized_histogram_for_print(score_distribution, num_bins, denominator, limits):
-    out = []
+    # score_distribution is a list of scores or a para_stats.Distribution
     if denominator > 0:
-        h = stats.histogram(score_distribution, num_bins, limits)
-        out.append('[' + str(h[1]) + ' , ' + str(h[2] * num_bins) + '], step = ' + str(round(h[2], 2)) + ' \n\t')
-        for x in h[0]:
-            out.append(str(round(x * 100.0/denominator, 3)) + '%\t')
-        out.append('\n\t')
-        for x in range(num_bins):
-            out.append('(' + str(round(h[1] + h[2] + x * h[2], 3)) + ')\t')
+        h = para_stats.as_distribution(score_distribution).histogram(num_bins, limits)
+        return histogram_for_print(h[0], h[1], h[2], denominator)
+    return '\n'
+
+
+def histogram_for_print(counts, lower, binsize, denominator):
+    # print the counts in each bin of a histogram as percentages of the denominator
+    num_bins = len(counts)
+    out = ['[' + str(lower) + ' , ' + str(binsize * num_bins) + '], step = ' + str(round(binsize, 2)) + ' \n\t']
+    for x in counts:
+        out.append(str(round(x * 100.0/denominator, 3)) + '%\t')
+    out.append('\n\t')
+    for x in range(num_bins):
+        out.append('(' + str(round(lower + binsize + x * binsize, 3)) + ')\t')
     out.append('\n')
     return ''.join(out)
 
 
 def probabilities_at_percentiles_for_print(distribution):
+    return percentile_probabilities_for_print(para_stats.as_distribution(distribution).scores_at_percentiles(report_percentiles))
+
+
+def percentile_probabilities_for_print(probabilities):
+    # print the probabilities at each of the report_percentiles
     out = ['\n']
-    for n in range(10):
-        x = (n * 10.0) + 5
-        out.append('Percentile ' + str(x) + ' corresponds to prob = ' + str(round(stats.scoreatpercentile(distribution, x), 8)) + '\n')
+    for x, prob in zip(report_percentiles, probabilities):
+        out.append('Percentile ' + str(x) + ' corresponds to prob = ' + str(round(prob, 8)) + '\n')
     return ''.join(out)
 
 
 def percentiles_at_probabilities_for_print(distribution):
+    return probability_percentiles_for_print(para_stats.as_distribution(distribution).percentiles_of_scores(report_probabilities))
+
+
+def probability_percentiles_for_print(percentiles):
+    # print the percentiles at each of the report_probabilities
     out = ['\n']
-    for p in range(10):
-        x = (p * 10.0/100.0)
-        out.append('Probability ' + str(x) + ' corresponds to percentile = ' + str(round(stats.percentileofscore(distribution, x), 8)) + '\n')
+    for x, percentile in zip(report_probabilities, percentiles):
+        out.append('Probability ' + str(x) + ' corresponds to percentile = ' + str(round(percentile, 8)) + '\n')
     return ''.join(out)
 
 
@@ -116,48 +137,28 @@ def get_part_limits(part, percentile_scores):
 
 
 def get_sorted_rule_list(rule_list):
-    res = []
-    score_distribution = get_score_distribution(rule_list)
-    #sort the scores in desc order (we have -log values here)
-    score_distribution.sort()
-    while len(score_distribution) > 0:
-        curr_score = score_distribution.pop()
-        for rule in rule_list:
-            prob = get_prob(rule)
-            if feq(prob, curr_score):
-                res.append(rule)
-    return res
+    # sort by decreasing probability
+    return para_sampling.sort_by_prob(rule_list)
 
 
 def get_rules_sample(rule_list, percentiles, max_sample_len):
     if len(rule_list) <= max_sample_len:
         return rule_list
+    # sort the scores once to get the scores at all the percentiles
     score_distribution = get_score_distribution(rule_list)
-    percentile_scores = []
-    for x in percentiles:
-        percentile_scores.append(stats.scoreatpercentile(score_distribution, x))
+    percentile_scores = para_sampling.scores_at_percentiles(sorted(score_distribution), percentiles)
 
     rules_by_part = {}
     for part in parts:
         rules_by_part[part] = []
-    for rule in rule_list:
-        prob = get_prob(rule)
+    for rule, prob in zip(rule_list, score_distribution):
         part = get_part(prob, percentile_scores)
-        if part in rules_by_part.keys():
+        if part in rules_by_part:
             rules_by_part[part].append(rule)
 
     #number of rules to sample from each of the parts
     part_sample_len = max_sample_len/len(parts)
-    result_set = set([])
-    for part in parts:
-        if len(rules_by_part[part]) <= part_sample_len:
-            result_set = result_set.union(rules_by_part[part])
-        else:
-            result_set = result_set.union(random.sample(rules_by_part[part], part_sample_len))
-    res = []
-    for rule in result_set:
-        if rule not in res:
-            res.append(rule)
+    res = para_sampling.stratified_sample([rules_by_part[part] for part in parts], part_sample_len)
 
     # if we could not get a sample, then just return all the rules
     if not res:
@@ -176,19 +177,39 @@ def get_distance(dist):
 
 
 def get_percentile_scores(percentiles, score_distribution):
-    percentile_scores = []
-    for x in percentiles:
-        percentile_scores.append(stats.scoreatpercentile(score_distribution, x))
-    return percentile_scores
+    return para_stats.as_distribution(score_distribution).scores_at_percentiles(percentiles)
 
 
 def scores_and_percentiles_display(score_distribution, intervals, db_size, limits):
+    # sort the scores once for all the statistics
+    score_distribution = para_stats.as_distribution(score_distribution)
     out = ['\n' + normalized_histogram_for_print(score_distribution, intervals, db_size, (0, 1))]
     out.append(probabilities_at_percentiles_for_print(score_distribution))
     out.append(percentiles_at_probabilities_for_print(score_distribution))
     return ''.join(out)
 
 
+def new_stats_per_source():
+    stats_per_source = {}
+    stats_per_source[whole] = {}
+    stats_per_source[whole]['tgtnum'] = 0
+    for part in parts:
+        stats_per_source[part] = {}
+        stats_per_source[part]['tgtnum'] = 0
+    return stats_per_source
+
+
+def save_stats_per_source(data, stats_per_source):
+    # parts + whole
+    for x in stats_per_source:
+        # relations + tgtnum
+        for y in stats_per_source[x]:
+            if y not in data[per_source][x]:
+                data[per_source][x][y] = []
+            if stats_per_source[x][y] > 0:
+                data[per_source][x][y].append(stats_per_source[x][y])
+
+
 def analyze_rules(all_rules, percentile_scores):
     db_size = len(all_rules)
     data = {}
@@ -215,104 +236,73 @@ def analyze_rules(all_rules, percentile_scores):
 
     data[whole]['sample'] = get_rules_sample(all_rules, [15, 40, 60, 85], random_sample_size)
 
-    cnt = 0
-    ten_percent_len = db_size/10
+    # the relation names are looked up once for each relation ID
+    relation_names = {}
+
+    # the rules are processed in a single pass, printing out the progress after every 10% of the rules
+    ten_percent_len = db_size // 10
     w1 = ""
-    stats_per_source = {}
-    stats_per_source[whole] = {}
-    stats_per_source[whole]['tgtnum'] = 0
-    for part in parts:
-        stats_per_source[part] = {}
-        stats_per_source[part]['tgtnum'] = 0
-    while len(all_rules) > 0:
-        cnt = cnt + 1
-        for percent in range(10):
-            progress = percent * ten_percent_len
-            if progress == cnt:
-                sys.stdout.write(str(percent * 10) + "%... ")
-                sys.stdout.flush()
-                break
-        rule = all_rules.pop(0)
+    stats_per_source = new_stats_per_source()
+    data_whole = data[whole]
+    pivots_whole = data[pivots][whole]
+    distances_whole = data[distances][whole]
+    stats_whole = stats_per_source[whole]
+    for cnt, rule in enumerate(all_rules, 1):
+        if ten_percent_len > 0 and cnt % ten_percent_len == 0 and cnt < 10 * ten_percent_len:
+            sys.stdout.write(str(cnt // ten_percent_len * 10) + "%... ")
+            sys.stdout.flush()
         # the results must be sorted by source (rule[0]), if reached new source, save and reset statistics per source
         if w1 != rule[0]:
             # save the current stats_per_source to data
             if w1 != "":
-                #parts + whole
-                for x in stats_per_source.keys():
-                    #relations + tgtnum
-                    for y in stats_per_source[x].keys():
-                        if y not in data[per_source][x].keys():
-                            data[per_source][x][y] = []
-                        if stats_per_source[x][y] > 0:
-                            data[per_source][x][y].append(stats_per_source[x][y])
+                save_stats_per_source(data, stats_per_source)
             # reset statistics per source
             w1 = rule[0]
-            stats_per_source = {}
-            stats_per_source[whole] = {}
-            stats_per_source[whole]['tgtnum'] = 0
-            for part in parts:
-                stats_per_source[part] = {}
-                stats_per_source[part]['tgtnum'] = 0
-
-        w2 = rule[1]
+            stats_per_source = new_stats_per_source()
+            stats_whole = stats_per_source[whole]
+
         prob = get_prob(rule)
         part = get_part(prob, percentile_scores)
-        rel = wn.get_relation_name(rule[3])
+        if rule[3] not in relation_names:
+            relation_names[rule[3]] = wn.get_relation_name(rule[3])
+        rel = relation_names[rule[3]]
         pivotnum = int(rule[4])
-        dist = get_distance(int(rule[6]))
-        if rel not in data[whole].keys():
-            data[whole][rel] = 0
 
         # count how many times each of the relations was observed in the whole collection
-        data[whole][rel] = data[whole][rel] + 1
-        data[pivots][whole].append(pivotnum)
+        data_whole[rel] = data_whole.get(rel, 0) + 1
+        pivots_whole.append(pivotnum)
 
         # increase the count of targets per current source by 1
-        stats_per_source[whole]['tgtnum'] += 1
-        if rel not in stats_per_source[whole].keys():
-            stats_per_source[whole][rel] = 0
+        stats_whole['tgtnum'] += 1
         #increse by 1 the count of current relation per source
-        stats_per_source[whole][rel] += 1
+        stats_whole[rel] = stats_whole.get(rel, 0) + 1
 
         # for undefined relations, save WN distance
         if rel == undefined:
-            if dist not in data[distances][whole].keys():
-                data[distances][whole][dist] = []
+            dist = get_distance(int(rule[6]))
             # save the rule with that distance
-            data[distances][whole][dist].append(rule)
+            distances_whole.setdefault(dist, []).append(rule)
             #save the distance itself
-            data[distances][whole]['values'].append(int(rule[6]))
+            distances_whole['values'].append(int(rule[6]))
 
-        if part in data.keys():
-            if rel not in data[part].keys():
-                data[part][rel] = []
-            data[part][rel].append(rule)
+        if part in data:
+            data[part].setdefault(rel, []).append(rule)
             data[pivots][part].append(pivotnum)
             if rel == undefined:
                 #for undefined relations, save WN distance
-                if dist not in data[distances][part].keys():
-                    data[distances][part][dist] = []
-                data[distances][part][dist].append(rule)
+                data[distances][part].setdefault(dist, []).append(rule)
                 data[distances][part]['values'].append(int(rule[6]))
 
             # increase the count of targets per current source by 1
-            stats_per_source[part]['tgtnum'] += 1
-            if rel not in stats_per_source[part].keys():
-                stats_per_source[part][rel] = 0
+            stats_part = stats_per_source[part]
+            stats_part['tgtnum'] += 1
             #increse by 1 the count of current relation per source
-            stats_per_source[part][rel] += 1
+            stats_part[rel] = stats_part.get(rel, 0) + 1
 
     print
 
     # save the last stats_per_source to data
-    for x in stats_per_source.keys():
-        # parts + whole
-        for y in stats_per_source[x].keys():
-            # relations + tgtnum
-            if y not in data[per_source][x].keys():
-                data[per_source][x][y] = []
-            if stats_per_source[x][y] > 0:
-                data[per_source][x][y].append(stats_per_source[x][y])
+    save_stats_per_source(data, stats_per_source)
 
     return data
 
@@ -322,15 +312,12 @@ def get_distances_for_print(part, data):
         return ""
     out = ['\n   Analysis of WordNet distances for rules corresponding to ' + undefined.upper() + ':\n']
     out.append('      Average distance: ' + str(float(sum(data[distances][part]['values']))/len(data[distances][part]['values'])) + '\n')
-    for dist in data[distances][part].keys():
+    for dist in sorted(data[distances][part].keys()):
         if dist == 'values':
             continue
         out.append('      Examples when distance is ' + dist + ' (out of ' + str(len(data[distances][part][dist])) + ' rules):\n')
-        if len(data[distances][part][dist]) < 4:
-            examples = data[distances][part][dist]
-        else:
-            #sample 3 rules from the current distance
-            examples = random.sample(data[distances][part][dist], 3)
+        #sample 3 rules from the current distance
+        examples = para_sampling.sample(data[distances][part][dist], 3)
         for rule_str in rules_to_strings(get_sorted_rule_list(examples)):
             out.append('\t\t')
             out.append(rule_str + '\n')
@@ -338,7 +325,96 @@ def get_distances_for_print(part, data):
     return ''.join(out)
 
 
-def part_analysis_display(part, data, percentile_scores, percentiles):
+def relation_analysis_display(rules, rel, wn_part_size, limits, percentiles):
+    relSize = len(rules)
+    out = ['      ' + rel.upper() + ': ' + str(relSize) + ' rule(s) (' + str(round(relSize * 100.0/wn_part_size, 2)) + '%):\n']
+    out.append('      Score distribution: ')
+    distribution = get_score_distribution(rules)
+    out.append(normalized_histogram_for_print(distribution, 10, relSize, limits))
+    out.append('      Examples:\n')
+    #sample up to 12 rules from the current relation using the values in percentiles to divide the rules into parts
+    for rule_str in rules_to_strings(get_rules_sample(rules, percentiles, 12)):
+        out.append('\t')
+        out.append(rule_str + '\n')
+    out.append('\n')
+    return ''.join(out)
+
+
+def relation_order(rel):
+    # the relations are reported in the order of their IDs, so that the
+    # reports do not depend on the order of the keys of the dictionaries
+    try:
+        return (wn.get_relation_id(rel), rel)
+    except KeyError:
+        return (sys.maxint, rel)
+
+
+def get_wn_part_size(part, data):
+    part_size = 0
+    for rel in data[part].keys():
+        part_size += len(data[part][rel])
+    if not_in_wn in data[part]:
+        return part_size - len(data[part][not_in_wn])
+    return part_size
+
+
+# the data for the relation reports generated by the worker processes,
+# which inherit it from the parent process instead of receiving a copy
+_report_data = None
+
+
+def _relation_report(args):
+    (part, rel), seed = args
+    data, percentile_scores, percentiles = _report_data
+    # every report is sampled with its own seed so that the samples do
+    # not depend on which process generates which report
+    para_sampling.set_seed(seed)
+    limits = get_part_limits(part, percentile_scores)
+    return relation_analysis_display(data[part][rel], rel, get_wn_part_size(part, data), limits, percentiles)
+
+
+# the number of rules in the relation reports above which they are generated in parallel
+MIN_PARALLEL_RULES = 1000
+
+
+def parts_analysis_display(data, percentile_scores, percentiles, processes=None):
+    """
+    Generate the part_analysis_display() reports for all the parts. If the
+    reports for the relations of all the parts cover more than
+    MIN_PARALLEL_RULES rules, they are generated in parallel by a pool of the
+    given number of processes (all the cores by default). The reports are
+    returned in the same order as the parts and are the same no matter how
+    many processes are used.
+    """
+    global _report_data
+    tasks = []
+    for part in parts:
+        if get_wn_part_size(part, data) > 0:
+            tasks.extend([(part, rel) for rel in sorted(data[part].keys(), key=relation_order) if rel != not_in_wn])
+    # one more seed for the samples drawn by this process after the relation reports
+    seeds = [int(para_sampling.random_key() * sys.maxint) for task in tasks + [None]]
+
+    _report_data = (data, percentile_scores, percentiles)
+    try:
+        num_rules = sum([len(data[part][rel]) for (part, rel) in tasks])
+        if processes == 1 or len(tasks) < 2 or num_rules <= MIN_PARALLEL_RULES:
+            relation_reports = map(_relation_report, zip(tasks, seeds))
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                relation_reports = pool.map(_relation_report, zip(tasks, seeds))
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        _report_data = None
+    para_sampling.set_seed(seeds[-1])
+
+    relation_displays = dict(zip(tasks, relation_reports))
+    return [part_analysis_display(part, data, percentile_scores, percentiles, relation_displays) for part in parts]
+
+
+def part_analysis_display(part, data, percentile_scores, percentiles, relation_displays=None):
     out = ['\n***********************************************************************\n Analyzing the ' + part + ' part of the resource.\n']
     limits = get_part_limits(part, percentile_scores)
     out.append('   Scores between: ' + str(limits) + '\n')
@@ -363,33 +439,54 @@ def part_analysis_display(part, data, percentile_scores, percentiles):
         out.append("  WordNet-based analysis is impossible, none of the rules was found in WordNet.\n")
         return ''.join(out)
     out.append('  Results of WordNet analysis based on ' + str(wn_part_size) + ' rules (' + str(round(wn_part_size * 1.0/part_size, 2)) + '% of the ' + part + ' part):\n')
-    for rel in data[part].keys():
+    for rel in sorted(data[part].keys(), key=relation_order):
         if rel == not_in_wn:
             continue
-        relSize = len(data[part][rel])
-        out.append('      ' + rel.upper() + ': ' + str(relSize) + ' rule(s) (' + str(round(relSize * 100.0/wn_part_size, 2)) + '%):\n')
-        out.append('      Score distribution: ')
-        distribution = get_score_distribution(data[part][rel])
-        out.append(normalized_histogram_for_print(distribution, 10, relSize, limits))
-        out.append('      Examples:\n')
-        #sample up to 12 rules from the current relation using the values in percentiles to divide the rules into parts
-        for rule_str in rules_to_strings(get_rules_sample(data[part][rel], percentiles, 12)):
-            out.append('\t')
-            out.append(rule_str + '\n')
-        out.append('\n')
+        # the reports for the relations may have been generated in parallel
+        if relation_displays is not None:
+            out.append(relation_displays[(part, rel)])
+        else:
+            out.append(relation_analysis_display(data[part][rel], rel, wn_part_size, limits, percentiles))
     out.append(get_distances_for_print(part, data))
 
     source_num = len(data[per_source][part]['tgtnum'])
     out += source_target_numbers_display_local(data[per_source][part]['tgtnum'])
     # Add the avg number of each WN relation per source side
-    for rel in data[per_source][part].keys():
+    for rel in sorted(data[per_source][part].keys(), key=relation_order):
         if rel == 'tgtnum':
             continue
         out.append(source_relation_numbers_display_local(data[per_source][part][rel], rel, source_num))
     return ''.join(out)
 
 
-def whole_analysis_display(db_size, data):
+def proportion_interval(count, total):
+    # the Wilson score interval for a proportion, in percent
+    p = count * 1.0 / total
+    z2 = confidence_z * confidence_z
+    denominator = 1 + z2 / total
+    center = (p + z2 / (2 * total)) / denominator
+    half_width = confidence_z * math.sqrt(p * (1 - p) / total + z2 / (4.0 * total * total)) / denominator
+    return (max(center - half_width, 0) * 100, min(center + half_width, 1) * 100)
+
+
+def mean_interval(values):
+    # the normal approximation interval for a mean
+    n = len(values)
+    mean = float(sum(values)) / n
+    if n < 2:
+        return (mean, mean)
+    variance = sum([(x - mean) * (x - mean) for x in values]) / (n - 1)
+    half_width = confidence_z * math.sqrt(variance / n)
+    return (mean - half_width, mean + half_width)
+
+
+def interval_for_print(interval, unit=''):
+    return ' [95% CI: ' + str(round(interval[0], 2)) + unit + ' - ' + str(round(interval[1], 2)) + unit + ']'
+
+
+def whole_analysis_display(db_size, data, confidence_intervals=False):
+    # if the rules are a random sample, confidence_intervals can be set to
+    # show the 95% confidence intervals for the averages and percentages
     out = ['\nRandom rule sample: \n']
     out.append('-' * 20 + '\n')
     rules = data[whole]['sample']
@@ -402,28 +499,32 @@ def whole_analysis_display(db_size, data):
     if len(data[pivots][whole]) == 0:
         out.append('  Info on number of pivots is not available.\n')
     else:
-        out.append('  Average number of pivots: ' + str(float(sum(data[pivots][whole]))/len(data[pivots][whole])) + '\n\n')
+        ci = interval_for_print(mean_interval(data[pivots][whole])) if confidence_intervals else ''
+        out.append('  Average number of pivots: ' + str(float(sum(data[pivots][whole]))/len(data[pivots][whole])) + ci + '\n\n')
 
     if not_in_wn not in data[whole].keys():
         wn_part_size = db_size
     else:
         wn_part_size = db_size - data[whole][not_in_wn]
 
-    out.append('  Results of WordNet analysis based on ' + str(wn_part_size) + ' rule(s) (' + str(round(wn_part_size * 100.0/db_size, 2)) + '% of the ' + str(db_size) + ' rule(s)):\n')
-    for rel in data[whole].keys():
+    ci = interval_for_print(proportion_interval(wn_part_size, db_size), '%') if confidence_intervals else ''
+    out.append('  Results of WordNet analysis based on ' + str(wn_part_size) + ' rule(s) (' + str(round(wn_part_size * 100.0/db_size, 2)) + '% of the ' + str(db_size) + ' rule(s))' + ci + ':\n')
+    for rel in sorted(data[whole].keys(), key=relation_order):
         if rel == not_in_wn or rel == 'sample':
             continue
         relSize = data[whole][rel]
-        out.append('      ' + rel.upper() + ': ' + str(relSize) + ' rule(s) (' + str(round(relSize * 100.0/wn_part_size, 2)) + '%):\n')
+        ci = interval_for_print(proportion_interval(relSize, wn_part_size), '%') if confidence_intervals else ''
+        out.append('      ' + rel.upper() + ': ' + str(relSize) + ' rule(s) (' + str(round(relSize * 100.0/wn_part_size, 2)) + '%)' + ci + ':\n')
 
     if len(data[distances][whole]['values']) > 0:
-        out.append('\n  Average WordNet distance for rules corresponding to ' + undefined.upper() + ': ' + str(float(sum(data[distances][whole]['values']))/len(data[distances][whole]['values'])) + '\n')
+        ci = interval_for_print(mean_interval(data[distances][whole]['values'])) if confidence_intervals else ''
+        out.append('\n  Average WordNet distance for rules corresponding to ' + undefined.upper() + ': ' + str(float(sum(data[distances][whole]['values']))/len(data[distances][whole]['values'])) + ci + '\n')
 
     source_num = len(data[per_source][whole]['tgtnum'])
     out.append(source_target_numbers_display_local(data[per_source][whole]['tgtnum']))
 
     # Add the avg number of each WN relation per source side
-    for rel in data[per_source][whole].keys():
+    for rel in sorted(data[per_source][whole].keys(), key=relation_order):
         if rel == 'tgtnum':
             continue
         out.append(source_relation_numbers_display_local(data[per_source][whole][rel], rel, source_num))
@@ -453,14 +554,23 @@ def source_target_numbers_display_local(counts):
     source_num = len(counts)
     if source_num == 0:
         return "  The number of unique source sides is 0."
-    out = ["\n  The number of unique source sides is: " + str(source_num)+'\n']
-    avg = float(sum(counts)) / source_num
-    out.append("\n  The average number of target sides per source is: " + str(avg) + '\n')
-
     max_n = max(counts)
     min_n = min(counts)
+    histogram = ''
     if max_n - min_n > 100:
-        out.append("   The distribution of target sides per source is as follows:\n" + normalized_histogram_for_print(counts, intervals, source_num, (min_n, max_n)))
+        histogram = normalized_histogram_for_print(counts, intervals, source_num, (min_n, max_n))
+    return source_target_stats_display(source_num, sum(counts), histogram)
+
+
+def source_target_stats_display(source_num, tgtnum_sum, histogram):
+    # histogram is the printed distribution of target sides per source, if any
+    if source_num == 0:
+        return "  The number of unique source sides is 0."
+    out = ["\n  The number of unique source sides is: " + str(source_num)+'\n']
+    avg = float(tgtnum_sum) / source_num
+    out.append("\n  The average number of target sides per source is: " + str(avg) + '\n')
+    if histogram:
+        out.append("   The distribution of target sides per source is as follows:\n" + histogram)
     return ''.join(out)
 
 
@@ -494,40 +604,8 @@ def source_relation_numbers_display_local(counts, relation, total_source_num):
 
 
 def extract_frequent_terms(filename, num):
-    f = open(filename, 'r')
-    tokenized_text = nltk.word_tokenize(f.read())
-    f.close()
-
-    text = []
-    for term in tokenized_text:
-        # assume the db is lowercased
-        text.append(term.lower())
-
-    res = []
-    unigrams = nltk.FreqDist(text)
-    # use the first num/3 most frequent unigrams
-    for unigram, freq in unigrams.items()[:int(num/3)]:
-        res.append(unigram)
-    # res.append(unigrams.keys()[int(len(unigrams) * 0.01):int(len(unigrams) * 0.01) + int(num/3)])
-
-    bigram_measures = nltk.collocations.BigramAssocMeasures()
-    trigram_measures = nltk.collocations.TrigramAssocMeasures()
-
-    # change this to read in your data
-    finder = nltk.collocations.BigramCollocationFinder.from_words(text)
-
-    # only bigrams that appear 3+ times
-    finder.apply_freq_filter(3)
-
-    # return the 10 n-grams with the highest PMI
-    for bigram in finder.nbest(bigram_measures.pmi, int(num/3)):
-        res.append(" ".join(bigram))
-
-    finder = nltk.collocations.TrigramCollocationFinder.from_words(text)
-    finder.apply_freq_filter(3)
-    for trigram in finder.nbest(trigram_measures.pmi, int(num/3)):
-        res.append(" ".join(trigram))
-    return res
+    # the text is read and tokenized in chunks so that it never has to fit in memory
+    return para_terms.extract_frequent_terms(filename, num)
 
 
 def extract_terms(filename):
@@ -0,0 +1,160 @@
+# This module computes the WordNet columns of the paraphrase rules, i.e., the
+# relation, distance, samepos and tgtdupl columns, and the lemmas of the
+# sources and targets of the rules, and fills in the WordNet columns for
+# databases indexed with "index <file> lazy". Such databases are indexed
+# with the WordNet columns left NULL, so that they can be queried right away.
+# Only the lemmas, which are much cheaper to look up than the relations,
+# are added when indexing so that lemma conditions do not need the rules to
+# be annotated. The columns are then filled in on demand for the rules
+# that a query touches, and in the background by an Annotator thread, and
+# written back to the database. Rules are always annotated together with all
+# the other rules of their source since whether a target is a duplicate of
+# another one depends on all the targets of the source. Since annotating
+# rules changes the results of analyses, all the cached analyses are cleared
+# whenever any rules are annotated.
+
+import threading
+
+import para_cache
+import para_db
+import para_wn
+
+WORDNET_COLUMNS = ['relation', 'distance', 'samepos', 'tgtdupl']
+
+# NLTK's WordNet corpus reader cannot be used by several threads at the same
+# time, so all the WordNet lookups are done while holding this lock
+wordnet_lock = threading.Lock()
+
+
+def annotate_rules(source, targets, lemmas=None):
+    """
+    Return the (relation, distance, samepos, tgtdupl) of the rules with the
+    given source and targets, which must be all the rules of the source in
+    the order in which they were indexed. If lemmas is a dict, the lemmas of
+    the source and of each target are added to it.
+    """
+    res = []
+    # the target_lemmas set is used to detect duplicate targets (with the same lemma)
+    target_lemmas = set([])
+    with wordnet_lock:
+        if lemmas is not None:
+            lemmas[source] = para_wn.get_lemmas(source)
+        for tgt, (relation, distance, samepos) in zip(targets, para_wn.get_wordnet_relations(source, targets)):
+            duplicate_target_lemma = 1
+            tgt_lemmas = para_wn.get_lemmas(tgt)
+            if lemmas is not None:
+                lemmas[tgt] = tgt_lemmas
+            for tgt_lemma in tgt_lemmas:
+                #consider the tgt as non-duplicate if at least one of its lemmas was not seen with the current source side before
+                if tgt_lemma not in target_lemmas:
+                    duplicate_target_lemma = 0
+                target_lemmas.add(tgt_lemma)
+            res.append((relation, distance, samepos, duplicate_target_lemma))
+    return res
+
+
+def add_lemmas(phrases, lemmas):
+    # add the lemmas of the given phrases that are not in the lemmas dict yet
+    with wordnet_lock:
+        for phrase in phrases:
+            if phrase not in lemmas:
+                lemmas[phrase] = para_wn.get_lemmas(phrase)
+
+
+def num_unannotated(conn):
+    num_rules, = conn.execute('select count(*) from paraphrase where relation is null').fetchone()
+    return num_rules
+
+
+def is_annotated(conn):
+    return conn.execute('select rowid from paraphrase where relation is null limit 1').fetchone() is None
+
+
+def unannotated_sources(conn, conditional_part='', limit=None):
+    # the sources of the rules selected by the where clause that are not annotated yet
+    condition = 'where ({}) and relation is null'.format(conditional_part[len('where '):]) if conditional_part else 'where relation is null'
+    limit_part = ' limit {}'.format(limit) if limit else ''
+    return [source for (source,) in conn.execute('select distinct source from paraphrase {}{}'.format(condition, limit_part))]
+
+
+def annotate_sources(conn, sources):
+    """
+    Fill in the WordNet columns of all the rules of the given sources and
+    commit them along with the updated per-source statistics. Returns the
+    number of rules that were annotated.
+    """
+    updates = []
+    annotated_sources = []
+    for source in sources:
+        rules = conn.execute('select rowid, target, relation from paraphrase where source = ? order by rowid', (source,)).fetchall()
+        # the rules of the source may have been annotated by another thread
+        if all([relation is not None for (rowid, target, relation) in rules]):
+            continue
+        annotations = annotate_rules(source, [target for (rowid, target, relation) in rules])
+        updates.extend([annotation + (rowid,) for ((rowid, target, relation), annotation) in zip(rules, annotations)])
+        annotated_sources.append(source)
+    if not updates:
+        return 0
+    conn.executemany('update paraphrase set {} where rowid = ?'.format(', '.join(['{} = ?'.format(column) for column in WORDNET_COLUMNS])), updates)
+    para_db.update_source_stats(conn, annotated_sources)
+    conn.commit()
+    para_cache.clear(conn)
+    return len(updates)
+
+
+def annotate_matching(conn, conditional_part=''):
+    # annotate all the rules of the sources of the rules selected by the where clause
+    return annotate_sources(conn, unannotated_sources(conn, conditional_part))
+
+
+def annotate_rowids(conn, rowids):
+    # annotate all the rules of the sources of the rules with the given rowids
+    if not rowids:
+        return 0
+    sql = 'select distinct source from paraphrase where rowid in ({}) and relation is null'.format(', '.join(map(str, rowids)))
+    return annotate_sources(conn, [source for (source,) in conn.execute(sql)])
+
+
+def annotate_rows(conn, rows):
+    # annotate all the rules of the sources of the given query results that
+    # are not annotated, i.e., (source, target, pe2e1, relation, ...) rows
+    return annotate_sources(conn, sorted(set([row[0] for row in rows if row[3] is None])))
+
+
+class Annotator(threading.Thread):
+    """
+    A background thread that fills in the WordNet columns of all the rules of
+    the given database, batch_size sources at a time, with its own connection.
+    The database should be in WAL mode so that it can be queried while the
+    rules are being annotated.
+    """
+
+    def __init__(self, dbfile, batch_size=50):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.dbfile = dbfile
+        self.batch_size = batch_size
+        self.num_sources = 0
+        self.num_rules = 0
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    def run(self):
+        conn = para_db.connect(self.dbfile)
+        try:
+            while not self.stopped():
+                sources = unannotated_sources(conn, limit=self.batch_size)
+                if not sources:
+                    break
+                self.num_rules += annotate_sources(conn, sources)
+                self.num_sources += len(sources)
+        except Exception as e:
+            self.error = e
+        finally:
+            conn.close()
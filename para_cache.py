@@ -0,0 +1,134 @@
+# This module caches the results of "analyze" commands inside the paraphrase
+# database itself, in a table called analysis_cache, so that repeating an
+# analysis on the same database does not have to compute it again. Each cached
+# analysis is stored as JSON under a key that is a hash of the command,
+# the settings that affect its results and the identity of the database,
+# i.e., the number of rules and the schema of the paraphrase table. Since
+# paraphrase databases are not changed after indexing, anything that does
+# change the rules must call clear().
+#
+# Analyses are stored as data only, and never as pickles, since paraphrase
+# databases are shared and loading a crafted pickle would run arbitrary code.
+# JSON has neither tuples nor byte strings and only has string keys, so
+# dicts, tuples and byte strings are stored as {"dict": [[key, value], ...]},
+# {"tuple": [...]} and {"str": ...}, and NumPy floats, which are written out
+# with more digits than other floats, as {"float64": ...}. Analyses stored in
+# another format, e.g., by an older version, are ignored.
+
+import hashlib
+import json
+from datetime import datetime
+
+import numpy as np
+
+CACHE_TABLE = 'analysis_cache'
+
+# the version of the format in which the analyses are stored
+FORMAT_VERSION = 2
+
+
+def database_identity(conn):
+    num_records, = conn.execute('select max(rowid) from paraphrase').fetchone()
+    schema, = conn.execute("select sql from sqlite_master where type = 'table' and name = 'paraphrase'").fetchone()
+    return (num_records, schema)
+
+
+def analysis_key(command, settings, identity):
+    return hashlib.sha1(repr((command, sorted(settings.items()), identity))).hexdigest()
+
+
+def _has_cache_table(conn):
+    return conn.execute("select count(*) from sqlite_master where type = 'table' and name = ?", (CACHE_TABLE,)).fetchone()[0] > 0
+
+
+def _encode(value):
+    if isinstance(value, dict):
+        return {'dict': [[_encode(key), _encode(val)] for (key, val) in value.items()]}
+    elif isinstance(value, tuple):
+        return {'tuple': [_encode(val) for val in value]}
+    elif isinstance(value, list):
+        return [_encode(val) for val in value]
+    elif isinstance(value, str):
+        return {'str': value.decode('latin-1')}
+    elif isinstance(value, bool) or value is None or isinstance(value, unicode):
+        return value
+    elif isinstance(value, (int, long)):
+        return int(value)
+    elif isinstance(value, np.floating):
+        return {'float64': float(value)}
+    elif isinstance(value, float):
+        return value
+    raise TypeError('cannot cache values of type {}'.format(type(value).__name__))
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(val) for val in value]
+    elif isinstance(value, dict):
+        if value.keys() == ['dict']:
+            return dict([(_decode(key), _decode(val)) for (key, val) in value['dict']])
+        elif value.keys() == ['tuple']:
+            return tuple([_decode(val) for val in value['tuple']])
+        elif value.keys() == ['str']:
+            return value['str'].encode('latin-1')
+        elif value.keys() == ['float64']:
+            return np.float64(value['float64'])
+        raise ValueError('unknown value in cached analysis')
+    return value
+
+
+def _dumps(analysis):
+    return json.dumps({'version': FORMAT_VERSION, 'analysis': _encode(analysis)}, separators=(',', ':'))
+
+
+def _loads(data):
+    """
+    Return the analysis stored in the given data by _dumps(), or None if it
+    was stored in another format.
+    """
+    try:
+        stored = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(stored, dict) or stored.get('version') != FORMAT_VERSION:
+        return None
+    return _decode(stored['analysis'])
+
+
+def load(conn, key):
+    """
+    Return the cached analysis for the given key with the time it was
+    computed under 'created', or None if there is no such analysis.
+    """
+    if not _has_cache_table(conn):
+        return None
+    row = conn.execute('select created, data from {} where key = ?'.format(CACHE_TABLE), (key,)).fetchone()
+    if row is None:
+        return None
+    try:
+        analysis = _loads(str(row[1]))
+    except Exception:
+        # the data is malformed
+        analysis = None
+    if analysis is None:
+        # e.g., an analysis cached by an incompatible version
+        return None
+    analysis['created'] = row[0]
+    return analysis
+
+
+def save(conn, key, command, analysis):
+    """
+    Cache the given analysis under the given key, replacing any analysis
+    that is already cached under it.
+    """
+    data = _dumps(analysis)
+    conn.execute('create table if not exists {} (key text primary key, created text, command text, data blob)'.format(CACHE_TABLE))
+    conn.execute('insert or replace into {} values (?, ?, ?, ?)'.format(CACHE_TABLE), (key, str(datetime.now()), command, data))
+    conn.commit()
+
+
+def clear(conn):
+    if _has_cache_table(conn):
+        conn.execute('delete from {}'.format(CACHE_TABLE))
+        conn.commit()
@@ -0,0 +1,171 @@
+# This module compares two paraphrase databases for the "compare" command.
+# The rules of both databases are read in (source, target) order and merged
+# like in a merge join, so only one batch of rules of each database is in
+# memory at any time no matter how large the databases are. The comparison
+# is collected into a dictionary:
+#
+#   comparison = {'sizes': (number of pairs in the first, in the second),
+#                 'shared': number of pairs in both,
+#                 'sources': (number of sources in the first, in the second),
+#                 'shared_sources': number of sources in both,
+#                 'correlation': Pearson correlation of the probabilities of the shared pairs,
+#                 'relations': ({relation name: count in the first}, {... in the second}),
+#                 'examples': (random rules only in the first, ... only in the second)}
+#
+# Rules are compared by the UTF-8 bytes of their source and target, which is
+# the order in which SQLite sorts text. If a database contains the same pair
+# more than once, only its most probable rule is used.
+
+import math
+
+import para_analysis
+import para_sketch
+import para_wn
+
+# the number of example rules shown for the pairs in only one database
+EXAMPLES_LEN = 5
+
+
+def _pairs(conn, batch_size):
+    # yield the distinct (source, target) pairs of a database in sorted order
+    # with their pe2e1 and relation
+    conn.text_factory = str
+    cursor = conn.cursor()
+    try:
+        cursor.execute('select source, target, pe2e1, relation from paraphrase order by source, target, pe2e1')
+        last_key = None
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if row[:2] != last_key:
+                    last_key = row[:2]
+                    yield row
+    finally:
+        cursor.close()
+
+
+class _Correlation:
+    # the Pearson correlation of a stream of pairs of values, computed with
+    # running means and co-moments to avoid cancellation errors
+
+    def __init__(self):
+        self.count = 0
+        self._mean_x = 0.0
+        self._mean_y = 0.0
+        self._var_x = 0.0
+        self._var_y = 0.0
+        self._cov = 0.0
+
+    def add(self, x, y):
+        self.count += 1
+        dx = x - self._mean_x
+        dy = y - self._mean_y
+        self._mean_x += dx / self.count
+        self._mean_y += dy / self.count
+        self._var_x += dx * (x - self._mean_x)
+        self._var_y += dy * (y - self._mean_y)
+        self._cov += dx * (y - self._mean_y)
+
+    def value(self):
+        # None if the correlation is undefined, e.g., for constant values
+        if self.count < 2 or self._var_x <= 0 or self._var_y <= 0:
+            return None
+        return self._cov / math.sqrt(self._var_x * self._var_y)
+
+
+def _relation_name(relation):
+    if relation is None:
+        raise ValueError('some rules do not have WordNet relations yet')
+    return para_wn.get_relation_name(relation)
+
+
+def compare(conn, other_conn, batch_size=10000):
+    """
+    Compare the rules of the databases of the two given connections, which
+    must not be used for anything else during the comparison. All the rules
+    of both databases must have their WordNet relations, i.e., lazily indexed
+    databases must be annotated first, otherwise a ValueError is raised.
+    """
+    sizes = [0, 0]
+    sources = [0, 0]
+    last_sources = [None, None]
+    relations = ({}, {})
+    examples = (para_sketch.Reservoir(EXAMPLES_LEN), para_sketch.Reservoir(EXAMPLES_LEN))
+    correlation = _Correlation()
+    counts = {'shared': 0, 'shared_sources': 0}
+
+    def add(idx, row):
+        sizes[idx] += 1
+        if row[0] != last_sources[idx]:
+            last_sources[idx] = row[0]
+            sources[idx] += 1
+            # all the pairs with the same source are merged before the next
+            # source, so the other database has the source if it just had it
+            if last_sources[1 - idx] == row[0]:
+                counts['shared_sources'] += 1
+        name = _relation_name(row[3])
+        relations[idx][name] = relations[idx].get(name, 0) + 1
+
+    streams = [_pairs(conn, batch_size), _pairs(other_conn, batch_size)]
+    rows = [next(stream, None) for stream in streams]
+    while rows[0] is not None or rows[1] is not None:
+        if rows[1] is None or (rows[0] is not None and rows[0][:2] < rows[1][:2]):
+            idx = 0
+        elif rows[0] is None or rows[1][:2] < rows[0][:2]:
+            idx = 1
+        else:
+            # the pair is in both databases
+            add(0, rows[0])
+            add(1, rows[1])
+            counts['shared'] += 1
+            correlation.add(math.exp(-rows[0][2]), math.exp(-rows[1][2]))
+            rows = [next(stream, None) for stream in streams]
+            continue
+        add(idx, rows[idx])
+        examples[idx].add(rows[idx])
+        rows[idx] = next(streams[idx], None)
+
+    return {'sizes': tuple(sizes), 'shared': counts['shared'], 'sources': tuple(sources),
+            'shared_sources': counts['shared_sources'], 'correlation': correlation.value(),
+            'relations': relations, 'examples': tuple([sorted(reservoir.items) for reservoir in examples])}
+
+
+def _percentage(count, total):
+    return round(count * 100.0 / total, 2) if total > 0 else 0.0
+
+
+def comparison_display(names, comparison):
+    # names are the names of the two databases, e.g., their paths
+    sizes = comparison['sizes']
+    shared = comparison['shared']
+    out = ['\n Comparing {} (1) and {} (2).\n'.format(*names)]
+    out.append('\n  Paraphrase pairs: {} in (1), {} in (2).\n'.format(*sizes))
+    out.append('  Pairs in both databases: {} ({}% of (1), {}% of (2)).\n'.format(shared, _percentage(shared, sizes[0]), _percentage(shared, sizes[1])))
+    for idx in range(2):
+        exclusive = sizes[idx] - shared
+        out.append('  Pairs only in ({}): {} ({}%).\n'.format(idx + 1, exclusive, _percentage(exclusive, sizes[idx])))
+    sources = comparison['sources']
+    shared_sources = comparison['shared_sources']
+    out.append('\n  Source sides: {} in (1), {} in (2), {} in both ({}% of (1), {}% of (2)).\n'.format(
+        sources[0], sources[1], shared_sources, _percentage(shared_sources, sources[0]), _percentage(shared_sources, sources[1])))
+    if comparison['correlation'] is None:
+        out.append('\n  The correlation of the probabilities of the shared pairs is undefined.\n')
+    else:
+        out.append('\n  Pearson correlation of the probabilities of the shared pairs: {}\n'.format(round(comparison['correlation'], 4)))
+
+    out.append('\n  Relation distribution (% of pairs in (1), % of pairs in (2), difference):\n')
+    relations = comparison['relations']
+    for name in sorted(set(relations[0].keys()) | set(relations[1].keys()), key=para_wn.get_relation_id):
+        percentages = [_percentage(relations[idx].get(name, 0), sizes[idx]) for idx in range(2)]
+        out.append('    {}: {}%\t{}%\t{:+.2f}\n'.format(name.upper(), percentages[0], percentages[1], percentages[1] - percentages[0]))
+
+    for idx in range(2):
+        if comparison['examples'][idx]:
+            out.append('\n  Examples of pairs only in ({}):\n'.format(idx + 1))
+            # the rules are printed as UTF-8 bytes like the output of "show"
+            for rule_str in para_analysis.rules_to_strings(comparison['examples'][idx]):
+                out.append('\t' + rule_str + '\n')
+    out.append('\n')
+    return ''.join(out)
@@ -0,0 +1,283 @@
+# This module contains a programmatic API for paraphrase databases generated
+# by ParaQuery. Unlike the query shell, it does not keep any global settings:
+# every query is compiled with explicitly given options and the results are
+# returned lazily as typed rows, e.g.:
+#
+#    db = para_db.ParaDatabase('/path/to/fr-en')
+#    for rule in db.query('source = "man" and prob > 0.01', limit=100):
+#        print rule.source, rule.target, rule.prob
+#
+# A ParaDatabase object can be shared between threads; each thread gets its
+# own SQLite connection the first time it runs a query.
+
+import math
+import os
+import sqlite3
+import threading
+import urllib
+from collections import namedtuple
+
+import para_wn
+import query_compiler
+import query_parser
+
+
+class ParaRule(namedtuple('ParaRule', 'source target pe2e1 relation pivotnum pivots distance')):
+    __slots__ = ()
+
+    # pe2e1 is stored as a negative log probability
+    @property
+    def prob(self):
+        return math.exp(-float(self.pe2e1))
+
+    @property
+    def relation_name(self):
+        return para_wn.get_relation_name(self.relation)
+
+
+# the row type returned by count queries
+CountRow = namedtuple('CountRow', 'group count')
+
+
+# a compiled query is just the SQL along with the mode ('basic' or 'count')
+# that determines the type of the returned rows
+CompiledQuery = namedtuple('CompiledQuery', 'sql mode')
+
+
+def find_dbfile(dbpath):
+    # accept either the directory containing the .paradb file or the file itself
+    return dbpath if os.path.isfile(dbpath) else os.path.join(dbpath, '.paradb')
+
+
+# the valid values for the temp_store pragma
+TEMP_STORE_VALUES = ['default', 'file', 'memory']
+
+# by default, read-only databases are memory-mapped in their entirety (up to
+# the maximum mmap size that SQLite is compiled with, which is 2GB by default)
+READONLY_MMAP_SIZE = 0x7fff0000
+
+
+def uri_filenames_enabled():
+    """
+    Whether SQLite interprets filenames starting with "file:" as URIs without
+    being asked to by the sqlite3 module, i.e., whether it was compiled with
+    SQLITE_USE_URI. Otherwise, such a filename is the name of a new file.
+    """
+    conn = sqlite3.connect(':memory:')
+    try:
+        options = [option for (option,) in conn.execute('pragma compile_options')]
+    finally:
+        conn.close()
+    return any([option.split('=')[0] == 'USE_URI' and option.split('=')[1:] != ['0'] for option in options])
+
+
+def connect(dbfile, readonly=False, cache_size=None, mmap_size=None, temp_store=None):
+    """
+    Open a connection to the given database file. Read-only connections use
+    memory-mapped I/O so that several processes on the same host share the
+    database pages via the OS page cache, and refuse to write to it. They
+    open the database as immutable, which means that SQLite does not do any
+    file locking or change detection, if SQLite can be given a URI filename,
+    i.e., in Python 3.4+ or if SQLite was compiled with SQLITE_USE_URI (see
+    uri_filenames_enabled()). The other arguments set the corresponding
+    SQLite pragmas if given.
+    """
+    if readonly:
+        uri = 'file:{}?mode=ro&immutable=1'.format(urllib.pathname2url(os.path.abspath(dbfile)))
+        try:
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        except TypeError:
+            # the sqlite3 module only takes the uri argument in Python 3.4+
+            if uri_filenames_enabled():
+                conn = sqlite3.connect(uri, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(dbfile, check_same_thread=False)
+        conn.execute('pragma query_only = on')
+        if mmap_size is None:
+            mmap_size = READONLY_MMAP_SIZE
+    else:
+        conn = sqlite3.connect(dbfile, check_same_thread=False)
+    set_pragmas(conn, cache_size=cache_size, mmap_size=mmap_size, temp_store=temp_store)
+    return conn
+
+
+def set_pragmas(conn, cache_size=None, mmap_size=None, temp_store=None):
+    # cache_size is in pages if positive and in KiB if negative, mmap_size is in bytes
+    if cache_size is not None:
+        conn.execute('pragma cache_size = {}'.format(int(cache_size)))
+    if mmap_size is not None:
+        conn.execute('pragma mmap_size = {}'.format(int(mmap_size)))
+    if temp_store is not None:
+        conn.execute('pragma temp_store = {}'.format(TEMP_STORE_VALUES.index(temp_store)))
+
+
+# The sourcestats table holds the statistics of the non-identical rules of
+# each source: the number of targets (tgtnum), the pe2e1 of the most
+# probable target (bestpe2e1), the average number of pivots (pivotavg) and
+# the number of targets with each WordNet relation (rel0, rel1, ...).
+SOURCE_STATS_TABLE = 'sourcestats'
+NUM_RELATIONS = 11
+
+
+def _source_stats_sql(condition=''):
+    # the statistics of the sources of the rules that also match the condition
+    counts = ', '.join(['sum(relation = {})'.format(rel) for rel in range(NUM_RELATIONS)])
+    return 'select source, count(*), min(pe2e1), avg(pivotnum), {} from paraphrase where identity = 0{} group by source'.format(counts, condition)
+
+
+def create_source_stats(conn):
+    columns = ', '.join(['rel{} integer'.format(rel) for rel in range(NUM_RELATIONS)])
+    conn.execute('create table {} (source text primary key, tgtnum integer, bestpe2e1 real, pivotavg real, {})'.format(SOURCE_STATS_TABLE, columns))
+    conn.execute('insert into {} {}'.format(SOURCE_STATS_TABLE, _source_stats_sql()))
+    conn.execute('create index tgtnumidx on {}(tgtnum)'.format(SOURCE_STATS_TABLE))
+
+
+def update_source_stats(conn, sources):
+    # recompute the statistics of the given sources after their rules changed,
+    # e.g., after their WordNet relations were filled in (see para_annotate)
+    if has_source_stats(conn):
+        conn.executemany('insert or replace into {} {}'.format(SOURCE_STATS_TABLE, _source_stats_sql(' and source = ?')), [(source,) for source in sources])
+
+
+def _has_table(conn, name):
+    return conn.execute("select count(*) from sqlite_master where type = 'table' and name = ?", (name,)).fetchone()[0] > 0
+
+
+def has_source_stats(conn):
+    # databases indexed by older versions do not have the sourcestats table
+    return _has_table(conn, SOURCE_STATS_TABLE)
+
+
+# The lemmas table maps each source and target phrase to each of its lemmas
+# (see para_wn.get_lemmas()), e.g., "ran" to "run", so that all the rules of
+# the inflections of a word can be found with a lookup of its lemma.
+LEMMAS_TABLE = 'lemmas'
+
+
+def create_lemmas(conn):
+    conn.execute('create table {} (phrase text, lemma text, unique (phrase, lemma))'.format(LEMMAS_TABLE))
+    conn.execute('create index lemmaidx on {}(lemma)'.format(LEMMAS_TABLE))
+
+
+def add_lemmas(conn, lemmas):
+    # lemmas maps phrases to lists of their lemmas, the (phrase, lemma) pairs
+    # that are already in the table are skipped
+    conn.executemany('insert or ignore into {} values (?, ?)'.format(LEMMAS_TABLE),
+                     [(phrase, lemma) for (phrase, phrase_lemmas) in lemmas.iteritems() for lemma in phrase_lemmas])
+
+
+def has_lemmas(conn):
+    # databases indexed by older versions do not have the lemmas table
+    return _has_table(conn, LEMMAS_TABLE)
+
+
+# The similarity column holds the distributional similarity of the source and
+# target of each rule, which is only added by para_vectors.add_similarities().
+SIMILARITY_COLUMN = 'similarity'
+
+
+def has_similarity(conn):
+    return any([row[1] == SIMILARITY_COLUMN for row in conn.execute('pragma table_info(paraphrase)')])
+
+
+def prewarm(dbfile, chunk_size=1 << 20):
+    """
+    Read the whole database file sequentially so that its pages are in the
+    OS page cache (and therefore also in any memory map of the file) before
+    the first query. Returns the number of bytes read.
+    """
+    num_bytes = 0
+    with open(dbfile, 'rb') as dbfh:
+        while True:
+            chunk = dbfh.read(chunk_size)
+            if not chunk:
+                break
+            num_bytes += len(chunk)
+    return num_bytes
+
+
+class ParaDatabase:
+
+    def __init__(self, dbpath, readonly=False, cache_size=None, mmap_size=None, temp_store=None):
+        """
+        Open the paraphrase database at the given path. If readonly is True,
+        the database is opened read-only (as immutable if possible, see
+        connect()) and memory-mapped. The remaining
+        arguments set the corresponding SQLite pragmas for every connection.
+        """
+        self._dbfile = find_dbfile(dbpath)
+        if not os.path.exists(self._dbfile):
+            raise IOError('the path {} does not contain a paraphrase database'.format(dbpath))
+        self._connect_options = dict(readonly=readonly, cache_size=cache_size, mmap_size=mmap_size, temp_store=temp_store)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._query_parser = query_parser.Parser()
+
+    @property
+    def dbfile(self):
+        return self._dbfile
+
+    # get the connection belonging to the calling thread, opening it if needed
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = connect(self._dbfile, **self._connect_options)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def num_records(self):
+        num_records, = self._connection().execute('select max(rowid) from paraphrase').fetchone()
+        return num_records or 0
+
+    def compile(self, query, limit=-1, order='highest first', identical=False, same_pos=False, unique_tgt=False, group_by=''):
+        """
+        Compile a query written in the ParaQuery query language (the part
+        after "show") into SQL using the given options. The options have
+        the same meaning as the shell settings, except that there is no
+        limit by default.
+        """
+        # pyparsing grammars are not guaranteed to be re-entrant
+        with self._lock:
+            try:
+                results = self._query_parser.parse(query)
+            except Exception:
+                raise ValueError('cannot parse query: {}'.format(query))
+        compiler = query_compiler.QueryCompiler(limit=limit, order=order, identical=identical, same_pos=same_pos, unique_tgt=unique_tgt, group_by=group_by,
+                                                source_stats=has_source_stats(self._connection()), lemmas=has_lemmas(self._connection()),
+                                                similarity=has_similarity(self._connection()))
+        return CompiledQuery(compiler.compile(results), compiler.get_mode(results))
+
+    def execute(self, compiled_query, batch_size=1000):
+        """
+        Run a compiled query and lazily yield ParaRule objects for basic
+        queries and CountRow objects for count queries. Rows are fetched
+        from SQLite in batches of the given size.
+        """
+        rowtype = ParaRule if compiled_query.mode == 'basic' else CountRow
+        cursor = self._connection().cursor()
+        try:
+            cursor.execute(compiled_query.sql)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield rowtype._make(row)
+        finally:
+            cursor.close()
+
+    def query(self, query, batch_size=1000, **options):
+        """
+        Compile and run the given query. See compile() for the options.
+        """
+        return self.execute(self.compile(query, **options), batch_size=batch_size)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
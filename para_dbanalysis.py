@@ -0,0 +1,668 @@
+# This module computes the statistics for the "analyze" command with SQL
+# aggregate queries over the paraphrase table instead of retrieving all the
+# matching rules into Python. Only the few rules that are shown as examples
+# are retrieved. The statistics are collected into a summary dictionary:
+#
+#   summary = {'size': number of rules,
+#              'score_histogram': histogram of the probabilities,
+#              'percentile_probs': probabilities at para_analysis.report_percentiles,
+#              'prob_percentiles': percentiles at para_analysis.report_probabilities,
+#              'percentile_scores': probabilities at PART_PERCENTILES,
+#              'sample': random rule sample,
+#              'stats': {para_analysis.whole or part: stats}}
+#
+#   stats = {'size': number of rules, 'limits': probability limits,
+#            'pivots': (sum, count),
+#            'relations': {name: {'count': ..., 'histogram': ..., 'examples': [rules]}},
+#            'distances': {'sum': ..., 'count': ..., 'buckets': {bucket: {'count': ..., 'examples': [rules]}}},
+#            'sources': {'num': ..., 'tgtnum_sum': ..., 'tgtnum_min': ..., 'tgtnum_max': ..., 'histogram': ...}}
+#
+# where each histogram is a (counts, lower limit, bin size) tuple or None.
+# The summary is formatted by the *_display() functions below, which produce
+# the same text as the corresponding functions in para_analysis.
+# The queries use window functions and therefore require SQLite 3.25+.
+# The approximate summary computed by summarize_approx() does not use any
+# SQL aggregates but streams the rules through sketches instead.
+
+import bisect
+import math
+import sqlite3
+import sys
+
+import numpy as np
+
+import para_analysis
+import para_db
+import para_sampling
+import para_sketch
+import para_stats
+import para_wn
+
+RULE_COLUMNS = 'source, target, pe2e1, relation, pivotnum, pivots, distance'
+# the where clauses that select exactly the rules summarized in the
+# sourcestats table, i.e., all the non-identical rules
+SOURCE_STATS_CONDITIONS = ['where identity = 0', "where source GLOB '*' and identity = 0"]
+
+# top rules have scores > PART_PERCENTILES[3] percentile, bottom rules have scores < PART_PERCENTILES[0] percentile,
+# middle rules are between PART_PERCENTILES[1] and PART_PERCENTILES[2] percentile
+PART_PERCENTILES = [15, 40, 60, 85]
+
+# the maximum number of examples shown for each relation in each part
+RELATION_SAMPLE_LEN = 12
+# the number of examples shown for each WordNet distance
+DISTANCE_SAMPLE_LEN = 3
+# the number of rules of each relation in each part that are kept by the
+# approximate analysis to draw the examples from
+APPROX_RESERVOIR_LEN = 10 * RELATION_SAMPLE_LEN
+
+
+def is_supported():
+    return sqlite3.sqlite_version_info >= (3, 25, 0)
+
+
+def get_prob(pe2e1):
+    return math.exp(-float(pe2e1))
+
+
+class BinFunction:
+    # assigns values to the bins of a histogram with the given limits in
+    # exactly the same way as numpy.histogram() and para_stats.Distribution,
+    # and returns None for values outside them
+
+    def __init__(self, lower, upper, num_bins):
+        self.lower = lower
+        self.num_bins = num_bins
+        first_edge, last_edge = lower, upper
+        if first_edge == last_edge:
+            first_edge -= 0.5
+            last_edge += 0.5
+        edges = np.linspace(first_edge, last_edge, num_bins + 1)
+        self.binsize = edges[1] - edges[0]
+        self._first_edge = first_edge
+        self._last_edge = last_edge
+        self._edges = edges.tolist()
+        self._norm = num_bins / float(last_edge - first_edge)
+
+    def __call__(self, value):
+        if value is None:
+            return None
+        value = float(value)
+        if value < self._first_edge or value > self._last_edge:
+            return None
+        idx = int((value - self._first_edge) * self._norm)
+        if idx == self.num_bins:
+            idx -= 1
+        # correct for rounding errors right at the bin edges
+        if value < self._edges[idx]:
+            idx -= 1
+        if idx != self.num_bins - 1 and value >= self._edges[idx + 1]:
+            idx += 1
+        return idx
+
+    # turn the (bin, count) rows of a GROUP BY query into a histogram
+    def histogram(self, rows):
+        counts = [0] * self.num_bins
+        for idx, count in rows:
+            if idx is not None:
+                counts[idx] += count
+        return (counts, self.lower, self.binsize)
+
+
+class _RankedScores:
+    # a sorted list of scores of which only the scores at some of the ranks
+    # are known, which is enough to get the scores at given percentiles
+
+    def __init__(self, length, scores_by_rank):
+        self._length = length
+        self._scores_by_rank = scores_by_rank
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, rank):
+        return self._scores_by_rank[rank]
+
+
+def percentile_ranks(length, percentiles):
+    # the ranks in a sorted list of the given length that are needed
+    # to get the scores at the given percentiles
+    ranks = set()
+    for per in percentiles:
+        idx = per / 100.0 * (length - 1)
+        ranks.add(int(idx))
+        if idx != int(idx):
+            ranks.add(int(idx) + 1)
+    return ranks
+
+
+def _new_stats(limits):
+    return {'size': 0, 'limits': limits, 'pivots': (0, 0), 'relations': {},
+            'distances': {'sum': 0, 'count': 0, 'buckets': {}},
+            'sources': {'num': 0, 'tgtnum_sum': 0, 'tgtnum_min': 0, 'tgtnum_max': 0, 'histogram': None}}
+
+
+class _Summarizer:
+
+    def __init__(self, conn, conditional_part):
+        self._conn = conn
+        self._where = conditional_part
+        # the number of targets per source can be looked up if the rules are all the non-identical rules
+        self._source_table = conditional_part in SOURCE_STATS_CONDITIONS and para_db.has_source_stats(conn)
+        self._relation_names = {}
+        self._percentile_scores = None
+        self._part_bins = {}
+        conn.create_function('para_prob', 1, get_prob)
+        conn.create_function('para_part', 1, self._get_part)
+        conn.create_function('para_relation', 1, self._get_relation_name)
+        conn.create_function('para_distance', 1, lambda dist: para_analysis.get_distance(int(dist)))
+        conn.create_function('para_random', 0, para_sampling.random_key)
+        conn.create_function('para_part_bin', 2, self._get_part_bin)
+
+    def _get_part(self, pe2e1):
+        return para_analysis.get_part(get_prob(pe2e1), self._percentile_scores)
+
+    def _get_relation_name(self, relation):
+        if relation not in self._relation_names:
+            self._relation_names[relation] = para_wn.get_relation_name(relation)
+        return self._relation_names[relation]
+
+    def _get_part_bin(self, part, pe2e1):
+        bins = self._part_bins.get(part)
+        return bins(get_prob(pe2e1)) if bins else None
+
+    # the matching rules along with the part and the relation name of each rule
+    def _rules_sql(self):
+        return 'select {}, para_part(pe2e1) as part, para_relation(relation) as rel from paraphrase {}'.format(RULE_COLUMNS, self._where)
+
+    def _execute(self, sql, params=()):
+        cursor = self._conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def size(self):
+        return self._execute('select count(*) from paraphrase {}'.format(self._where))[0][0]
+
+    # get the probabilities at the given percentiles of all the rules
+    def _probs_at_percentiles(self, size, percentiles):
+        ranks = percentile_ranks(size, percentiles)
+        # the rules ranked by increasing probability, i.e., decreasing pe2e1
+        sql = 'select prob_rank, pe2e1 from (select pe2e1, row_number() over (order by pe2e1 desc) - 1 as prob_rank from paraphrase {}) where prob_rank in ({})'
+        rows = self._execute(sql.format(self._where, ', '.join(map(str, sorted(ranks)))))
+        scores = _RankedScores(size, dict([(rank, get_prob(pe2e1)) for (rank, pe2e1) in rows]))
+        # the same type as the scores returned by para_stats.Distribution
+        return [np.float64(score) for score in para_sampling.scores_at_percentiles(scores, percentiles)]
+
+    # the histogram of the probabilities and the percentiles at the report
+    # probabilities, the latter computed as by para_stats.Distribution
+    def _score_distribution(self, size):
+        bins = BinFunction(0, 1, para_analysis.intervals)
+        probabilities = para_analysis.report_probabilities
+        below = [0] * len(probabilities)
+        at = [0] * len(probabilities)
+
+        def prob_class(pe2e1):
+            prob = get_prob(pe2e1)
+            return '/'.join([str(int(prob < x)) + str(int(prob == x)) for x in probabilities])
+        self._conn.create_function('para_prob_class', 1, prob_class)
+        self._conn.create_function('para_bin', 1, lambda pe2e1: bins(get_prob(pe2e1)))
+        bin_rows = []
+        sql = 'select para_bin(pe2e1), para_prob_class(pe2e1), count(*) from paraphrase {} group by 1, 2'
+        for idx, prob_class, count in self._execute(sql.format(self._where)):
+            bin_rows.append((idx, count))
+            for i, flags in enumerate(prob_class.split('/')):
+                below[i] += count * int(flags[0])
+                at[i] += count * int(flags[1])
+        return bins.histogram(bin_rows), para_stats.percentiles_of_scores(below, at, size)
+
+    # draw up to sample_len random rules from each group of rules selected by
+    # sql, which selects the group columns g0, g1, ... followed by the rule columns
+    def _random_samples(self, sql, num_group_cols, sample_len, params=()):
+        group_cols = ', '.join(['g{}'.format(i) for i in range(num_group_cols)])
+        sample_sql = 'select * from (select *, row_number() over (partition by {} order by para_random()) as sample_rank from ({})) where sample_rank <= {}'
+        samples = {}
+        for row in self._execute(sample_sql.format(group_cols, sql, sample_len), params):
+            samples.setdefault(row[:num_group_cols], []).append(row[num_group_cols:-1])
+        return samples
+
+    # the same as para_analysis.get_rules_sample() for each group of rules
+    # selected by sql (as for _random_samples()), given the size of each group
+    def _rules_samples(self, sql, num_group_cols, group_sizes, sample_len):
+        part_sample_len = sample_len / len(para_analysis.parts)
+        if part_sample_len == 0:
+            # no sample is possible, so all the rules are used
+            sample_len = max(group_sizes.values())
+        group_cols = ', '.join(['g{}'.format(i) for i in range(num_group_cols)])
+
+        # the probabilities at PART_PERCENTILES for the groups that need to be sampled
+        wanted_ranks = {}
+        for group, size in group_sizes.items():
+            if size > sample_len:
+                wanted_ranks[group] = percentile_ranks(size, PART_PERCENTILES)
+        group_scores = {}
+        if wanted_ranks:
+            self._conn.create_function('para_wanted_rank', num_group_cols + 1, lambda *args: args[-1] in wanted_ranks.get(args[:-1], ()))
+            ranks_sql = 'select {0}, prob_rank, pe2e1 from (select {0}, pe2e1, row_number() over (partition by {0} order by pe2e1 desc) - 1 as prob_rank from ({1})) where para_wanted_rank({0}, prob_rank)'
+            ranked_scores = {}
+            for row in self._execute(ranks_sql.format(group_cols, sql)):
+                ranked_scores.setdefault(row[:num_group_cols], {})[row[num_group_cols]] = get_prob(row[-1])
+            for group, scores in ranked_scores.items():
+                group_scores[group] = para_sampling.scores_at_percentiles(_RankedScores(group_sizes[group], scores), PART_PERCENTILES)
+
+        # the rules of each group that is sampled are divided into bands (parts)
+        # using its own percentile scores, the rules of the other groups are all
+        # in the same band. Rules outside of the bands are not sampled.
+        def get_band(*args):
+            if args[:-1] not in group_scores:
+                return 'all'
+            band = para_analysis.get_part(get_prob(args[-1]), group_scores[args[:-1]])
+            return band if band in para_analysis.parts else None
+        self._conn.create_function('para_band', num_group_cols + 1, get_band)
+        banded_sql = 'select * from (select {0}, para_band({0}, pe2e1) as g{1}, {2} from ({3})) where g{1} is not null'
+        samples = self._random_samples(banded_sql.format(group_cols, num_group_cols, RULE_COLUMNS, sql), num_group_cols + 1, sample_len)
+
+        res = {}
+        for group_band, rules in samples.items():
+            group, band = group_band[:-1], group_band[-1]
+            res.setdefault(group, []).extend(rules if band == 'all' else rules[:part_sample_len])
+        for group in res:
+            # the rules are sorted as in the analysis of all the rules in Python
+            res[group].sort()
+            if group in group_scores or part_sample_len == 0:
+                res[group] = para_sampling.sort_by_prob(res[group])
+        return res
+
+    def summarize(self, size=None):
+        if size is None:
+            size = self.size()
+        summary = {'size': size}
+        summary['score_histogram'], summary['prob_percentiles'] = self._score_distribution(size)
+        scores = self._probs_at_percentiles(size, para_analysis.report_percentiles + PART_PERCENTILES)
+        summary['percentile_probs'] = scores[:len(para_analysis.report_percentiles)]
+        self._percentile_scores = summary['percentile_scores'] = scores[len(para_analysis.report_percentiles):]
+
+        random_sample_size = max(int(size * 0.03), 1)
+        random_sample_size = min(random_sample_size, 25)
+        whole_sample_sql = "select 'whole' as g0, {} from paraphrase {}".format(RULE_COLUMNS, self._where)
+        summary['sample'] = self._rules_samples(whole_sample_sql, 1, {('whole',): size}, random_sample_size).get(('whole',), [])
+
+        stats = {para_analysis.whole: _new_stats((0, 1))}
+        for part in para_analysis.parts:
+            limits = para_analysis.get_part_limits(part, self._percentile_scores)
+            stats[part] = _new_stats(limits)
+            self._part_bins[part] = BinFunction(limits[0], limits[1], 10)
+        stats[para_analysis.whole]['size'] = size
+        self._relation_stats(stats)
+        self._distance_stats(stats)
+        self._source_stats(stats)
+        summary['stats'] = stats
+        return summary
+
+    def _relation_stats(self, stats):
+        # the number of rules, pivots and the histogram for each relation in each part
+        sql = 'select part, rel, para_part_bin(part, pe2e1), count(*), sum(pivotnum) from ({}) group by 1, 2, 3'
+        bin_rows = {}
+        for part, rel, idx, count, pivotnum_sum in self._execute(sql.format(self._rules_sql())):
+            parts = [para_analysis.whole, part] if part in para_analysis.parts else [para_analysis.whole]
+            for x in parts:
+                relations = stats[x]['relations']
+                relations.setdefault(rel, {'count': 0, 'histogram': None, 'examples': []})['count'] += count
+                pivots_sum, pivots_count = stats[x]['pivots']
+                stats[x]['pivots'] = (pivots_sum + pivotnum_sum, pivots_count + count)
+            if part in para_analysis.parts:
+                stats[part]['size'] += count
+                bin_rows.setdefault((part, rel), []).append((idx, count))
+        for (part, rel), rows in bin_rows.items():
+            stats[part]['relations'][rel]['histogram'] = self._part_bins[part].histogram(rows)
+
+        # examples of each relation in each part
+        group_sizes = {}
+        for part in para_analysis.parts:
+            for rel, relation_stats in stats[part]['relations'].items():
+                group_sizes[(part, rel)] = relation_stats['count']
+        if group_sizes:
+            sql = "select part as g0, rel as g1, {} from ({}) where part != 'none'".format(RULE_COLUMNS, self._rules_sql())
+            for (part, rel), rules in self._rules_samples(sql, 2, group_sizes, RELATION_SAMPLE_LEN).items():
+                stats[part]['relations'][rel]['examples'] = rules
+
+    def _distance_stats(self, stats):
+        # the WordNet distances are only analyzed for undefined relations
+        sql = 'select part, para_distance(distance) as bucket, count(*), sum(distance) from ({}) where rel = ? group by 1, 2'
+        for part, bucket, count, distance_sum in self._execute(sql.format(self._rules_sql()), (para_analysis.undefined,)):
+            parts = [para_analysis.whole, part] if part in para_analysis.parts else [para_analysis.whole]
+            for x in parts:
+                distances = stats[x]['distances']
+                distances['sum'] += distance_sum
+                distances['count'] += count
+                distances['buckets'].setdefault(bucket, {'count': 0, 'examples': []})['count'] += count
+        if stats[para_analysis.whole]['distances']['count'] == 0:
+            return
+        sql = "select part as g0, para_distance(distance) as g1, {} from ({}) where rel = ? and part != 'none'"
+        for (part, bucket), rules in self._random_samples(sql.format(RULE_COLUMNS, self._rules_sql()), 2, DISTANCE_SAMPLE_LEN, (para_analysis.undefined,)).items():
+            stats[part]['distances']['buckets'][bucket]['examples'] = para_sampling.sort_by_prob(rules)
+
+    def _source_stats(self, stats):
+        # the number of target sides per source in the whole collection and in each part
+        tgtnum_sqls = {para_analysis.whole: 'select count(*) as tgtnum from paraphrase {} group by source'.format(self._where)}
+        if self._source_table:
+            tgtnum_sqls[para_analysis.whole] = 'select tgtnum from sourcestats'
+        for part in para_analysis.parts:
+            tgtnum_sqls[part] = "select count(*) as tgtnum from ({}) where part = '{}' group by source".format(self._rules_sql(), part)
+        for x, tgtnum_sql in tgtnum_sqls.items():
+            if x != para_analysis.whole and stats[x]['size'] == 0:
+                continue
+            sources = stats[x]['sources']
+            row = self._execute('select count(*), sum(tgtnum), min(tgtnum), max(tgtnum) from ({})'.format(tgtnum_sql))[0]
+            sources['num'], sources['tgtnum_sum'], sources['tgtnum_min'], sources['tgtnum_max'] = row
+            if sources['num'] > 0 and sources['tgtnum_max'] - sources['tgtnum_min'] > 100:
+                bins = BinFunction(sources['tgtnum_min'], sources['tgtnum_max'], para_analysis.intervals)
+                self._conn.create_function('para_tgtnum_bin', 1, bins)
+                rows = self._execute('select para_tgtnum_bin(tgtnum), count(*) from ({}) group by 1'.format(tgtnum_sql))
+                sources['histogram'] = bins.histogram(rows)
+
+
+class _ApproxSummarizer:
+    # computes the summary in two streaming passes over the rules: the first
+    # pass puts the probabilities into a quantile sketch to get the part
+    # limits, the second pass goes over the rules grouped by source and
+    # collects the statistics with counters, sketches and reservoirs
+
+    def __init__(self, conn, conditional_part, relative_accuracy, batch_size=10000):
+        self._conn = conn
+        self._where = conditional_part
+        self._relative_accuracy = relative_accuracy
+        self._batch_size = batch_size
+
+    def _stream(self, sql):
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(sql)
+            while True:
+                rows = cursor.fetchmany(self._batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def summarize(self, size):
+        summary = {'size': size}
+
+        # first pass: the distribution of the probabilities
+        sketch = para_sketch.QuantileSketch(self._relative_accuracy)
+        histogram = para_sketch.Histogram(BinFunction(0, 1, para_analysis.intervals))
+        probabilities = para_analysis.report_probabilities
+        # the number of probabilities for each position among the report probabilities
+        positions = {}
+        for pe2e1, in self._stream('select pe2e1 from paraphrase {}'.format(self._where)):
+            prob = get_prob(pe2e1)
+            sketch.add(prob)
+            histogram.add(prob)
+            idx = bisect.bisect_left(probabilities, prob)
+            position = (idx, idx < len(probabilities) and probabilities[idx] == prob)
+            positions[position] = positions.get(position, 0) + 1
+        below = [0] * len(probabilities)
+        at = [0] * len(probabilities)
+        for (idx, equal), count in positions.items():
+            if equal:
+                at[idx] += count
+            for i in range(idx + int(equal), len(probabilities)):
+                below[i] += count
+        summary['score_histogram'] = histogram.histogram()
+        summary['prob_percentiles'] = para_stats.percentiles_of_scores(below, at, size)
+        summary['percentile_probs'] = [np.float64(sketch.percentile(x)) for x in para_analysis.report_percentiles]
+        percentile_scores = summary['percentile_scores'] = [np.float64(sketch.percentile(x)) for x in PART_PERCENTILES]
+
+        # second pass: the statistics for the whole collection and for each part
+        stats = {para_analysis.whole: _new_stats((0, 1))}
+        part_bins = {}
+        for part in para_analysis.parts:
+            limits = para_analysis.get_part_limits(part, percentile_scores)
+            stats[part] = _new_stats(limits)
+            part_bins[part] = BinFunction(limits[0], limits[1], 10)
+        random_sample_size = min(max(int(size * 0.03), 1), 25)
+        part_sample_len = random_sample_size / len(para_analysis.parts)
+        sample_reservoirs = dict([(part, para_sketch.Reservoir(part_sample_len)) for part in para_analysis.parts])
+        # no sample is possible for fewer than 100 rules, so all the rules are used
+        all_rules = [] if part_sample_len == 0 else None
+        relation_data = {}
+        distance_reservoirs = {}
+        relation_names = {}
+        tgtnum_counts = dict([(x, {}) for x in stats])
+        source = None
+        source_tgtnums = {}
+        ten_percent_len = size // 10
+        for cnt, rule in enumerate(self._stream('select {} from paraphrase {} order by source'.format(RULE_COLUMNS, self._where)), 1):
+            if ten_percent_len > 0 and cnt % ten_percent_len == 0 and cnt < 10 * ten_percent_len:
+                sys.stdout.write(str(cnt // ten_percent_len * 10) + "%... ")
+                sys.stdout.flush()
+            if rule[0] != source:
+                for x, tgtnum in source_tgtnums.items():
+                    tgtnum_counts[x][tgtnum] = tgtnum_counts[x].get(tgtnum, 0) + 1
+                source = rule[0]
+                source_tgtnums = {}
+            prob = get_prob(rule[2])
+            part = para_analysis.get_part(prob, percentile_scores)
+            if rule[3] not in relation_names:
+                relation_names[rule[3]] = para_wn.get_relation_name(rule[3])
+            rel = relation_names[rule[3]]
+            xs = [para_analysis.whole, part] if part in para_analysis.parts else [para_analysis.whole]
+            for x in xs:
+                relations = stats[x]['relations']
+                relations.setdefault(rel, {'count': 0, 'histogram': None, 'examples': []})['count'] += 1
+                pivots_sum, pivots_count = stats[x]['pivots']
+                stats[x]['pivots'] = (pivots_sum + int(rule[4]), pivots_count + 1)
+                source_tgtnums[x] = source_tgtnums.get(x, 0) + 1
+                if rel == para_analysis.undefined:
+                    distances = stats[x]['distances']
+                    distances['sum'] += int(rule[6])
+                    distances['count'] += 1
+                    bucket = para_analysis.get_distance(int(rule[6]))
+                    distances['buckets'].setdefault(bucket, {'count': 0, 'examples': []})['count'] += 1
+            if all_rules is not None:
+                all_rules.append(rule)
+            if part in para_analysis.parts:
+                stats[part]['size'] += 1
+                sample_reservoirs[part].add(rule)
+                if (part, rel) not in relation_data:
+                    relation_data[(part, rel)] = (para_sketch.Histogram(part_bins[part]), para_sketch.QuantileSketch(self._relative_accuracy), para_sketch.Reservoir(APPROX_RESERVOIR_LEN))
+                relation_histogram, relation_sketch, relation_reservoir = relation_data[(part, rel)]
+                relation_histogram.add(prob)
+                relation_sketch.add(prob)
+                relation_reservoir.add(rule)
+                if rel == para_analysis.undefined:
+                    distance_reservoirs.setdefault((part, bucket), para_sketch.Reservoir(DISTANCE_SAMPLE_LEN)).add(rule)
+        for x, tgtnum in source_tgtnums.items():
+            tgtnum_counts[x][tgtnum] = tgtnum_counts[x].get(tgtnum, 0) + 1
+        sys.stdout.write('\n')
+        stats[para_analysis.whole]['size'] = size
+
+        # the examples are drawn from the reservoirs in the same way as by para_analysis.get_rules_sample()
+        if all_rules is not None:
+            summary['sample'] = sorted(all_rules) if size <= random_sample_size else para_sampling.sort_by_prob(sorted(all_rules))
+        else:
+            sample = []
+            for part in para_analysis.parts:
+                sample.extend(sample_reservoirs[part].items)
+            summary['sample'] = para_sampling.sort_by_prob(sorted(sample))
+        for (part, rel), (histogram, sketch, reservoir) in relation_data.items():
+            relation_stats = stats[part]['relations'][rel]
+            relation_stats['histogram'] = histogram.histogram()
+            if relation_stats['count'] <= RELATION_SAMPLE_LEN:
+                relation_stats['examples'] = sorted(reservoir.items)
+                continue
+            scores = [sketch.percentile(x) for x in PART_PERCENTILES]
+            bands = {}
+            for rule in reservoir.items:
+                bands.setdefault(para_analysis.get_part(get_prob(rule[2]), scores), []).append(rule)
+            examples = para_sampling.stratified_sample([bands.get(band, []) for band in para_analysis.parts], RELATION_SAMPLE_LEN / len(para_analysis.parts))
+            relation_stats['examples'] = para_sampling.sort_by_prob(sorted(examples))
+        for (part, bucket), reservoir in distance_reservoirs.items():
+            stats[part]['distances']['buckets'][bucket]['examples'] = para_sampling.sort_by_prob(reservoir.items)
+
+        # the number of target sides per source
+        for x, counts in tgtnum_counts.items():
+            if not counts:
+                continue
+            sources = stats[x]['sources']
+            sources['num'] = sum(counts.values())
+            sources['tgtnum_sum'] = sum([tgtnum * num for (tgtnum, num) in counts.items()])
+            sources['tgtnum_min'] = min(counts.keys())
+            sources['tgtnum_max'] = max(counts.keys())
+            if sources['tgtnum_max'] - sources['tgtnum_min'] > 100:
+                histogram = para_sketch.Histogram(BinFunction(sources['tgtnum_min'], sources['tgtnum_max'], para_analysis.intervals))
+                for tgtnum, num in counts.items():
+                    histogram.add(tgtnum, num)
+                sources['histogram'] = histogram.histogram()
+        summary['stats'] = stats
+        return summary
+
+
+def get_size(conn, conditional_part):
+    """
+    Get the number of rules selected by the given where clause.
+    """
+    return _Summarizer(conn, conditional_part).size()
+
+
+def summarize(conn, conditional_part, size=None):
+    """
+    Compute the analysis summary for the rules selected by the given where
+    clause (as returned by QueryCompiler.get_conditional_part()). The size
+    is computed if it is not given.
+    """
+    return _Summarizer(conn, conditional_part).summarize(size)
+
+
+def summarize_approx(conn, conditional_part, relative_accuracy=0.01, size=None):
+    """
+    Compute an approximate analysis summary with a bounded amount of memory
+    by streaming the rules through sketches. The probabilities at percentiles
+    (and therefore the limits of the parts) are within relative_accuracy of
+    the exact values and the examples are drawn from random samples of the
+    rules, all the counts and histograms are exact.
+    """
+    if size is None:
+        size = get_size(conn, conditional_part)
+    return _ApproxSummarizer(conn, conditional_part, relative_accuracy).summarize(size)
+
+
+def histogram_display(histogram, denominator):
+    if histogram is None or denominator <= 0:
+        return '\n'
+    counts, lower, binsize = histogram
+    return para_analysis.histogram_for_print(counts, lower, binsize, denominator)
+
+
+def scores_and_percentiles_display(summary):
+    out = ['\n' + histogram_display(summary['score_histogram'], summary['size'])]
+    out.append(para_analysis.percentile_probabilities_for_print(summary['percentile_probs']))
+    out.append(para_analysis.probability_percentiles_for_print(summary['prob_percentiles']))
+    return ''.join(out)
+
+
+def _source_targets_display(stats):
+    sources = stats['sources']
+    histogram = ''
+    if sources['histogram'] is not None:
+        histogram = histogram_display(sources['histogram'], sources['num'])
+    return para_analysis.source_target_stats_display(sources['num'], sources['tgtnum_sum'], histogram)
+
+
+def _sources_display(stats):
+    sources = stats['sources']
+    out = [_source_targets_display(stats)]
+    # Add the avg number of each WN relation per source side
+    for rel in sorted(stats['relations'].keys(), key=para_analysis.relation_order):
+        count = stats['relations'][rel]['count']
+        out.append(para_analysis.source_relation_numbers_display_local([count], rel, sources['num']))
+    return ''.join(out)
+
+
+def _distances_display(stats):
+    distances = stats['distances']
+    if distances['count'] == 0:
+        return ''
+    out = ['\n   Analysis of WordNet distances for rules corresponding to ' + para_analysis.undefined.upper() + ':\n']
+    out.append('      Average distance: ' + str(float(distances['sum'])/distances['count']) + '\n')
+    for dist in sorted(distances['buckets'].keys()):
+        bucket = distances['buckets'][dist]
+        out.append('      Examples when distance is ' + dist + ' (out of ' + str(bucket['count']) + ' rules):\n')
+        for rule_str in para_analysis.rules_to_strings(bucket['examples']):
+            out.append('\t\t')
+            out.append(rule_str + '\n')
+        out.append('\n')
+    return ''.join(out)
+
+
+def whole_analysis_display(summary):
+    db_size = summary['size']
+    stats = summary['stats'][para_analysis.whole]
+    out = ['\nRandom rule sample: \n']
+    out.append('-' * 20 + '\n')
+    for rule_str in para_analysis.rules_to_strings(summary['sample']):
+        out.append(rule_str + '\n')
+
+    out.append('\nStatistics for the ' + str(db_size) + ' rule(s): \n')
+    out.append('-' * 37 + '\n')
+    pivots_sum, pivots_count = stats['pivots']
+    if pivots_count == 0:
+        out.append('  Info on number of pivots is not available.\n')
+    else:
+        out.append('  Average number of pivots: ' + str(float(pivots_sum)/pivots_count) + '\n\n')
+
+    relations = stats['relations']
+    wn_part_size = db_size - relations.get(para_analysis.not_in_wn, {'count': 0})['count']
+    out.append('  Results of WordNet analysis based on ' + str(wn_part_size) + ' rule(s) (' + str(round(wn_part_size * 100.0/db_size, 2)) + '% of the ' + str(db_size) + ' rule(s)):\n')
+    for rel in sorted(relations.keys(), key=para_analysis.relation_order):
+        if rel == para_analysis.not_in_wn:
+            continue
+        relSize = relations[rel]['count']
+        out.append('      ' + rel.upper() + ': ' + str(relSize) + ' rule(s) (' + str(round(relSize * 100.0/wn_part_size, 2)) + '%):\n')
+
+    distances = stats['distances']
+    if distances['count'] > 0:
+        out.append('\n  Average WordNet distance for rules corresponding to ' + para_analysis.undefined.upper() + ': ' + str(float(distances['sum'])/distances['count']) + '\n')
+
+    out.append(_sources_display(stats))
+    return ''.join(out)
+
+
+def part_analysis_display(part, summary):
+    stats = summary['stats'][part]
+    out = ['\n***********************************************************************\n Analyzing the ' + part + ' part of the resource.\n']
+    out.append('   Scores between: ' + str(stats['limits']) + '\n')
+    pivots_sum, pivots_count = stats['pivots']
+    if pivots_count == 0:
+        out.append('   Info on number of pivots is not available.\n')
+    else:
+        out.append('   Average number of pivots: ' + str(float(pivots_sum)/pivots_count) + '\n')
+    part_size = stats['size']
+    out.append('  Number of rules: ' + str(part_size) + '\n')
+    if part_size == 0:
+        return ''.join(out)
+
+    relations = stats['relations']
+    wn_part_size = part_size - relations.get(para_analysis.not_in_wn, {'count': 0})['count']
+    if wn_part_size == 0:
+        out.append(_source_targets_display(stats))
+        out.append("  WordNet-based analysis is impossible, none of the rules was found in WordNet.\n")
+        return ''.join(out)
+    out.append('  Results of WordNet analysis based on ' + str(wn_part_size) + ' rules (' + str(round(wn_part_size * 1.0/part_size, 2)) + '% of the ' + part + ' part):\n')
+    for rel in sorted(relations.keys(), key=para_analysis.relation_order):
+        if rel == para_analysis.not_in_wn:
+            continue
+        relSize = relations[rel]['count']
+        out.append('      ' + rel.upper() + ': ' + str(relSize) + ' rule(s) (' + str(round(relSize * 100.0/wn_part_size, 2)) + '%):\n')
+        out.append('      Score distribution: ')
+        out.append(histogram_display(relations[rel]['histogram'], relSize))
+        out.append('      Examples:\n')
+        for rule_str in para_analysis.rules_to_strings(relations[rel]['examples']):
+            out.append('\t')
+            out.append(rule_str + '\n')
+        out.append('\n')
+    out.append(_distances_display(stats))
+    out.append(_sources_display(stats))
+    return ''.join(out)
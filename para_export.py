@@ -0,0 +1,157 @@
+# This module contains the writers used by the "export" command to stream
+# paraphrase rules from a database cursor into columnar files without
+# formatting each rule as a string first. Two formats are supported:
+#
+#   1. A directory of NumPy .npy files, one per column (the default). Numeric
+#      columns are stored as plain arrays. Text columns are stored as two
+#      arrays: <column>.data.npy holds the UTF-8 bytes of all the strings
+#      concatenated together and <column>.offsets.npy holds the n+1 offsets
+#      into it, i.e., the i-th string is data[offsets[i]:offsets[i+1]].
+#
+#   2. A single Parquet file, if the file name ends in ".parquet". This
+#      requires the optional pyarrow package.
+#
+# In both cases, pe2e1 is exported as stored in the database, i.e., as a
+# negative log probability. NULL values, which only occur in databases that
+# are not fully annotated (see para_annotate), are exported as NULL_VALUE in
+# .npy files and as nulls in Parquet files.
+
+import os
+import struct
+
+import numpy as np
+
+# the exported columns in the order in which they appear in the query results
+_COLUMNS = [('source', 'text'), ('target', 'text'), ('pe2e1', '<f8'), ('relation', '<i1'), ('pivotnum', '<i4'), ('pivots', 'text'), ('distance', '<i4')]
+_PIVOTS_IDX = 5
+
+# the value of the NULL numbers in .npy files, e.g., the relation of rules
+# that do not have WordNet relations yet
+NULL_VALUE = -1
+
+# size of the fixed .npy header, this leaves enough room for any row count
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(dtype, num_rows):
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({},), }}".format(np.dtype(dtype).str, num_rows)
+    # magic string, version 1.0, header length and then the header itself padded with spaces and ending in a newline
+    header = header.ljust(_NPY_HEADER_SIZE - 10 - 1) + '\n'
+    return '\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header
+
+
+class _NpyColumnWriter:
+    # writes a single numeric column to a .npy file, the header is
+    # rewritten with the final number of rows when the file is closed
+
+    def __init__(self, filename, dtype):
+        self._dtype = np.dtype(dtype)
+        self._fh = open(filename, 'wb')
+        self._fh.write(_npy_header(self._dtype, 0))
+        self._num_rows = 0
+
+    def write(self, values):
+        # the WordNet columns of lazily indexed databases may be NULL
+        if not isinstance(values, np.ndarray) and None in values:
+            values = [NULL_VALUE if value is None else value for value in values]
+        np.asarray(values, dtype=self._dtype).tofile(self._fh)
+        self._num_rows += len(values)
+
+    def close(self):
+        self._fh.seek(0)
+        self._fh.write(_npy_header(self._dtype, self._num_rows))
+        self._fh.close()
+
+
+class _NpyTextColumnWriter:
+    # writes a text column as a UTF-8 data array and an offsets array
+
+    def __init__(self, prefix):
+        self._data = _NpyColumnWriter(prefix + '.data.npy', '<u1')
+        self._offsets = _NpyColumnWriter(prefix + '.offsets.npy', '<i8')
+        self._offsets.write([0])
+        self._end = 0
+
+    def write(self, values):
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = np.cumsum([len(x) for x in encoded], dtype=np.int64) + self._end
+        self._data.write(np.frombuffer(''.join(encoded), dtype=np.uint8))
+        self._offsets.write(offsets)
+        if len(offsets) > 0:
+            self._end = offsets[-1]
+
+    def close(self):
+        self._data.close()
+        self._offsets.close()
+
+
+class NpyExportWriter:
+
+    def __init__(self, dirname, columns):
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._writers = []
+        for name, dtype in columns:
+            prefix = os.path.join(dirname, name)
+            if dtype == 'text':
+                self._writers.append(_NpyTextColumnWriter(prefix))
+            else:
+                self._writers.append(_NpyColumnWriter(prefix + '.npy', dtype))
+
+    def write_batch(self, columns):
+        for writer, values in zip(self._writers, columns):
+            writer.write(values)
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
+
+class ParquetExportWriter:
+
+    def __init__(self, filename, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('exporting to Parquet requires the pyarrow package')
+        self._pa = pyarrow
+        types = {'text': pyarrow.string(), '<f8': pyarrow.float64(), '<i1': pyarrow.int8(), '<i4': pyarrow.int32()}
+        self._schema = pyarrow.schema([(name, types[dtype]) for name, dtype in columns])
+        self._writer = pyarrow.parquet.ParquetWriter(filename, self._schema)
+
+    def write_batch(self, columns):
+        arrays = [self._pa.array(values, type=field.type) for field, values in zip(self._schema, columns)]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def export_rules(cursor, filename, with_pivots=False, batch_size=100000):
+    """
+    Write the rows of an executed basic query to the given file or directory
+    and return the number of exported rows. The pivots column is only
+    exported if with_pivots is True.
+    """
+    columns = [column for (idx, column) in enumerate(_COLUMNS) if with_pivots or idx != _PIVOTS_IDX]
+    if filename.endswith('.parquet'):
+        writer = ParquetExportWriter(filename, columns)
+    else:
+        writer = NpyExportWriter(filename, columns)
+
+    num_rows = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            # transpose the batch of rows into columns
+            batch = zip(*rows)
+            if not with_pivots:
+                del batch[_PIVOTS_IDX]
+            writer.write_batch(batch)
+            num_rows += len(rows)
+    finally:
+        writer.close()
+    return num_rows
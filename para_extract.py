@@ -0,0 +1,297 @@
+# A local replacement for running Thrax on Hadoop to extract the translation
+# rules that the paraphrase rules are pivoted from. It reads the foreign
+# sentences, the English sentences and the word alignments between them
+# (see README.md) line by line and extracts all the phrase pairs that are
+# consistent with the alignments and within the length limits of the given
+# Thrax configuration file (lib/hiero.conf), using all the cores of the
+# machine. The phrase pairs are scored in the same way as by Thrax and
+# written out in the Joshua format read by the pivoting step:
+#
+#   [X] ||| foreign phrase ||| English phrase ||| RarityPenalty=... SourcePhraseGivenTarget=... TargetPhraseGivenSource=...
+#
+# where SourcePhraseGivenTarget and TargetPhraseGivenSource are -log p(f|e)
+# and -log p(e|f) and RarityPenalty is exp(1 - count of the pair). As with
+# lib/hiero.conf, only phrase pairs are extracted, i.e., rules without
+# nonterminals.
+#
+# Like the Hadoop job, the extraction runs in three steps that each write
+# sharded intermediate files, which are processed by a pool of processes:
+#
+#   1. the sentences are read in chunks and the phrase pairs of each chunk
+#      are extracted and counted, and the counts are written into shards by
+#      English phrase
+#   2. the count files of each shard are sorted by English phrase, the counts
+#      of each English phrase are summed and p(f|e) is computed, and the pairs
+#      are written into shards by foreign phrase
+#   3. the files of each shard are sorted by foreign phrase, p(e|f) is
+#      computed and the rules of the shard are written out sorted by foreign
+#      phrase into <outdir>/rules-NNNNN.gz
+#
+# The shards are sorted with the external merge sort of para_extsort, so the
+# memory needed by each process is bounded by the size of a chunk in step 1
+# and by max_lines lines and the phrase pairs of a single phrase in steps 2
+# and 3, rather than by the number of phrase pairs, whatever the number of
+# processes and shards.
+#
+# Run it as: python para_extract.py [options] sentences.fr sentences.en sentences.align <outdir>
+
+import argparse
+import collections
+import glob
+import gzip
+import itertools
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import zlib
+
+import para_extsort
+
+# the number of sentences in each chunk that is processed in one go
+CHUNK_SIZE = 20000
+# the default number of shards of the intermediate and output files
+NUM_SHARDS = 16
+# the default maximum phrase length, the same as Thrax's
+MAX_PHRASE_LENGTH = 15
+
+
+def read_config(filename):
+    """
+    Read a Thrax configuration file into a dictionary of strings. Each line
+    has a key and a value separated by whitespace, and # starts a comment.
+    """
+    config = {}
+    f = open(filename)
+    for line in f:
+        fields = line.split('#', 1)[0].split(None, 1)
+        if len(fields) == 2:
+            config[fields[0]] = fields[1].strip()
+    f.close()
+    return config
+
+
+def _open(filename, mode='rb'):
+    return gzip.GzipFile(filename, mode) if filename.endswith('.gz') else open(filename, mode)
+
+
+def parse_alignment(alignment, f_len, e_len):
+    # the (foreign index, English index) pairs of an alignment like "0-0 1-2"
+    res = []
+    for link in alignment.split():
+        i, sep, j = link.partition('-')
+        i, j = int(i), int(j)
+        if not sep or i < 0 or j < 0 or i >= f_len or j >= e_len:
+            raise ValueError('invalid alignment point ' + link)
+        res.append((i, j))
+    return res
+
+
+def extract_phrase_pairs(f_words, e_words, alignment, max_length=MAX_PHRASE_LENGTH, loose=False):
+    """
+    Return all the (foreign phrase, English phrase) pairs of the given
+    sentences that are consistent with the given alignment, i.e., none of
+    the words of either phrase is aligned to a word outside of the other
+    phrase, with at least one alignment point and at most max_length words
+    on each side. Unless loose is True, the first and last words of both
+    phrases must be aligned.
+    """
+    f_links = [[] for word in f_words]
+    e_links = [[] for word in e_words]
+    for i, j in alignment:
+        f_links[i].append(j)
+        e_links[j].append(i)
+
+    res = []
+    for f1 in range(len(f_words)):
+        if not loose and not f_links[f1]:
+            continue
+        e_min, e_max = len(e_words), -1
+        for f2 in range(f1, min(f1 + max_length, len(f_words))):
+            for j in f_links[f2]:
+                e_min, e_max = min(e_min, j), max(e_max, j)
+            if e_max < 0 or (not loose and not f_links[f2]):
+                continue
+            # the English span only grows with the foreign span
+            if e_max - e_min + 1 > max_length:
+                break
+            if any([i < f1 or i > f2 for j in range(e_min, e_max + 1) for i in e_links[j]]):
+                continue
+            f_phrase = ' '.join(f_words[f1:f2 + 1])
+            if not loose:
+                res.append((f_phrase, ' '.join(e_words[e_min:e_max + 1])))
+                continue
+            # extend the English phrase with the unaligned words around it
+            e_start = e_min
+            while e_start > 0 and not e_links[e_start - 1] and e_max - e_start + 2 <= max_length:
+                e_start -= 1
+            for e1 in range(e_start, e_min + 1):
+                e2 = e_max
+                while True:
+                    res.append((f_phrase, ' '.join(e_words[e1:e2 + 1])))
+                    if e2 + 1 >= len(e_words) or e_links[e2 + 1] or e2 + 1 - e1 + 1 > max_length:
+                        break
+                    e2 += 1
+    return res
+
+
+def _neg_log(prob):
+    return -math.log(prob) if prob < 1 else 0.0
+
+
+def _shard(phrase, num_shards):
+    # the same shard in every process
+    return (zlib.crc32(phrase) & 0xffffffff) % num_shards
+
+
+def _shard_files(dirname, name, num_shards):
+    return [gzip.GzipFile(os.path.join(dirname, '{}.{:05d}.gz'.format(name, k)), 'wb') for k in range(num_shards)]
+
+
+def _extract_chunk(args):
+    # step 1: count the phrase pairs of a chunk of sentences and write the
+    # counts into the shards of the English phrases
+    chunk_id, first_line, sentences, workdir, num_shards, max_length, loose = args
+    counts = collections.Counter()
+    for num, (f_sent, e_sent, alignment) in enumerate(sentences):
+        f_words = f_sent.split()
+        e_words = e_sent.split()
+        try:
+            links = parse_alignment(alignment, len(f_words), len(e_words))
+        except ValueError as e:
+            raise ValueError('line {}: {}'.format(first_line + num, e))
+        counts.update(extract_phrase_pairs(f_words, e_words, links, max_length, loose))
+    # the fields are separated by tabs so that the lines sort by phrase (see para_extsort)
+    outfiles = _shard_files(workdir, 'counts-{:05d}'.format(chunk_id), num_shards)
+    for (f_phrase, e_phrase), count in counts.iteritems():
+        outfiles[_shard(e_phrase, num_shards)].write('{}\t{}\t{}\n'.format(e_phrase, f_phrase, count))
+    for outfile in outfiles:
+        outfile.close()
+    return len(counts)
+
+
+def _sorted_shard(workdir, name, shard, max_lines):
+    # the lines of the files of a shard in sorted order, split into fields.
+    # The shards are sorted by each of the processes of the pool on its own.
+    filenames = sorted(glob.glob(os.path.join(workdir, '{}-*.{:05d}.gz'.format(name, shard))))
+    for line in para_extsort.sort_files(filenames, max_lines=max_lines, processes=1, tmpdir=workdir):
+        yield line.rstrip('\n').split('\t')
+
+
+def _score_english_shard(args):
+    # step 2: sum the counts of the pairs of the English phrases of a shard,
+    # compute -log p(f|e) and write the pairs into the shards of the foreign phrases
+    shard, workdir, num_shards, max_lines = args
+    outfiles = _shard_files(workdir, 'scored-{:05d}'.format(shard), num_shards)
+    for e_phrase, fields in itertools.groupby(_sorted_shard(workdir, 'counts', shard, max_lines), key=lambda fields: fields[0]):
+        # the counts of the same pair from different chunks are next to each other
+        f_counts = [(f_phrase, sum([int(count) for (e, f, count) in pair_fields])) for f_phrase, pair_fields in itertools.groupby(fields, key=lambda fields: fields[1])]
+        e_count = float(sum([count for (f_phrase, count) in f_counts]))
+        for f_phrase, count in f_counts:
+            outfiles[_shard(f_phrase, num_shards)].write('{}\t{}\t{}\t{!r}\n'.format(f_phrase, e_phrase, count, _neg_log(count / e_count)))
+    for outfile in outfiles:
+        outfile.close()
+
+
+def _score_foreign_shard(args):
+    # step 3: compute -log p(e|f) for the foreign phrases of a shard and write
+    # out their rules sorted by foreign phrase and then English phrase
+    shard, workdir, outdir, max_lines = args
+    outfile = gzip.GzipFile(os.path.join(outdir, 'rules-{:05d}.gz'.format(shard)), 'wb')
+    num_rules = 0
+    for f_phrase, fields in itertools.groupby(_sorted_shard(workdir, 'scored', shard, max_lines), key=lambda fields: fields[0]):
+        e_pairs = [(e_phrase, int(count), float(f_given_e)) for (f, e_phrase, count, f_given_e) in fields]
+        f_count = float(sum([count for (e_phrase, count, f_given_e) in e_pairs]))
+        for e_phrase, count, f_given_e in e_pairs:
+            features = 'RarityPenalty={!r} SourcePhraseGivenTarget={!r} TargetPhraseGivenSource={!r}'.format(math.exp(1 - count), f_given_e, _neg_log(count / f_count))
+            outfile.write('[X] ||| {} ||| {} ||| {}\n'.format(f_phrase, e_phrase, features))
+            num_rules += 1
+    outfile.close()
+    return num_rules
+
+
+def _read_chunks(fr_file, en_file, align_file, chunk_size):
+    # yield the (first line number, [(foreign, English, alignment)]) of each
+    # chunk of sentences, reading the three files in step
+    files = [_open(filename) for filename in [fr_file, en_file, align_file]]
+    try:
+        lines = itertools.izip_longest(*files)
+        first_line = 1
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+            if any([line is None for triple in chunk for line in triple]):
+                raise ValueError('the sentence and alignment files have different numbers of lines')
+            yield first_line, [tuple([line.strip() for line in triple]) for triple in chunk]
+            first_line += len(chunk)
+    finally:
+        for f in files:
+            f.close()
+
+
+def extract(fr_file, en_file, align_file, outdir, config=None, processes=None, num_shards=NUM_SHARDS, chunk_size=CHUNK_SIZE, max_lines=para_extsort.MAX_LINES):
+    """
+    Extract the scored phrase pairs from the given sentence and alignment
+    files, with the phrase length limits of the given Thrax configuration
+    dictionary (see read_config()), and write them into num_shards files
+    in outdir. Each process sorts up to max_lines lines in memory. Returns
+    the number of sentences and the number of rules.
+    """
+    config = config or {}
+    max_length = int(config.get('initial-phrase-length', MAX_PHRASE_LENGTH))
+    loose = config.get('loose', 'false').lower() == 'true'
+    processes = processes or multiprocessing.cpu_count()
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    workdir = os.path.join(outdir, 'tmp')
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # the chunks are read as many at a time as there are processes so that
+        # only those chunks are held in memory
+        num_sentences = 0
+        chunks = _read_chunks(fr_file, en_file, align_file, chunk_size)
+        for batch_id in itertools.count():
+            batch = list(itertools.islice(chunks, processes))
+            if not batch:
+                break
+            tasks = [(batch_id * processes + i, first_line, sentences, workdir, num_shards, max_length, loose) for (i, (first_line, sentences)) in enumerate(batch)]
+            pool.map(_extract_chunk, tasks)
+            num_sentences += sum([len(sentences) for (first_line, sentences) in batch])
+        pool.map(_score_english_shard, [(shard, workdir, num_shards, max_lines) for shard in range(num_shards)], chunksize=1)
+        num_rules = sum(pool.map(_score_foreign_shard, [(shard, workdir, outdir, max_lines) for shard in range(num_shards)], chunksize=1))
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(workdir)
+    return num_sentences, num_rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the phrase pairs of a word-aligned parallel corpus without Hadoop.')
+    parser.add_argument('fr_file', help='the foreign sentences, one per line (may be gzipped)')
+    parser.add_argument('en_file', help='the English sentences, one per line (may be gzipped)')
+    parser.add_argument('align_file', help='the word alignments, one sentence per line (may be gzipped)')
+    parser.add_argument('outdir', help='the directory the rule files are written to')
+    parser.add_argument('-c', '--config', help='the Thrax configuration file with the length limits, e.g., lib/hiero.conf')
+    parser.add_argument('-p', '--processes', type=int, help='the number of processes (all the cores by default)')
+    parser.add_argument('-s', '--shards', type=int, default=NUM_SHARDS, help='the number of rule files (default: %(default)s)')
+    parser.add_argument('-m', '--max-lines', type=int, default=para_extsort.MAX_LINES, help='the number of lines sorted in memory by each process (default: %(default)s)')
+    args = parser.parse_args()
+
+    config = read_config(args.config) if args.config else None
+    try:
+        num_sentences, num_rules = extract(args.fr_file, args.en_file, args.align_file, args.outdir, config, args.processes, args.shards, max_lines=args.max_lines)
+    except (IOError, ValueError) as e:
+        sys.stderr.write('\n Error: {}.\n\n'.format(e))
+        sys.exit(1)
+    sys.stderr.write('\n Extracted {} rules from {} sentences into {}.\n\n'.format(num_rules, num_sentences, args.outdir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# An external merge sort of lines of text for inputs that do not fit in memory,
+# like the Unix sort command: the lines are read in runs of up to max_lines,
+# each run is sorted and written to a temporary file by a pool of processes,
+# and the sorted runs are then merged, at most MAX_MERGE_FILES at a time.
+# The lines can be given either as an iterable (sort_lines()) or as files
+# that are each read and sorted by one of the processes (sort_files()). The
+# lines are sorted by their bytes, so callers put the fields to sort by first,
+# separated by tabs, which sort before spaces and all printable characters.
+
+import gzip
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+# the default maximum number of lines in memory in each process
+MAX_LINES = 1000000
+# the maximum number of files that are merged at the same time
+MAX_MERGE_FILES = 64
+
+
+def _write_run(args):
+    lines, filename = args
+    lines.sort()
+    # the runs are only read once, so they are compressed as fast as possible
+    outfile = gzip.GzipFile(filename, 'wb', compresslevel=1)
+    outfile.writelines(lines)
+    outfile.close()
+    return filename
+
+
+def _merge_files(filenames):
+    infiles = [gzip.GzipFile(filename) for filename in filenames]
+    try:
+        for line in heapq.merge(*infiles):
+            yield line
+    finally:
+        for infile in infiles:
+            infile.close()
+
+
+def _merge_run(args):
+    filenames, filename = args
+    outfile = gzip.GzipFile(filename, 'wb', compresslevel=1)
+    outfile.writelines(_merge_files(filenames))
+    outfile.close()
+    for name in filenames:
+        os.remove(name)
+    return filename
+
+
+def _merge_runs(runs, workdir, pool):
+    # yield the lines of the sorted runs in order, first merging them into
+    # fewer, longer runs until they can all be merged at once
+    level = 0
+    while len(runs) > MAX_MERGE_FILES:
+        tasks = []
+        for i in range(0, len(runs), MAX_MERGE_FILES):
+            tasks.append((runs[i:i + MAX_MERGE_FILES], os.path.join(workdir, 'merged-{:03d}-{:06d}.gz'.format(level, i))))
+        runs = pool.map(_merge_run, tasks) if pool is not None else map(_merge_run, tasks)
+        level += 1
+    for line in _merge_files(runs):
+        yield line
+
+
+def sort_lines(lines, max_lines=MAX_LINES, processes=None, tmpdir=None):
+    """
+    Yield the given lines, which must all end with a newline, in sorted
+    order. The temporary files are written to a new directory in tmpdir
+    (the system default if None), which is removed when all the lines have
+    been yielded or the generator is closed.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    workdir = tempfile.mkdtemp(prefix='paraquery-sort-', dir=tmpdir)
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        runs = []
+        pending = []
+        run = []
+        for line in lines:
+            run.append(line)
+            if len(run) < max_lines:
+                continue
+            task = (run, os.path.join(workdir, 'run-{:06d}.gz'.format(len(runs) + len(pending))))
+            run = []
+            if pool is None:
+                runs.append(_write_run(task))
+                continue
+            # at most one run per process is sorted at a time to bound the memory
+            pending.append(pool.apply_async(_write_run, (task,)))
+            if len(pending) >= processes:
+                runs.append(pending.pop(0).get())
+        runs.extend([result.get() for result in pending])
+        if not runs:
+            # everything fits in memory
+            run.sort()
+            for line in run:
+                yield line
+            return
+        if run:
+            runs.append(_write_run((run, os.path.join(workdir, 'run-{:06d}.gz'.format(len(runs))))))
+            run = []
+        for line in _merge_runs(runs, workdir, pool):
+            yield line
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        shutil.rmtree(workdir)
+
+
+def _sort_file(args):
+    # sort the lines of a file in runs of up to max_lines
+    filename, transform, max_lines, workdir, filename_num = args
+    name = os.path.join(workdir, 'run-{:04d}-{{:06d}}.gz'.format(filename_num))
+    infile = gzip.GzipFile(filename) if filename.endswith('.gz') else open(filename, 'rb')
+    runs = []
+    run = []
+    for line in infile:
+        if not line.endswith('\n'):
+            line += '\n'
+        run.append(transform(line) if transform is not None else line)
+        if len(run) >= max_lines:
+            runs.append(_write_run((run, name.format(len(runs)))))
+            run = []
+    infile.close()
+    if run:
+        runs.append(_write_run((run, name.format(len(runs)))))
+    return runs
+
+
+def sort_files(filenames, transform=None, max_lines=MAX_LINES, processes=None, tmpdir=None):
+    """
+    Yield the lines of all the given files (optionally gzipped) in sorted
+    order, as sort_lines() does. Each file is read and sorted in runs by
+    one of a pool of processes. If transform is given, it is applied to each
+    line before sorting and must return a line that ends with a newline.
+    Since it is run by the other processes, it must be a module-level function.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    workdir = tempfile.mkdtemp(prefix='paraquery-sort-', dir=tmpdir)
+    pool = multiprocessing.Pool(min(processes, len(filenames))) if processes > 1 and len(filenames) > 1 else None
+    try:
+        tasks = [(filename, transform, max_lines, workdir, i) for (i, filename) in enumerate(filenames)]
+        # the runs of each file are in the same order as the files
+        file_runs = pool.map(_sort_file, tasks, chunksize=1) if pool is not None else map(_sort_file, tasks)
+        runs = [run for runs in file_runs for run in runs]
+        for line in _merge_runs(runs, workdir, pool):
+            yield line
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        shutil.rmtree(workdir)
@@ -0,0 +1,381 @@
+# A compact WordNet lexicon stored in integer arrays, which para_wn can use
+# instead of NLTK's WordNet corpus reader (see para_wn.use_lexicon()). The
+# lexicon is built once from NLTK's WordNet data with build() and is saved
+# as a directory of NumPy .npy files that are memory-mapped when it is
+# loaded, so loading it takes almost no time and several processes share
+# the same pages. The arrays are:
+#
+#   strings.data.npy, strings.offsets.npy: all the lemma names, index words
+#       and exception forms, sorted, in the same format as the text columns
+#       written by the "export" command
+#   index.starts.npy, index.synsets.npy: the synsets of each index word for
+#       each part of speech, i.e., for word i and part of speech p (in the
+#       order of POS_LIST), synsets[starts[i * 4 + p]:starts[i * 4 + p + 1]]
+#   exceptions.starts.npy, exceptions.bases.npy: the base forms of each
+#       exception form for each part of speech, indexed in the same way
+#   synsets.pos.npy, synsets.offset.npy: the part of speech and data file
+#       offset of each synset
+#   synsets.starts.npy, lemmas.names.npy: the lemmas of each synset, i.e.,
+#       the names of the lemmas of synset i are names[starts[i]:starts[i + 1]]
+#   synsets.pointers.{starts,targets,symbols}.npy: the synset pointers of each
+#       synset, i.e., the target synsets and the symbols of the pointers
+#   lemmas.pointers.{starts,targets,symbols}.npy: the same for the lemma
+#       pointers of each lemma, where the targets are lemmas
+#   symbols.npy: the pointer symbols used in the pointer arrays
+#
+# The Lexicon class has the same interface as the parts of NLTK's WordNet
+# corpus reader (version 2) that para_wn uses and returns the same results.
+
+import bisect
+import os
+
+import numpy as np
+
+NOUN, VERB, ADJ, ADJ_SAT, ADV = 'n', 'v', 'a', 's', 'r'
+POS_LIST = [NOUN, VERB, ADJ, ADV]
+
+# the synset and lemma pointers used by para_wn and their symbols
+SYNSET_POINTERS = {'hypernyms': '@', 'instance_hypernyms': '@i', 'hyponyms': '~', 'instance_hyponyms': '~i',
+                   'member_holonyms': '#m', 'substance_holonyms': '#s', 'part_holonyms': '#p',
+                   'member_meronyms': '%m', 'substance_meronyms': '%s', 'part_meronyms': '%p'}
+LEMMA_POINTERS = {'antonyms': '!', 'derivationally_related_forms': '+', 'pertainyms': '\\'}
+
+# the same rules as those used by WordNet's morphy
+MORPHOLOGICAL_SUBSTITUTIONS = {
+    NOUN: [('s', ''), ('ses', 's'), ('ves', 'f'), ('xes', 'x'),
+           ('zes', 'z'), ('ches', 'ch'), ('shes', 'sh'),
+           ('men', 'man'), ('ies', 'y')],
+    VERB: [('s', ''), ('ies', 'y'), ('es', 'e'), ('es', ''),
+           ('ed', 'e'), ('ed', ''), ('ing', 'e'), ('ing', '')],
+    ADJ: [('er', ''), ('est', ''), ('er', 'e'), ('est', 'e')],
+    ADV: []}
+
+_ARRAYS = ['strings.data', 'strings.offsets', 'index.starts', 'index.synsets', 'exceptions.starts', 'exceptions.bases',
+           'synsets.pos', 'synsets.offset', 'synsets.starts', 'lemmas.names',
+           'synsets.pointers.starts', 'synsets.pointers.targets', 'synsets.pointers.symbols',
+           'lemmas.pointers.starts', 'lemmas.pointers.targets', 'lemmas.pointers.symbols', 'symbols']
+
+
+def _to_bytes(word):
+    return word.encode('utf-8') if isinstance(word, unicode) else word
+
+
+class _Strings:
+    # the sorted strings of the lexicon, looked up by binary search
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        return self._data[self._offsets[idx]:self._offsets[idx + 1]].tostring()
+
+    def find(self, word):
+        # the index of the given string or -1 if it is not in the lexicon
+        idx = bisect.bisect_left(self, word)
+        return idx if idx < len(self) and self[idx] == word else -1
+
+
+class Synset(object):
+    __slots__ = ('_lexicon', '_id')
+
+    def __init__(self, lexicon, synset_id):
+        self._lexicon = lexicon
+        self._id = synset_id
+
+    @property
+    def pos(self):
+        return self._lexicon._synset_pos[self._id]
+
+    @property
+    def offset(self):
+        return int(self._lexicon._arrays['synsets.offset'][self._id])
+
+    @property
+    def lemmas(self):
+        return [Lemma(self._lexicon, idx) for idx in self._lexicon._synset_lemmas(self._id)]
+
+    @property
+    def lemma_names(self):
+        return [lemma.name for lemma in self.lemmas]
+
+    @property
+    def name(self):
+        # the same "<lemma>.<pos>.<number>" name as NLTK gives the synset
+        lemma_name = self.lemmas[0].name.lower()
+        offsets = [synset.offset for synset in self._lexicon._index_synsets(lemma_name, ADJ if self.pos == ADJ_SAT else self.pos)]
+        return '%s.%s.%02i' % (lemma_name, self.pos, offsets.index(self.offset) + 1)
+
+    def _related(self, symbol):
+        return [Synset(self._lexicon, target) for target in self._lexicon._pointers('synsets', self._id, symbol)]
+
+    def hypernym_distances(self, distance=0):
+        distances = set([(self, distance)])
+        for hypernym in self.hypernyms() + self.instance_hypernyms():
+            distances |= hypernym.hypernym_distances(distance + 1)
+        return distances
+
+    def __eq__(self, other):
+        return isinstance(other, Synset) and self._id == other._id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._id)
+
+    def __repr__(self):
+        return 'Synset(%r)' % self.name
+
+
+class Lemma(object):
+    __slots__ = ('_lexicon', '_idx')
+
+    def __init__(self, lexicon, idx):
+        self._lexicon = lexicon
+        self._idx = idx
+
+    @property
+    def name(self):
+        return self._lexicon._lemma_name(self._idx)
+
+    @property
+    def synset(self):
+        return Synset(self._lexicon, self._lexicon._lemma_synset(self._idx))
+
+    def _related(self, symbol):
+        return [Lemma(self._lexicon, target) for target in self._lexicon._pointers('lemmas', self._idx, symbol)]
+
+    def __eq__(self, other):
+        return isinstance(other, Lemma) and self._idx == other._idx
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._idx)
+
+    def __repr__(self):
+        return 'Lemma(%r)' % (self.synset.name + '.' + self.name)
+
+
+def _add_pointer_methods(cls, pointers):
+    for method, symbol in pointers.items():
+        setattr(cls, method, lambda self, symbol=symbol: self._related(symbol))
+
+_add_pointer_methods(Synset, SYNSET_POINTERS)
+_add_pointer_methods(Lemma, LEMMA_POINTERS)
+
+
+class Lexicon:
+    """
+    The lexicon saved in the given directory by build(), with the synsets(),
+    morphy() and other methods of NLTK's WordNet corpus reader.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._arrays = {}
+        for name in _ARRAYS:
+            filename = os.path.join(path, name + '.npy')
+            if not os.path.exists(filename):
+                raise IOError('the path {} does not contain a WordNet lexicon'.format(path))
+            # plain arrays are indexed faster than numpy.memmap ones
+            self._arrays[name] = np.asarray(np.load(filename, mmap_mode='r'))
+        self._strings = _Strings(self._arrays['strings.data'], self._arrays['strings.offsets'])
+        self._symbol_names = self._arrays['symbols'].tolist()
+        self._synset_pos = self._arrays['synsets.pos'].tostring()
+        # the results of synsets() and _morphy() and the lemmas, lemma names
+        # and pointers of the synsets and lemmas seen so far, since reading
+        # them from the arrays is much slower than looking them up in a dict
+        self._synsets_cache = {}
+        self._morphy_cache = {}
+        self._lemmas_cache = {}
+        self._names_cache = {}
+        self._pointers_cache = {'synsets': {}, 'lemmas': {}}
+
+    def _synset_lemmas(self, synset_id):
+        if synset_id not in self._lemmas_cache:
+            starts = self._arrays['synsets.starts']
+            self._lemmas_cache[synset_id] = range(starts[synset_id], starts[synset_id + 1])
+        return self._lemmas_cache[synset_id]
+
+    def _lemma_name(self, idx):
+        if idx not in self._names_cache:
+            self._names_cache[idx] = self._strings[self._arrays['lemmas.names'][idx]]
+        return self._names_cache[idx]
+
+    def _pointers(self, kind, idx, symbol):
+        cache = self._pointers_cache[kind]
+        if idx not in cache:
+            # the targets of the pointers of the synset or lemma by symbol
+            starts = self._arrays[kind + '.pointers.starts']
+            start, end = starts[idx], starts[idx + 1]
+            targets = {}
+            for target, symbol_id in zip(self._arrays[kind + '.pointers.targets'][start:end].tolist(),
+                                         self._arrays[kind + '.pointers.symbols'][start:end].tolist()):
+                targets.setdefault(self._symbol_names[symbol_id], []).append(target)
+            cache[idx] = targets
+        return cache[idx].get(symbol, [])
+
+    def _lemma_synset(self, idx):
+        return int(np.searchsorted(self._arrays['synsets.starts'], idx, side='right')) - 1
+
+    def _lookup(self, kind, values, word, pos):
+        # the values of the given word and part of speech in a CSR array
+        idx = self._strings.find(word)
+        if idx < 0:
+            return []
+        key = idx * len(POS_LIST) + POS_LIST.index(pos)
+        starts = self._arrays[kind + '.starts']
+        return self._arrays[kind + '.' + values][starts[key]:starts[key + 1]].tolist()
+
+    def _index_synsets(self, form, pos):
+        return [Synset(self, synset_id) for synset_id in self._lookup('index', 'synsets', form, pos)]
+
+    def _in_index(self, form, pos):
+        return len(self._lookup('index', 'synsets', form, pos)) > 0
+
+    def _morphy(self, form, pos):
+        key = (form, pos)
+        if key not in self._morphy_cache:
+            self._morphy_cache[key] = self._compute_morphy(form, pos)
+        return self._morphy_cache[key]
+
+    def _compute_morphy(self, form, pos):
+        substitutions = MORPHOLOGICAL_SUBSTITUTIONS[pos]
+
+        def apply_rules(forms):
+            return [form[:-len(old)] + new
+                    for form in forms
+                    for old, new in substitutions
+                    if form.endswith(old)]
+
+        def filter_forms(forms):
+            result = []
+            seen = set()
+            for form in forms:
+                if self._in_index(form, pos) and form not in seen:
+                    result.append(form)
+                    seen.add(form)
+            return result
+
+        # 0. Check the exception lists
+        exceptions = [self._strings[base] for base in self._lookup('exceptions', 'bases', form, pos)]
+        if exceptions:
+            return filter_forms([form] + exceptions)
+
+        # 1. Apply rules once to the input to get y1, y2, y3, etc.
+        forms = apply_rules([form])
+
+        # 2. Return all that are in the database (and check the original too)
+        results = filter_forms([form] + forms)
+        if results:
+            return results
+
+        # 3. If there are no matches, keep applying rules until we find a match
+        while forms:
+            forms = apply_rules(forms)
+            results = filter_forms(forms)
+            if results:
+                return results
+        return []
+
+    def morphy(self, form, pos=None):
+        form = _to_bytes(form)
+        for p in POS_LIST if pos is None else [pos]:
+            analyses = self._morphy(form, p)
+            if analyses:
+                return analyses[0]
+        return None
+
+    def synsets(self, lemma, pos=None):
+        lemma = _to_bytes(lemma).lower()
+        key = (lemma, pos)
+        if key not in self._synsets_cache:
+            self._synsets_cache[key] = [synset_id
+                                        for p in (POS_LIST if pos is None else [pos])
+                                        for form in self._morphy(lemma, p)
+                                        for synset_id in self._lookup('index', 'synsets', form, p)]
+        return [Synset(self, synset_id) for synset_id in self._synsets_cache[key]]
+
+
+def _csr(lists):
+    # the starts and the concatenated values of a list of lists
+    starts = np.zeros(len(lists) + 1, dtype=np.int32)
+    starts[1:] = np.cumsum([len(values) for values in lists])
+    values = [value for values in lists for value in values]
+    return starts, values
+
+
+def build(path, wordnet=None):
+    """
+    Build the lexicon from the given NLTK WordNet corpus reader (the default
+    nltk.corpus.wordnet) and save it in the given directory.
+    """
+    if wordnet is None:
+        from nltk.corpus import wordnet
+    synsets = list(wordnet.all_synsets())
+    # synsets are identified by their data file and offset, adjective
+    # satellites are in the same data file as adjectives
+    synset_ids = dict([((ADJ if synset.pos == ADJ_SAT else synset.pos, synset.offset), idx) for (idx, synset) in enumerate(synsets)])
+
+    def synset_id(synset):
+        return synset_ids[(ADJ if synset.pos == ADJ_SAT else synset.pos, synset.offset)]
+
+    lemma_starts, lemmas = _csr([synset.lemmas for synset in synsets])
+    lemma_ids = dict([((synset_id(lemma.synset), lemma.name), idx) for (idx, lemma) in enumerate(lemmas)])
+
+    index = wordnet._lemma_pos_offset_map
+    exceptions = wordnet._exception_map
+    strings = set([lemma.name for lemma in lemmas]) | set(index.keys())
+    for pos in POS_LIST:
+        for form, bases in exceptions[pos].items():
+            strings.add(form)
+            strings.update(bases)
+    strings = sorted([_to_bytes(string) for string in strings])
+    string_ids = dict([(string, idx) for (idx, string) in enumerate(strings)])
+
+    index_lists = []
+    exception_lists = []
+    for string in strings:
+        for pos in POS_LIST:
+            offsets = index[string].get(pos, []) if string in index else []
+            index_lists.append([synset_ids[(pos, offset)] for offset in offsets])
+            exception_lists.append([string_ids[_to_bytes(base)] for base in exceptions[pos].get(string, [])])
+
+    symbols = sorted(set(SYNSET_POINTERS.values()) | set(LEMMA_POINTERS.values()))
+    symbol_ids = dict([(symbol, idx) for (idx, symbol) in enumerate(symbols)])
+    synset_pointers = [sorted(set([(synset_id(target), symbol_ids[symbol])
+                                   for method, symbol in SYNSET_POINTERS.items()
+                                   for target in getattr(synset, method)()])) for synset in synsets]
+    lemma_pointers = [sorted(set([(lemma_ids[(synset_id(target.synset), target.name)], symbol_ids[symbol])
+                                  for method, symbol in LEMMA_POINTERS.items()
+                                  for target in getattr(lemma, method)()])) for lemma in lemmas]
+
+    arrays = {}
+    data = ''.join(strings)
+    arrays['strings.data'] = np.frombuffer(data, dtype=np.uint8) if data else np.zeros(0, dtype=np.uint8)
+    arrays['strings.offsets'] = np.cumsum([0] + [len(string) for string in strings]).astype(np.int64)
+    arrays['index.starts'], index_synsets = _csr(index_lists)
+    arrays['index.synsets'] = np.array(index_synsets, dtype=np.int32)
+    arrays['exceptions.starts'], exception_bases = _csr(exception_lists)
+    arrays['exceptions.bases'] = np.array(exception_bases, dtype=np.int32)
+    arrays['synsets.pos'] = np.array([ord(synset.pos) for synset in synsets], dtype=np.uint8)
+    arrays['synsets.offset'] = np.array([synset.offset for synset in synsets], dtype=np.int32)
+    arrays['synsets.starts'] = lemma_starts
+    arrays['lemmas.names'] = np.array([string_ids[_to_bytes(lemma.name)] for lemma in lemmas], dtype=np.int32)
+    for kind, pointers in [('synsets', synset_pointers), ('lemmas', lemma_pointers)]:
+        arrays[kind + '.pointers.starts'], values = _csr(pointers)
+        arrays[kind + '.pointers.targets'] = np.array([target for (target, symbol) in values], dtype=np.int32)
+        arrays[kind + '.pointers.symbols'] = np.array([symbol for (target, symbol) in values], dtype=np.uint8)
+    arrays['symbols'] = np.array(symbols)
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    for name in _ARRAYS:
+        np.save(os.path.join(path, name + '.npy'), arrays[name])
+    return len(synsets)
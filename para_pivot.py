@@ -0,0 +1,171 @@
+# Pivoting of translation rules into paraphrase rules in a single streaming
+# pass, instead of sorting the translation grammar and running the
+# BuildParaphraseGrammarWithPivots and AggregateParaphraseGrammarWithPivots
+# tools of joshua.jar with a sort before and after each (see README.md). The
+# translation rules are read from the gzipped files written by Thrax or by
+# para_extract, in the Joshua format with labeled features:
+#
+#   [X] ||| foreign phrase ||| English phrase ||| RarityPenalty=... SourcePhraseGivenTarget=... TargetPhraseGivenSource=... ...
+#
+# and the probability of each paraphrase e2 of each English phrase e1 is
+# p(e2|e1) = sum over the foreign phrases f of p(e2|f) * p(f|e1). The rules
+# are sorted twice with para_extsort, with bounded memory and sort runs in
+# parallel: first by foreign phrase so that all the English phrases of each
+# foreign phrase (pivot) can be paired up, and then by English phrase pair so
+# that the contributions of all the pivots of each pair can be summed up. The
+# resulting paraphrase rules come out sorted by source, as required by the
+# "index" command, in the format read by para_reader (see README.md) and can
+# either be written to a grammar file or indexed directly with the "pivot"
+# command.
+#
+# As with the joshua.jar tools, the translation rules that occur fewer than
+# min_count times or whose probabilities are below min_prob are left out and
+# only the top most probable paraphrases of each source are kept.
+#
+# Run it as: python para_pivot.py [options] <rule files> <grammar file>
+
+import argparse
+import gzip
+import itertools
+import math
+import sys
+
+import para_extsort
+import para_reader
+
+# the same defaults as BuildParaphraseGrammarWithPivots
+MIN_COUNT = 3
+MIN_PROB = 0.0001
+TOP_K = 25
+
+REQUIRED_FEATURES = ['RarityPenalty', 'SourcePhraseGivenTarget', 'TargetPhraseGivenSource']
+
+
+def _neg_log(prob):
+    return -math.log(prob) if prob < 1 else 0.0
+
+
+def parse_translation_rule(line):
+    """
+    Return the foreign phrase, the English phrase, the count, p(e|f) and
+    p(f|e) of the translation rule on the given line.
+    """
+    fields = line.rstrip('\n').split(' ||| ')
+    if len(fields) < 4:
+        raise ValueError('cannot parse translation rule: ' + line.strip())
+    features = dict([feature.split('=', 1) for feature in fields[3].split() if '=' in feature])
+    if any([name not in features for name in REQUIRED_FEATURES]):
+        raise ValueError('required features not present: ' + line.strip())
+    # exp(1 - count) is 0 for counts above about 745
+    rarity = float(features['RarityPenalty'])
+    count = 1 - math.log(rarity) if rarity > 0 else float('inf')
+    return fields[1], fields[2], count, math.exp(-float(features['TargetPhraseGivenSource'])), math.exp(-float(features['SourcePhraseGivenTarget']))
+
+
+def _translation_lines(files, min_count, min_prob):
+    # the translation rules to pivot, as lines that sort by foreign phrase
+    for filename in files:
+        infile = gzip.GzipFile(filename)
+        for line in infile:
+            f_phrase, e_phrase, count, e_given_f, f_given_e = parse_translation_rule(line)
+            # the counts are integers, up to rounding errors
+            if round(count) < min_count or e_given_f < min_prob or f_given_e < min_prob:
+                continue
+            yield '{}\t{}\t{!r}\t{!r}\n'.format(f_phrase, e_phrase, e_given_f, f_given_e)
+        infile.close()
+
+
+def _pivot_lines(translation_lines):
+    # the contributions of each pivot to the probabilities of the pairs of
+    # the English phrases it translates, as lines that sort by English phrase pair
+    for f_phrase, lines in itertools.groupby(translation_lines, key=lambda line: line.split('\t', 1)[0]):
+        translations = []
+        for line in lines:
+            e_phrase, e_given_f, f_given_e = line.rstrip('\n').split('\t')[1:]
+            translations.append((e_phrase, float(e_given_f), float(f_given_e)))
+        for e1, e1_given_f, f_given_e1 in translations:
+            for e2, e2_given_f, f_given_e2 in translations:
+                yield '{}\t{}\t{}\t{!r}\t{!r}\n'.format(e1, e2, f_phrase, e2_given_f * f_given_e1, e1_given_f * f_given_e2)
+
+
+def _aggregate(pivot_lines):
+    # the (e1, e2, p(e2|e1), p(e1|e2), [(pivot score, pivot)]) of each English phrase pair
+    for (e1, e2), lines in itertools.groupby(pivot_lines, key=lambda line: tuple(line.split('\t', 2)[:2])):
+        e2_given_e1 = 0.0
+        e1_given_e2 = 0.0
+        pivots = []
+        for line in lines:
+            f_phrase, score, reverse_score = line.rstrip('\n').split('\t')[2:]
+            e2_given_e1 += float(score)
+            e1_given_e2 += float(reverse_score)
+            pivots.append((float(score), f_phrase))
+        yield e1, e2, e2_given_e1, e1_given_e2, pivots
+
+
+def format_rule(e1, e2, e2_given_e1, e1_given_e2, pivots):
+    # the line of the paraphrase grammar for the given paraphrase rule, with
+    # the features read by para_reader and the pivots sorted by their scores
+    srclen = len(e1.split())
+    tgtlen = len(e2.split())
+    features = [0, 0, int(e1 == e2), _neg_log(e2_given_e1), _neg_log(e1_given_e2), 0, 0, srclen, tgtlen, tgtlen - srclen, 1, 0, 0, 0, 0, 0, 0]
+    pivots = '["' + '", "'.join(['{}:{!r}'.format(f_phrase, score) for (score, f_phrase) in sorted(pivots, reverse=True)]) + '"]'
+    return '[X] ||| {} ||| {} ||| {} ||| {}\n'.format(e1, e2, ' '.join([repr(float(x)) for x in features]), pivots)
+
+
+def pivot_lines(files, min_count=MIN_COUNT, min_prob=MIN_PROB, top=TOP_K, max_lines=para_extsort.MAX_LINES, processes=None, tmpdir=None):
+    """
+    Yield the lines of the paraphrase grammar pivoted from the translation
+    rules in the given files, sorted by source and then by target. If top
+    is 0, all the paraphrases of each source are kept. The arguments
+    max_lines, processes and tmpdir are passed on to para_extsort.sort_lines().
+    """
+    translations = para_extsort.sort_lines(_translation_lines(files, min_count, min_prob), max_lines, processes, tmpdir)
+    pivoted = para_extsort.sort_lines(_pivot_lines(translations), max_lines, processes, tmpdir)
+    for e1, rules in itertools.groupby(_aggregate(pivoted), key=lambda rule: rule[0]):
+        rules = list(rules)
+        if top > 0 and len(rules) > top:
+            # keep the most probable paraphrases in the same order
+            kept = set([rule[1] for rule in sorted(rules, key=lambda rule: (-rule[2], rule[1]))[:top]])
+            rules = [rule for rule in rules if rule[1] in kept]
+        for rule in rules:
+            yield format_rule(*rule)
+
+
+def pivot_rules(files, **kwargs):
+    """
+    Yield the paraphrase rules pivoted from the translation rules in the
+    given files as para_reader.ParaReader does, e.g., for indexing them.
+    The keyword arguments are the same as for pivot_lines().
+    """
+    for line in pivot_lines(files, **kwargs):
+        yield para_reader.parse_line(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pivot translation rules into a sorted paraphrase grammar.')
+    parser.add_argument('rules', help='the gzipped translation rule file(s): a file, a directory or a quoted glob pattern')
+    parser.add_argument('grammar', help='the gzipped paraphrase grammar file to write')
+    parser.add_argument('--min-count', type=int, default=MIN_COUNT, help='the minimum count of the translation rules (default: %(default)s)')
+    parser.add_argument('--min-prob', type=float, default=MIN_PROB, help='the minimum probabilities of the translation rules (default: %(default)s)')
+    parser.add_argument('--top', type=int, default=TOP_K, help='the number of paraphrases kept for each source, 0 for all (default: %(default)s)')
+    parser.add_argument('-p', '--processes', type=int, help='the number of processes sorting in parallel (all the cores by default)')
+    parser.add_argument('-m', '--max-lines', type=int, default=para_extsort.MAX_LINES, help='the number of lines sorted in memory by each process (default: %(default)s)')
+    parser.add_argument('-T', '--tmpdir', help='the directory for the temporary files (the system default by default)')
+    args = parser.parse_args()
+
+    try:
+        files = para_reader.input_files(args.rules)
+        outfile = gzip.GzipFile(args.grammar, 'wb')
+        num_rules = 0
+        for line in pivot_lines(files, args.min_count, args.min_prob, args.top, args.max_lines, args.processes, args.tmpdir):
+            outfile.write(line)
+            num_rules += 1
+        outfile.close()
+    except (IOError, ValueError) as e:
+        sys.stderr.write('\n Error: {}.\n\n'.format(e))
+        sys.exit(1)
+    sys.stderr.write('\n Wrote {} paraphrase rules to {}.\n\n'.format(num_rules, args.grammar))
+
+
+if __name__ == '__main__':
+    main()
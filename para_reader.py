@@ -7,9 +7,44 @@
 # This class should return the following fields:
 #   source (text), target (text), identity (integer), srclen (integer), tgtlen (integer), lendiff [=tgtlen-srclen] (integer), pe2e1 (float), number of pivots (integer), pivots (list)
 
-# The class takes in a gzipped file as the only input.
+# The class takes in a gzipped file as the only input, which must be sorted by source.
+# The ShardedParaReader class returns the same fields for the rules in several gzipped
+# files in any order, e.g., the shards of a grammar written in parallel, which are
+# read in parallel and merge-sorted by source with para_extsort.
 
+import glob
 import gzip
+import os
+
+import para_extsort
+
+
+def input_files(path):
+    # the gzipped files given as a single file, a directory or a glob pattern
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*.gz')))
+    else:
+        files = sorted(glob.glob(path))
+    if not files:
+        raise IOError('no rule files found for {}'.format(path))
+    return files
+
+
+def parse_line(line):
+    # the fields of the paraphrase rule on the given line of a grammar file
+    head, src, tgt, features, pivots = line.split(' ||| ')
+    src = src.decode('utf-8')
+    tgt = tgt.decode('utf-8')
+    pivots = pivots.decode('utf-8')
+    src, tgt = map(unicode, [src, tgt])
+    features = features.split()
+    identity = int(float(features[2]))
+    pe2e1 = float(features[3])
+    srclen = int(float(features[7]))
+    tgtlen = int(float(features[8]))
+    lendiff = int(float(features[9]))
+    num_pivots = len(pivots.replace('["', '').replace('"]', '').replace('\n', '').split('", "'))
+    return (src, tgt, identity, srclen, tgtlen, lendiff, pe2e1, num_pivots, pivots)
 
 
 class ParaReader:
@@ -18,17 +53,23 @@ class ParaReader:
 
     def __iter__(self):
         for line in self._parafh:
-            head, src, tgt, features, pivots = line.split(' ||| ')
-            src = src.decode('utf-8')
-            tgt = tgt.decode('utf-8')
-            pivots = pivots.decode('utf-8')
-            src, tgt = map(unicode, [src, tgt])
-            features = features.split()
-            identity = int(float(features[2]))
-            pe2e1 = float(features[3])
-            srclen = int(float(features[7]))
-            tgtlen = int(float(features[8]))
-            lendiff = int(float(features[9]))
-            num_pivots = len(pivots.replace('["', '').replace('"]', '').replace('\n', '').split('", "'))
-            t = (src, tgt, identity, srclen, tgtlen, lendiff, pe2e1, num_pivots, pivots)
-            yield t
+            yield parse_line(line)
+
+
+def _sort_line(line):
+    # the line with its source in front, so that the lines sort by source
+    # and then by the whole rule, as with "sort -t'|' -k1,4" in the C locale
+    return line.split(' ||| ', 2)[1] + '\t' + line
+
+
+class ShardedParaReader:
+    def __init__(self, parafilenames, max_lines=para_extsort.MAX_LINES, processes=None, tmpdir=None):
+        self._parafilenames = parafilenames
+        self._max_lines = max_lines
+        self._processes = processes
+        self._tmpdir = tmpdir
+
+    def __iter__(self):
+        lines = para_extsort.sort_files(self._parafilenames, _sort_line, self._max_lines, self._processes, self._tmpdir)
+        for line in lines:
+            yield parse_line(line.split('\t', 1)[1])
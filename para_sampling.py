@@ -0,0 +1,191 @@
+# Sampling and ordering functions for paraquery analysis reports.
+# All of these work on paraphrase rules as returned by the database, i.e.,
+# tuples where rule[2] is pe2e1, the negative log of the probability.
+
+import math
+import random
+
+# all random samples are drawn from this generator so that they can be
+# made reproducible by setting a seed
+_random = random.Random()
+
+
+def set_seed(seed):
+    # a seed of None seeds the generator from the current time
+    _random.seed(seed)
+
+
+def random_key():
+    # a random number from the same generator, e.g., for ordering rules randomly in SQL
+    return _random.random()
+
+
+def sort_by_prob(rules):
+    # sort the rules by decreasing probability, i.e., increasing pe2e1.
+    # The sort is stable so rules with the same probability keep their order.
+    return sorted(rules, key=lambda rule: float(rule[2]))
+
+
+def scores_at_percentiles(sorted_scores, percentiles):
+    # compute the scores at the given percentiles of a list of scores that is
+    # already sorted in increasing order, interpolating linearly between
+    # the two closest scores (the same as para_stats.Distribution)
+    res = []
+    last = len(sorted_scores) - 1
+    for per in percentiles:
+        idx = per / 100.0 * last
+        lower = int(idx)
+        fraction = idx - lower
+        if fraction == 0:
+            res.append(sorted_scores[lower])
+        else:
+            # the weighted average of the two scores computed in the same order as para_stats
+            weights = (lower + 1 - idx, idx - lower)
+            res.append((sorted_scores[lower] * weights[0] + sorted_scores[lower + 1] * weights[1]) / (weights[0] + weights[1]))
+    return res
+
+
+def sample(rules, sample_len):
+    # draw a random sample of up to sample_len rules
+    if len(rules) <= sample_len:
+        return list(rules)
+    return _random.sample(rules, sample_len)
+
+
+def stratified_sample(strata, stratum_sample_len):
+    # draw a random sample of up to stratum_sample_len rules from each of the
+    # strata and return the union of these samples without duplicate rules
+    res = []
+    seen = set()
+    for stratum in strata:
+        for rule in sample(stratum, stratum_sample_len):
+            if rule not in seen:
+                seen.add(rule)
+                res.append(rule)
+    return res
+
+
+def _matching_rowids(conn, conditional_part):
+    return [rowid for (rowid,) in conn.execute('select rowid from paraphrase {}'.format(conditional_part or ''))]
+
+
+def _read_rules(conn, rowids, condition, batch_size, annotate):
+    # the (rowid, rule) of the rules with the given rowids that match the condition
+    sql = 'select rowid, source, target, pe2e1, relation, pivotnum, pivots, distance from paraphrase where rowid in ({})' + condition
+    keys = sorted(rowids)
+    res = []
+    for i in range(0, len(keys), batch_size):
+        batch = keys[i:i + batch_size]
+        if annotate is not None:
+            annotate(conn, batch)
+        res.extend([(row[0], tuple(row[1:])) for row in conn.execute(sql.format(', '.join(map(str, batch))))])
+    return res
+
+
+def _sample_strata(conn, condition, num, max_rowid, max_rounds, min_hit_rate, batch_size, annotate):
+    # draw one of the rules matching the condition from each of num blocks of
+    # consecutive rowids, drawing new rowids within the blocks whose rowids
+    # did not match. Returns None if the rules match too rarely for this.
+    bounds = [(i * max_rowid // num + 1, (i + 1) * max_rowid // num) for i in range(num)]
+    tried = [set() for bound in bounds]
+    found = {}
+    num_tried = 0
+    num_hits = 0
+    hit_rate = 1.0
+    for _ in range(max_rounds):
+        pending = [i for i in range(num) if i not in found]
+        if not pending:
+            break
+        if hit_rate < min_hit_rate:
+            return None
+        # draw as many new rowids in each block as are needed to find one
+        # matching rule at the rate at which the rowids drawn so far matched
+        blocks = {}
+        for i in pending:
+            (low, high) = bounds[i]
+            num_draws = min(int(math.ceil(1 / hit_rate)), high - low + 1 - len(tried[i]))
+            if num_draws == 0:
+                # no rule of the block matches
+                return None
+            while num_draws > 0:
+                rowid = _random.randint(low, high)
+                if rowid not in tried[i]:
+                    tried[i].add(rowid)
+                    blocks[rowid] = i
+                    num_draws -= 1
+        hits = _read_rules(conn, blocks.keys(), condition, batch_size, annotate)
+        num_tried += len(blocks)
+        num_hits += len(hits)
+        # one of the rules found in each block is kept at random
+        _random.shuffle(hits)
+        for (rowid, rule) in hits:
+            found.setdefault(blocks[rowid], rule)
+        hit_rate = float(num_hits) / num_tried
+    if len(found) < num:
+        return None
+    return [found[i] for i in range(num)]
+
+
+def sample_rules(conn, conditional_part, sample_len, stratified=False, max_rounds=20, min_hit_rate=0.05, batch_size=500, annotate=None):
+    """
+    Draw a random sample of up to sample_len of the rules selected by the
+    given where clause. The sample has sample_len rules whenever at least
+    that many rules match. Random rowids are looked up so that only the
+    sampled rules are read from the database: each round draws enough new
+    rowids for the rules still missing at the rate at which the rowids drawn
+    so far matched. If this rate falls below min_hit_rate or the sample is
+    still incomplete after max_rounds rounds, the missing rules are drawn
+    from the list of the rowids of all the matching rules instead.
+
+    If stratified is True, the rowids are divided into sample_len blocks of
+    consecutive rowids (i.e., of rules grouped by source) and one matching
+    rule is drawn from each, drawing new random rowids within the blocks in
+    the same way. If the rules match too rarely for this or a block has no
+    matching rule, the list of the rowids of the matching rules is divided
+    into sample_len strata of equal size instead. If annotate is given, it is called with the connection
+    and each batch of rowids before their rules are read, e.g., to fill in
+    their WordNet columns (see para_annotate). The where clause must not
+    depend on columns that annotate fills in.
+    """
+    condition = ' and ({})'.format(conditional_part[len('where '):]) if conditional_part else ''
+    max_rowid = conn.execute('select max(rowid) from paraphrase').fetchone()[0] or 0
+    sample_len = min(sample_len, max_rowid)
+    if stratified:
+        rules = _sample_strata(conn, condition, sample_len, max_rowid, max_rounds, min_hit_rate, batch_size, annotate)
+        if rules is not None:
+            return rules
+        # too few of the rules match for random rowids to find them
+        rowids = _matching_rowids(conn, conditional_part)
+        num = min(sample_len, len(rowids))
+        drawn = [rowids[_random.randint(i * len(rowids) // num, (i + 1) * len(rowids) // num - 1)] for i in range(num)]
+        return [rule for (rowid, rule) in _read_rules(conn, drawn, '', batch_size, annotate)]
+
+    tried = set()
+    found = []
+    num_hits = 0
+    hit_rate = 1.0
+    for _ in range(max_rounds):
+        missing = sample_len - len(found)
+        if missing == 0 or len(tried) == max_rowid or hit_rate < min_hit_rate:
+            break
+        # draw new rowids, never trying the same rowid twice
+        num = min(int(math.ceil(missing / hit_rate)), max_rowid - len(tried))
+        rowids = []
+        while len(rowids) < num:
+            rowid = _random.randint(1, max_rowid)
+            if rowid not in tried:
+                tried.add(rowid)
+                rowids.append(rowid)
+        hits = _read_rules(conn, rowids, condition, batch_size, annotate)
+        num_hits += len(hits)
+        # any extra rules are left out at random, not by rowid
+        _random.shuffle(hits)
+        found.extend(hits[:missing])
+        hit_rate = float(num_hits) / len(tried)
+    if len(found) < sample_len and len(tried) < max_rowid:
+        # too few of the rules match for random rowids to find them
+        found_rowids = set([rowid for (rowid, rule) in found])
+        rowids = [rowid for rowid in _matching_rowids(conn, conditional_part) if rowid not in found_rowids]
+        rowids = sample(rowids, sample_len - len(found))
+        found.extend(_read_rules(conn, rowids, '', batch_size, annotate))
+    return [rule for (rowid, rule) in found]
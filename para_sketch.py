@@ -0,0 +1,181 @@
+# Mergeable sketches used by the approximate analysis ("analyze approx"),
+# which streams the rules through them once instead of keeping all of the
+# scores in memory. All of the sketches use a bounded amount of memory that
+# does not depend on the number of rules added to them.
+
+import math
+
+import numpy as np
+
+import para_sampling
+
+
+class QuantileSketch:
+    """
+    A quantile sketch with a relative error guarantee (DDSketch). Positive
+    values are counted in logarithmically sized buckets so that any quantile
+    it returns is within relative_accuracy of the true value, e.g., within 1%
+    for the default accuracy. If there are more than max_buckets buckets, the
+    lowest ones are collapsed, which only affects the accuracy of the
+    quantiles of the very smallest values.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('the relative accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets = {}
+        # values that are too small to be put in a bucket, e.g., zero
+        self._zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, count=1):
+        if value < 1e-300:
+            self._zero_count += count
+        else:
+            idx = int(math.ceil(math.log(value) / self._log_gamma))
+            self._buckets[idx] = self._buckets.get(idx, 0) + count
+            if len(self._buckets) > self.max_buckets:
+                self._collapse()
+        self.count += count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # merge the two lowest buckets
+    def _collapse(self):
+        lowest, second = sorted(self._buckets.keys())[:2]
+        self._buckets[second] += self._buckets.pop(lowest)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('cannot merge sketches with different accuracies')
+        for idx, count in other._buckets.items():
+            self._buckets[idx] = self._buckets.get(idx, 0) + count
+        while len(self._buckets) > self.max_buckets:
+            self._collapse()
+        self._zero_count += other._zero_count
+        self.count += other.count
+        for value in [other.min, other.max]:
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        # the value with rank q * (count - 1) in the sorted values, 0 <= q <= 1
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        cumulative = self._zero_count
+        if cumulative > rank:
+            return self.min
+        for idx in sorted(self._buckets.keys()):
+            cumulative += self._buckets[idx]
+            if cumulative > rank:
+                value = 2 * self._gamma ** idx / (self._gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile(self, per):
+        return self.quantile(per / 100.0)
+
+
+class Histogram:
+    """
+    A histogram with fixed bins, which is mergeable as it is, given a
+    function that maps each value to its bin (or to None if it is outside
+    of the histogram limits) such as para_dbanalysis.BinFunction.
+    """
+
+    def __init__(self, bin_function):
+        self._bin_function = bin_function
+        self.counts = [0] * bin_function.num_bins
+
+    def add(self, value, count=1):
+        idx = self._bin_function(value)
+        if idx is not None:
+            self.counts[idx] += count
+
+    def merge(self, other):
+        self.counts = [x + y for (x, y) in zip(self.counts, other.counts)]
+
+    # the (counts, lower limit, bin size) tuple used in analysis summaries
+    def histogram(self):
+        return (list(self.counts), self._bin_function.lower, self._bin_function.binsize)
+
+
+class Reservoir:
+    """
+    A uniform random sample of up to size items from a stream of items of
+    unknown length (reservoir sampling). The random numbers are drawn from
+    para_sampling so that the samples are reproducible with a seed.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.items = []
+        self.count = 0
+
+    def add(self, item):
+        self.count += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            idx = int(para_sampling.random_key() * self.count)
+            if idx < self.size:
+                self.items[idx] = item
+
+
+class CountMinSketch:
+    """
+    Approximate counts of the keys added to it (count-min sketch) in a fixed
+    table of depth rows of width counters. The estimated count of a key is
+    never lower than its true count and is higher by at most about
+    e/width of the total count with high probability. Keys are added in
+    batches of hashable keys and their counts, e.g., collections.Counter.
+    """
+
+    def __init__(self, width=2 ** 20, depth=4):
+        # the width must be a power of two for multiply-shift hashing
+        self._bits = int(math.ceil(math.log(width, 2)))
+        self.width = 2 ** self._bits
+        self.depth = depth
+        self._table = np.zeros((depth, self.width), dtype=np.uint32)
+        # odd multipliers of the hash functions of the rows, which are the
+        # same for all sketches so that sketches can be merged
+        state = np.random.RandomState(12345)
+        self._multipliers = (state.randint(0, 2 ** 31, size=depth).astype(np.uint64) << np.uint64(32)) | \
+            state.randint(0, 2 ** 31, size=depth).astype(np.uint64) | np.uint64(1)
+        self.total = 0
+
+    def _columns(self, keys):
+        hashes = np.array([hash(key) for key in keys], dtype=np.int64).view(np.uint64)
+        with np.errstate(over='ignore'):
+            return [(hashes * multiplier) >> np.uint64(64 - self._bits) for multiplier in self._multipliers]
+
+    def update(self, counts):
+        if not counts:
+            return
+        keys = list(counts.keys())
+        values = np.array([counts[key] for key in keys], dtype=np.uint32)
+        for row, columns in enumerate(self._columns(keys)):
+            np.add.at(self._table[row], columns.astype(np.intp), values)
+        self.total += int(values.sum())
+
+    def estimates(self, keys):
+        if not keys:
+            return []
+        rows = [self._table[row][columns.astype(np.intp)] for row, columns in enumerate(self._columns(keys))]
+        return np.min(rows, axis=0).tolist()
+
+    def merge(self, other):
+        if other.width != self.width or other.depth != self.depth:
+            raise ValueError('cannot merge sketches of different sizes')
+        self._table += other._table
+        self.total += other.total
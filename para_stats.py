@@ -0,0 +1,76 @@
+# The statistics of score distributions used in the analysis reports. A
+# distribution is sorted once and all of its histograms, scores at
+# percentiles and percentiles of scores are then computed with binary
+# searches on the sorted values. The results are exactly the same as those
+# of scipy.stats.histogram(), scipy.stats.scoreatpercentile() and
+# scipy.stats.percentileofscore(kind='rank'), which these replace.
+
+import numpy as np
+
+
+def percentiles_of_scores(below, at, size):
+    # the percentiles of scores given the number of values below and equal
+    # to each of them, computed as by scipy.stats.percentileofscore()
+    percentiles = []
+    for left, equal in zip(below, at):
+        if equal > 0:
+            percentiles.append(((left + 1 + left + equal) / 2.0 / size) * 100.0)
+        else:
+            percentiles.append((left / float(size)) * 100.0)
+    return percentiles
+
+
+class Distribution:
+    """
+    A distribution of values, e.g., the probabilities of a set of rules,
+    sorted once when it is created.
+    """
+
+    def __init__(self, values):
+        self.values = np.sort(np.asarray(values, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.values)
+
+    def histogram(self, num_bins, limits):
+        """
+        Return the (counts, lower limit, bin size) of the histogram with the
+        given number of equal bins between the limits, where each bin
+        includes its lower edge and the last one also its upper edge.
+        Values outside of the limits are not counted.
+        """
+        first_edge, last_edge = limits
+        if first_edge == last_edge:
+            first_edge -= 0.5
+            last_edge += 0.5
+        edges = np.linspace(first_edge, last_edge, num_bins + 1)
+        starts = np.searchsorted(self.values, edges[:-1], side='left')
+        end = np.searchsorted(self.values, edges[-1], side='right')
+        counts = np.diff(np.append(starts, end)).astype(np.float64)
+        return (counts, limits[0], edges[1] - edges[0])
+
+    def scores_at_percentiles(self, percentiles):
+        # the values at the given percentiles, interpolating linearly
+        # between the two closest values in the same order as scipy
+        if len(self.values) == 0:
+            return [np.nan] * len(percentiles)
+        idx = np.asarray(percentiles, dtype=np.float64) / 100.0 * (len(self.values) - 1)
+        lower = idx.astype(np.intp)
+        upper = np.minimum(lower + 1, len(self.values) - 1)
+        weights = (lower + 1 - idx, idx - lower)
+        interpolated = (self.values[lower] * weights[0] + self.values[upper] * weights[1]) / (weights[0] + weights[1])
+        return list(np.where(idx == lower, self.values[lower], interpolated))
+
+    def percentiles_of_scores(self, scores):
+        # the percentile ranks of the given scores in the distribution
+        scores = np.asarray(scores, dtype=np.float64)
+        below = np.searchsorted(self.values, scores, side='left')
+        at = np.searchsorted(self.values, scores, side='right') - below
+        return percentiles_of_scores(below.tolist(), at.tolist(), len(self.values))
+
+
+def as_distribution(values):
+    # a Distribution of the values unless they already are one
+    if isinstance(values, Distribution):
+        return values
+    return Distribution(values)
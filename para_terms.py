@@ -0,0 +1,272 @@
+# Extraction of the most frequent terms of a domain text for "analyze using
+# text", i.e., the most frequent unigrams and the bigrams and trigrams with
+# the highest PMI that occur at least MIN_NGRAM_FREQ times. The text is read
+# and tokenized in chunks of lines by a pool of processes and the n-gram
+# counts of the chunks are merged with a bounded amount of memory: the words
+# and n-grams are counted exactly only while there are at most max_ngrams of
+# them and, otherwise, they are first counted approximately in count-min
+# sketches and then exactly in a second pass, but only for those that may
+# occur often enough and, of those, at most the max_ngrams / 3 of each kind
+# with the highest estimated counts. The terms are the same as those of the
+# NLTK collocation finders run on the whole text tokenized at once unless
+# there are too many n-grams that may occur often enough.
+
+import collections
+import heapq
+import math
+import multiprocessing
+import os
+
+import nltk
+from para_sketch import CountMinSketch
+
+MIN_NGRAM_FREQ = 3
+# the approximate number of bytes of text in each chunk
+CHUNK_SIZE = 8 * 1024 * 1024
+# the number of distinct n-grams above which they are counted in sketches
+MAX_NGRAMS = 4000000
+
+# Each chunk except the first and the last is tokenized with a placeholder
+# line before and after it so that the tokenizer rules that only apply at the
+# start or the end of the text, e.g., splitting off a final period, are not
+# applied at the chunk boundaries, which are all line boundaries.
+_PLACEHOLDER = 'x'
+
+
+def chunk_offsets(filename, chunk_size=CHUNK_SIZE):
+    # the (start, end) byte offsets of the chunks, which end at line boundaries
+    size = os.path.getsize(filename)
+    offsets = []
+    start = 0
+    f = open(filename, 'rb')
+    while start < size:
+        f.seek(start + chunk_size)
+        f.readline()
+        end = min(f.tell(), size)
+        offsets.append((start, end))
+        start = end
+    f.close()
+    return offsets
+
+
+def _tokenize_chunk(filename, start, end, first, last):
+    f = open(filename, 'rb')
+    f.seek(start)
+    text = f.read(end - start)
+    f.close()
+    if not first:
+        text = _PLACEHOLDER + '\n' + text
+    if not last:
+        text = text + _PLACEHOLDER
+    tokens = nltk.word_tokenize(text)
+    tokens = tokens[(0 if first else 1):(len(tokens) if last else -1)]
+    # assume the db is lowercased
+    return [token.lower() for token in tokens]
+
+
+def _count_ngrams(tokens, bigrams, trigrams):
+    # count the n-grams the way the NLTK finders do, which do not count
+    # bigrams of the same word
+    for i in range(len(tokens) - 1):
+        if tokens[i] != tokens[i + 1]:
+            bigrams[(tokens[i], tokens[i + 1])] += 1
+    for i in range(len(tokens) - 2):
+        trigrams[(tokens[i], tokens[i + 1], tokens[i + 2])] += 1
+
+
+def _count_boundary_ngrams(last_tokens, first_tokens, bigrams, trigrams):
+    # count the n-grams that span the boundary between the last tokens of
+    # the text so far and the first tokens of the next chunk
+    tokens = last_tokens + first_tokens
+    boundary = len(last_tokens)
+    for i in range(max(boundary - 1, 0), min(boundary, len(tokens) - 1)):
+        if tokens[i] != tokens[i + 1]:
+            bigrams[(tokens[i], tokens[i + 1])] += 1
+    for i in range(max(boundary - 2, 0), min(boundary, len(tokens) - 2)):
+        trigrams[(tokens[i], tokens[i + 1], tokens[i + 2])] += 1
+
+
+def _chunk_counts(args):
+    filename, start, end, first, last = args
+    tokens = _tokenize_chunk(filename, start, end, first, last)
+    bigrams = collections.Counter()
+    trigrams = collections.Counter()
+    _count_ngrams(tokens, bigrams, trigrams)
+    # the first and last two tokens are needed to count the n-grams that
+    # span the chunk boundaries
+    return collections.Counter(tokens), bigrams, trigrams, tokens[:2], tokens[-2:]
+
+
+class _TopCounts:
+    """
+    Exact counts of the keys whose estimated counts in the given sketch are
+    the highest and at least min_count, for at most max_keys keys. Whenever
+    there are more, the keys with the lowest estimates are dropped and keys
+    with estimates that low are not counted any more. Since the estimates are
+    those of the whole text, a key that is kept is counted from its first
+    occurrence, so all the counts are exact.
+    """
+
+    def __init__(self, sketch, max_keys, min_count):
+        self.counts = {}
+        self._sketch = sketch
+        self._estimates = {}
+        self._max_keys = max_keys
+        self._threshold = min_count
+
+    def update(self, batch):
+        new_keys = [key for key in batch if key not in self.counts]
+        for key, estimate in zip(new_keys, self._sketch.estimates(new_keys)):
+            if estimate >= self._threshold:
+                self.counts[key] = 0
+                self._estimates[key] = estimate
+        for key, count in batch.iteritems():
+            if key in self.counts:
+                self.counts[key] += count
+        if len(self.counts) > self._max_keys:
+            self._threshold = sorted(self._estimates.itervalues(), reverse=True)[self._max_keys // 2] + 1
+            for key in [key for (key, estimate) in self._estimates.iteritems() if estimate < self._threshold]:
+                del self.counts[key]
+                del self._estimates[key]
+
+
+class _NgramCounts:
+    """
+    The word and n-gram counts of the text merged from the counts of its
+    chunks, which must be added in order along with the fraction of the text
+    read so far. The words and n-grams are counted exactly until there are
+    more than max_ngrams distinct ones, after which they are only counted in
+    count-min sketches sized for the total count estimated for the whole text,
+    with at most about max_ngrams counters in each row. Given the sketches of
+    a previous pass, the words and n-grams are counted exactly again but only
+    up to max_ngrams / 3 of each kind, those with the highest estimated counts
+    (which must be at least min_freq for n-grams).
+    """
+
+    def __init__(self, max_ngrams, sketches=None, min_freq=MIN_NGRAM_FREQ):
+        self.max_ngrams = max_ngrams
+        self.min_freq = min_freq
+        self.num_tokens = 0
+        self.sketches = None
+        self._filters = sketches
+        if sketches is None:
+            self._counts = [collections.Counter(), collections.Counter(), collections.Counter()]
+        else:
+            max_keys = max(1, max_ngrams // 3)
+            self._counts = [_TopCounts(sketches[0], max_keys, 1)] + [_TopCounts(sketch, max_keys, min_freq) for sketch in sketches[1:]]
+        self._last_tokens = []
+
+    def add(self, counts, fraction):
+        words, bigrams, trigrams, first_tokens, last_tokens = counts
+        self.num_tokens += sum(words.itervalues())
+        _count_boundary_ngrams(self._last_tokens, first_tokens, bigrams, trigrams)
+        self._last_tokens = (self._last_tokens + last_tokens)[-2:]
+        batches = [words, bigrams, trigrams]
+        if self._filters is None and self.sketches is None and \
+                sum([len(counter) for counter in self._counts]) + sum([len(batch) for batch in batches]) > self.max_ngrams:
+            self._start_sketches(batches, fraction)
+        if self.sketches is not None:
+            for sketch, batch in zip(self.sketches, batches):
+                sketch.update(batch)
+        else:
+            for counter, batch in zip(self._counts, batches):
+                counter.update(batch)
+
+    def _start_sketches(self, batches, fraction):
+        # the sketches are wide enough for the estimates of the keys that do
+        # not occur min_freq times to be lower than that, if that takes at
+        # most about max_ngrams counters
+        self.sketches = []
+        for counter, batch in zip(self._counts, batches):
+            total = (sum(counter.itervalues()) + sum(batch.itervalues())) / max(fraction, 1e-6)
+            width = min(max(4 * math.e * total / self.min_freq, 2 ** 16), self.max_ngrams)
+            sketch = CountMinSketch(width=width)
+            sketch.update(counter)
+            self.sketches.append(sketch)
+        self._counts = None
+
+    def exact(self):
+        return self.sketches is None
+
+    def words(self):
+        return self._counts[0] if self._filters is None else self._counts[0].counts
+
+    def bigrams(self):
+        return self._counts[1] if self._filters is None else self._counts[1].counts
+
+    def trigrams(self):
+        return self._counts[2] if self._filters is None else self._counts[2].counts
+
+    def word_count(self, word):
+        # the exact count of the word or, if it was not counted, its estimate
+        words = self.words()
+        if word in words or self._filters is None:
+            return words.get(word, 0)
+        return self._filters[0].estimates([word])[0]
+
+
+def _map_chunks(offsets, filename, processes):
+    # yield the counts of the chunks in order, computing the counts of as
+    # many chunks at a time as there are processes
+    tasks = [(filename, start, end, i == 0, i == len(offsets) - 1) for (i, (start, end)) in enumerate(offsets)]
+    if processes == 1 or len(tasks) < 2:
+        for task in tasks:
+            yield _chunk_counts(task)
+        return
+    batch_size = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(batch_size)
+    try:
+        for i in range(0, len(tasks), batch_size):
+            for counts in pool.map(_chunk_counts, tasks[i:i + batch_size]):
+                yield counts
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _log2(x):
+    return math.log(x, 2.0)
+
+
+def _best_ngrams(ngram_counts, counts, num, min_freq):
+    # the num n-grams with the highest PMI, breaking ties by frequency like
+    # the NLTK finders do and then alphabetically
+    total = counts.num_tokens
+    scored = []
+    for ngram, count in ngram_counts.iteritems():
+        if count >= min_freq:
+            product = reduce(lambda x, y: x * y, [counts.word_count(word) for word in ngram])
+            score = _log2(count * total ** (len(ngram) - 1)) - _log2(product)
+            scored.append((-score, -count, ngram))
+    return [ngram for (score, count, ngram) in heapq.nsmallest(num, scored)]
+
+
+def extract_frequent_terms(filename, num, processes=None, chunk_size=CHUNK_SIZE, max_ngrams=MAX_NGRAMS, min_freq=MIN_NGRAM_FREQ):
+    """
+    Return the num/3 most frequent unigrams and the num/3 bigrams and
+    trigrams with the highest PMI out of those that occur at least min_freq
+    times in the given text file, with the text tokenized by a pool of the
+    given number of processes (all the cores by default).
+    """
+    offsets = chunk_offsets(filename, chunk_size)
+    size = float(os.path.getsize(filename)) or 1.0
+    counts = _NgramCounts(max_ngrams, min_freq=min_freq)
+    for (start, end), chunk_counts in zip(offsets, _map_chunks(offsets, filename, processes)):
+        counts.add(chunk_counts, end / size)
+    if not counts.exact():
+        # count exactly only the n-grams that may be frequent enough, which
+        # include all of those that are since the sketches never underestimate,
+        # or, if there are too many of them, only the most frequent ones
+        counts = _NgramCounts(max_ngrams, counts.sketches, min_freq)
+        for (start, end), chunk_counts in zip(offsets, _map_chunks(offsets, filename, processes)):
+            counts.add(chunk_counts, end / size)
+
+    res = []
+    # use the first num/3 most frequent unigrams
+    for count, unigram in heapq.nsmallest(int(num/3), [(-count, word) for (word, count) in counts.words().iteritems()]):
+        res.append(unigram)
+    for ngram in _best_ngrams(counts.bigrams(), counts, int(num/3), min_freq):
+        res.append(' '.join(ngram))
+    for ngram in _best_ngrams(counts.trigrams(), counts, int(num/3), min_freq):
+        res.append(' '.join(ngram))
+    return res
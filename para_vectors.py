@@ -0,0 +1,288 @@
+# This module compares the sources and targets of the paraphrase rules with
+# word vectors, as a second similarity resource in addition to WordNet. The
+# similarity of a rule is the cosine similarity of the averages of the word
+# vectors of the words of its source and target, and is stored in the
+# similarity column of the paraphrase table (see para_db). Rules with a source
+# or target none of whose words have a vector have a NULL similarity.
+#
+# The word vectors are converted once from the usual text format (one word
+# followed by its vector on each line, as written by word2vec or GloVe) with
+# convert() and saved as a directory of two files:
+#
+#   vectors.npy: the vectors of all the words, one per row, normalized to
+#       unit length, which is memory-mapped when the vectors are loaded so
+#       that only the rows of the words that are looked up are read
+#   vocab.txt: the words, one on each line, in the same order as the rows
+#
+# The similarities are computed in batches of rules with NumPy so that they
+# can be added to databases with millions of rules.
+
+import gzip
+import io
+import math
+import os
+
+import numpy as np
+
+import para_cache
+import para_db
+import para_wn
+
+# the similarities are summarized in a histogram of NUM_BINS bins over [-1, 1]
+NUM_BINS = 20
+
+
+def _open_text(filename):
+    if filename.endswith('.gz'):
+        return io.TextIOWrapper(io.BufferedReader(gzip.GzipFile(filename)), encoding='utf-8', errors='replace')
+    return io.open(filename, encoding='utf-8', errors='replace')
+
+
+def _word_vector_lines(filename):
+    # the (word, values) of each line of a text vector file, skipping the
+    # "<number of words> <dimension>" header line of word2vec files
+    fh = _open_text(filename)
+    try:
+        for num, line in enumerate(fh):
+            fields = line.rstrip().split(' ')
+            if num == 0 and len(fields) == 2 and fields[0].isdigit() and fields[1].isdigit():
+                continue
+            if len(fields) > 1:
+                yield fields[0], fields[1:]
+    finally:
+        fh.close()
+
+
+def convert(filename, path):
+    """
+    Convert the word vectors in the given text file (optionally gzipped) and
+    save them in the given directory. Only the first vector of each word is
+    kept. Returns the number of words.
+    """
+    # the file is read twice so that the vectors are written straight into
+    # the memory-mapped array instead of being held in memory
+    words = set([])
+    dim = None
+    num_words = 0
+    for word, values in _word_vector_lines(filename):
+        if dim is None:
+            dim = len(values)
+        if len(values) != dim:
+            raise ValueError('the vector of "{}" has {} values instead of {}'.format(word.encode('utf-8'), len(values), dim))
+        if word not in words:
+            words.add(word)
+            num_words += 1
+    if dim is None:
+        raise ValueError('the file {} does not contain any word vectors'.format(filename))
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+', dtype=np.float32, shape=(num_words, dim))
+    vocab = io.open(os.path.join(path, 'vocab.txt'), 'w', encoding='utf-8')
+    seen = set([])
+    row = 0
+    for word, values in _word_vector_lines(filename):
+        if word in seen:
+            continue
+        seen.add(word)
+        vector = np.array(values, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vectors[row] = vector / norm if norm > 0 else vector
+        vocab.write(word + u'\n')
+        row += 1
+    vocab.close()
+    vectors.flush()
+    del vectors
+    return num_words
+
+
+class Vectors:
+    """
+    The word vectors saved in the given directory by convert().
+    """
+
+    def __init__(self, path):
+        vectors_file = os.path.join(path, 'vectors.npy')
+        vocab_file = os.path.join(path, 'vocab.txt')
+        if not os.path.exists(vectors_file) or not os.path.exists(vocab_file):
+            raise IOError('the path {} does not contain word vectors'.format(path))
+        self.path = path
+        self._vectors = np.load(vectors_file, mmap_mode='r')
+        fh = io.open(vocab_file, encoding='utf-8')
+        self._vocab = dict([(word.rstrip(u'\n'), idx) for (idx, word) in enumerate(fh)])
+        fh.close()
+
+    def __len__(self):
+        return len(self._vocab)
+
+    @property
+    def dim(self):
+        return self._vectors.shape[1]
+
+    def _word_ids(self, phrase):
+        # the rows of the words of the phrase that have a vector, looking up
+        # the lowercase word if the word itself does not have one
+        ids = []
+        for word in phrase.split():
+            idx = self._vocab.get(word)
+            if idx is None:
+                idx = self._vocab.get(word.lower())
+            if idx is not None:
+                ids.append(idx)
+        return ids
+
+    def phrase_vectors(self, phrases):
+        """
+        Return the average word vectors of the given phrases, normalized to
+        unit length, as the rows of a matrix, and a boolean array indicating
+        which phrases have at least one word with a vector.
+        """
+        ids = []
+        starts = []
+        for phrase in phrases:
+            starts.append(len(ids))
+            ids.extend(self._word_ids(phrase))
+        lengths = np.diff(starts + [len(ids)])
+        known = lengths > 0
+        res = np.zeros((len(phrases), self.dim), dtype=np.float32)
+        if ids:
+            # the rows are read from the memory-mapped array in order
+            unique_ids, inverse = np.unique(ids, return_inverse=True)
+            word_vectors = np.asarray(self._vectors[unique_ids])[inverse]
+            # the sums of the vectors of the words of each phrase, the phrases
+            # without any words with vectors are left out
+            res[known] = np.add.reduceat(word_vectors, np.array(starts)[known], axis=0)
+            norms = np.sqrt(np.einsum('ij,ij->i', res, res))
+            norms[norms == 0] = 1
+            res /= norms[:, np.newaxis]
+        return res, known
+
+    def similarities(self, sources, targets):
+        """
+        Return the cosine similarities of the given sources and targets as
+        an array, with NaN for the pairs that cannot be compared.
+        """
+        phrase_ids = {}
+        for phrase in sources:
+            phrase_ids.setdefault(phrase, len(phrase_ids))
+        for phrase in targets:
+            phrase_ids.setdefault(phrase, len(phrase_ids))
+        phrases = sorted(phrase_ids, key=phrase_ids.get)
+        vectors, known = self.phrase_vectors(phrases)
+        source_ids = np.array([phrase_ids[phrase] for phrase in sources], dtype=np.int64)
+        target_ids = np.array([phrase_ids[phrase] for phrase in targets], dtype=np.int64)
+        res = np.einsum('ij,ij->i', vectors[source_ids], vectors[target_ids]).astype(np.float64)
+        res = np.clip(res, -1, 1)
+        res[~(known[source_ids] & known[target_ids])] = np.nan
+        return res
+
+
+def add_similarities(conn, vectors, batch_size=10000):
+    """
+    Compute the similarities of all the rules of the given database with the
+    given Vectors and store them in the similarity column, which is added
+    and indexed if the database does not have it yet. Returns the number of
+    rules that have a similarity.
+    """
+    if not para_db.has_similarity(conn):
+        conn.execute('alter table paraphrase add column {} real'.format(para_db.SIMILARITY_COLUMN))
+    last_rowid = 0
+    num_rules = 0
+    while True:
+        rows = conn.execute('select rowid, source, target from paraphrase where rowid > ? order by rowid limit ?', (last_rowid, batch_size)).fetchall()
+        if not rows:
+            break
+        sims = vectors.similarities([source for (rowid, source, target) in rows], [target for (rowid, source, target) in rows])
+        updates = [(None if math.isnan(sim) else round(float(sim), 4), rowid) for (sim, (rowid, source, target)) in zip(sims, rows)]
+        conn.executemany('update paraphrase set {} = ? where rowid = ?'.format(para_db.SIMILARITY_COLUMN), updates)
+        num_rules += len(rows) - int(np.isnan(sims).sum())
+        last_rowid = rows[-1][0]
+    conn.execute('create index if not exists simidx on paraphrase({})'.format(para_db.SIMILARITY_COLUMN))
+    conn.commit()
+    # the analyses include the similarities
+    para_cache.clear(conn)
+    return num_rules
+
+
+def _get_bin(sim):
+    # the same as the bin computed in SQL by summarize()
+    return min(int((sim + 1) * NUM_BINS / 2.0), NUM_BINS - 1)
+
+
+def _new_stats():
+    return {'count': 0, 'missing': 0, 'sum': 0.0, 'histogram': [0] * NUM_BINS, 'relations': {}}
+
+
+def _add_relation(stats, relation, count, sim_sum):
+    # the rules of lazily indexed databases may not have a relation yet
+    if relation is None or count == 0:
+        return
+    name = para_wn.get_relation_name(relation)
+    rel_count, rel_sum = stats['relations'].get(name, (0, 0.0))
+    stats['relations'][name] = (rel_count + count, rel_sum + sim_sum)
+
+
+def summarize(conn, conditional_part):
+    """
+    Summarize the similarities of the rules selected by the given where
+    clause with SQL aggregates: the number of rules with and without a
+    similarity, the sum and histogram of the similarities and the number
+    and sum of the similarities of each WordNet relation.
+    """
+    stats = _new_stats()
+    sql = 'select min(cast((similarity + 1) * {} as integer), {}), count(*), sum(similarity) from paraphrase {} group by 1'
+    for idx, count, sim_sum in conn.execute(sql.format(NUM_BINS / 2.0, NUM_BINS - 1, conditional_part)):
+        if idx is None:
+            stats['missing'] += count
+        else:
+            stats['histogram'][idx] += count
+            stats['count'] += count
+            stats['sum'] += sim_sum
+    for relation, count, sim_sum in conn.execute('select relation, count(similarity), sum(similarity) from paraphrase {} group by 1'.format(conditional_part)):
+        _add_relation(stats, relation, count, sim_sum or 0.0)
+    return stats
+
+
+def summarize_rules(conn, rules):
+    """
+    The same as summarize() for the given rules, i.e., (source, target,
+    pe2e1, relation, ...) tuples, whose similarities are looked up.
+    """
+    stats = _new_stats()
+    cursor = conn.cursor()
+    for rule in rules:
+        row = cursor.execute('select similarity from paraphrase where source = ? and target = ?', (rule[0], rule[1])).fetchone()
+        sim = row[0] if row else None
+        if sim is None:
+            stats['missing'] += 1
+            continue
+        stats['histogram'][_get_bin(sim)] += 1
+        stats['count'] += 1
+        stats['sum'] += sim
+        _add_relation(stats, rule[3], 1, sim)
+    cursor.close()
+    return stats
+
+
+def similarity_display(stats):
+    out = ['\nDistributional similarity: \n']
+    out.append('-' * 26 + '\n')
+    total = stats['count'] + stats['missing']
+    if stats['count'] == 0:
+        out.append('  None of the ' + str(total) + ' rule(s) have a similarity.\n')
+        return ''.join(out)
+    out.append('  Rules with a similarity: ' + str(stats['count']) + ' (' + str(round(stats['count'] * 100.0/total, 2)) + '% of the ' + str(total) + ' rule(s))\n')
+    out.append('  Average similarity: ' + str(round(stats['sum']/stats['count'], 4)) + '\n')
+    out.append('  Histogram of similarities: [-1 , 1], step = ' + str(2.0 / NUM_BINS) + ' \n\t')
+    for count in stats['histogram']:
+        out.append(str(round(count * 100.0/stats['count'], 3)) + '%\t')
+    out.append('\n\t')
+    for idx in range(NUM_BINS):
+        out.append('(' + str(round(-1 + (idx + 1) * 2.0 / NUM_BINS, 2)) + ')\t')
+    out.append('\n')
+    if stats['relations']:
+        out.append('  Average similarity for each WordNet relation:\n')
+        for name in sorted(stats['relations']):
+            count, sim_sum = stats['relations'][name]
+            out.append('      ' + name.upper() + ': ' + str(round(sim_sum/count, 4)) + ' (' + str(count) + ' rule(s))\n')
+    return ''.join(out)
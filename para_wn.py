@@ -3,12 +3,25 @@
 
 from nltk.corpus import wordnet as wn
 
+import para_lexicon
+
+# the NLTK WordNet corpus reader, which wn is set back to by use_lexicon(None)
+_nltk_wordnet = wn
+
 # define a hash that maps relation names to IDs and another one that maps IDs to names
 _relation_names = ['not in WN', 'derivation', 'synonym', 'antonym', 'hypernym', 'hyponym', 'co-hyponym', 'undefined relation', 'pertainym', 'holonym', 'meronym']
 _relation_ids_to_names = dict(enumerate(_relation_names))
 _relation_names_to_ids = dict([(name, idx) for (idx, name) in enumerate(_relation_names)])
 
 
+def use_lexicon(path):
+    # look words up in the compact lexicon saved in the given directory by
+    # para_lexicon.build() instead of NLTK's WordNet corpus, or in NLTK's
+    # corpus again if the path is None
+    global wn
+    wn = _nltk_wordnet if path is None else para_lexicon.Lexicon(path)
+
+
 def internal_form(word):
     return word.replace(' ', '_').lower()
 
@@ -21,13 +34,14 @@ def get_path_length(synsetA, synsetB):
     ## taken from http://blog.typeslashcode.com/voxpop/2009/10/returning-wordnet-shortest-path-distance-with-nltk/
     if synsetA == synsetB:
         return 0
+    return _get_path_length_from_distances(synsetA.hypernym_distances(0), synsetB.hypernym_distances(0))
 
+
+def _get_path_length_from_distances(dist_list1, dist_list2):
+    # the path length given the hypernym distances of the two synsets
     path_distance = -1
 
-    dist_list1 = synsetA.hypernym_distances(0)
     dist_dict1 = {}
-
-    dist_list2 = synsetB.hypernym_distances(0)
     dist_dict2 = {}
 
     # Transform each distance list into a dictionary. In cases where
@@ -508,3 +522,119 @@ def get_wordnet_relation(word_a, word_b):
         else:
             rel = 'undefined relation'
     return (rel, get_relation_id(rel))
+
+
+class _WordProfile:
+    # the WordNet information about a word that the relation tests use,
+    # each computed only when it is first needed
+
+    def __init__(self, word):
+        self.word = word
+        self._values = {}
+
+    def _get(self, name, compute):
+        if name not in self._values:
+            self._values[name] = compute()
+        return self._values[name]
+
+    def synsets(self):
+        return self._get('synsets', lambda: wn.synsets(internal_form(self.word)))
+
+    def raw_synsets(self):
+        # some of the tests look up the word as it is rather than in its internal form
+        return self._get('raw_synsets', lambda: wn.synsets(self.word))
+
+    def is_included(self):
+        return len(self.synsets()) > 0
+
+    def lemmas(self):
+        return self._get('lemmas', lambda: set([lemmatize(self.word, x.pos) for x in self.synsets()]))
+
+    def raw_lemmas(self):
+        return self._get('raw_lemmas', lambda: set([lemmatize(self.word, x.pos) for x in self.raw_synsets()]))
+
+    def pos(self):
+        return self._get('pos', lambda: set([x.pos for x in self.raw_synsets()]))
+
+    def derivations(self):
+        return self._get('derivations', lambda: get_derivations(self.word))
+
+    def synonyms(self):
+        return self._get('synonyms', lambda: get_synonyms(self.word))
+
+    def antonyms(self):
+        return self._get('antonyms', lambda: get_antonyms(self.word))
+
+    def hypernyms(self):
+        return self._get('hypernyms', lambda: get_hypernyms(self.word))
+
+    def hyponyms(self):
+        return self._get('hyponyms', lambda: get_hyponyms(self.word))
+
+    def pertainyms(self):
+        return self._get('pertainyms', lambda: get_pertainyms(self.word))
+
+    def holonyms(self):
+        return self._get('holonyms', lambda: get_holonyms(self.word))
+
+    def meronyms(self):
+        return self._get('meronyms', lambda: get_meronyms(self.word))
+
+
+def _get_profile_relation(a, b):
+    # the same tests in the same order as get_wordnet_relation(), on profiles
+    if not (a.is_included() and b.is_included()):
+        return 'not in WN'
+    if a.lemmas() & b.lemmas() or b.lemmas() & a.derivations() or a.lemmas() & b.derivations():
+        return 'derivation'
+    if b.lemmas() & a.synonyms() or a.lemmas() & b.synonyms():
+        return 'synonym'
+    if b.raw_lemmas() & a.antonyms() or a.raw_lemmas() & b.antonyms():
+        return 'antonym'
+    if b.raw_lemmas() & a.hypernyms():
+        return 'hypernym'
+    if b.raw_lemmas() & a.hyponyms():
+        return 'hyponym'
+    if b.lemmas() & a.pertainyms() or a.lemmas() & b.pertainyms():
+        return 'pertainym'
+    if b.raw_lemmas() & a.holonyms():
+        return 'holonym'
+    if b.raw_lemmas() & a.meronyms():
+        return 'meronym'
+    if a.hypernyms() & b.hypernyms():
+        return 'co-hyponym'
+    return 'undefined relation'
+
+
+def get_wordnet_relations(source, targets):
+    """
+    Return the (relation ID, distance, same pos) of the source and each of
+    the given targets, i.e., the same values as get_wordnet_relation(),
+    get_shortest_path() and is_same_pos() for each pair, but looking up
+    the WordNet information about the source only once.
+    """
+    a = _WordProfile(source)
+    # the hypernym distances of the synsets seen so far for the path lengths
+    distances = {}
+
+    def hypernym_distances(synset):
+        if synset not in distances:
+            distances[synset] = synset.hypernym_distances(0)
+        return distances[synset]
+
+    res = []
+    for target in targets:
+        b = _WordProfile(target)
+        relation = get_relation_id(_get_profile_relation(a, b))
+        path_distance = -1
+        samepos = -1
+        if a.is_included() and b.is_included():
+            for x in a.synsets():
+                for y in b.synsets():
+                    dist = 0 if x == y else _get_path_length_from_distances(hypernym_distances(x), hypernym_distances(y))
+                    if (dist > 0):
+                        if (path_distance < 0 or dist < path_distance):
+                            path_distance = dist
+            samepos = int(len(a.pos() & b.pos()) > 0)
+        res.append((relation, path_distance, samepos))
+    return res
@@ -0,0 +1,260 @@
+# This module contains the QueryCompiler class which converts the pyparsing
+# ParseResults produced by query_parser.Parser into SQL for the paraphrase
+# table. All query options (limit, order etc.) are passed in explicitly so
+# that the same compiler can be used by the interactive shell as well as by
+# the programmatic API in para_db.
+
+import math
+import sqlite3
+
+import para_wn
+
+BASIC_COLUMNS = 'source, target, pe2e1, relation, pivotnum, pivots, distance'
+# the counting SQL command needs to have a variable since we also want to show the value of the grouping by variable
+# the {} variable is instantiated later appropriately depending on the value of the group_by setting
+COUNTSELECT = 'select "{}", count(*) as cnt'
+FLIPPED_OPS = dict([('<', '>'), ('>', '<')])
+WORD_OPS = {'more than': '>', 'fewer than': '<', 'less than': '<'}
+ORDER_VALUES = {'highest first': 'pe2e1 asc', 'lowest first': 'pe2e1 desc', 'random()': 'random()'}
+
+
+class QueryCompiler:
+
+    def __init__(self, limit=-1, order='highest first', identical=False, same_pos=False, unique_tgt=False, group_by='', paged=False, source_stats=False, lemmas=False, similarity=False):
+        self.limit = limit
+        self.order = order
+        self.identical = identical
+        self.same_pos = same_pos
+        self.unique_tgt = unique_tgt
+        self.group_by = group_by
+        # if paged is True, pageable queries also select the rowid of each rule
+        # and are ordered by (pe2e1, rowid) so that the next page can be
+        # retrieved with keyset pagination, i.e., by passing the (pe2e1, rowid)
+        # of the last rule seen as the "after" argument of compile()
+        self.paged = paged
+        # if source_stats is True, conditions on the number of paraphrases of
+        # each source look it up in the sourcestats table (see para_db)
+        self.source_stats = source_stats
+        # lemma conditions can only be used if lemmas is True, i.e., if the
+        # database has the lemmas table (see para_db)
+        self.lemmas = lemmas
+        # similarity conditions can only be used if similarity is True, i.e.,
+        # if the database has the similarity column (see para_vectors)
+        self.similarity = similarity
+        self._after = None
+        # if False, the conditions on the WordNet columns are left out, see
+        # get_unannotated_conditional_part()
+        self._wordnet = True
+
+    # either 'basic' or 'count' depending on the query
+    def get_mode(self, results):
+        return 'count' if results.count else 'basic'
+
+    # only basic queries that are ordered by probability, i.e., not in random
+    # order (the 'random()' order or show non-identical etc.), can be paged
+    def is_pageable(self, results):
+        return self.get_mode(results) == 'basic' and not bool(results.ident) and self.order != 'random()'
+
+    # generate the sql for 'show non-identical', 'show same'
+    def _generate_ident_sql(self, results):
+        order_part = 'order by random()'
+        return self._assemble_sql(results, self._ident_conditional_part(results), order_part)
+
+    def _ident_conditional_part(self, results):
+        identval = '1' if results.ident in ['same', 'identical'] else '0'
+        return 'where identity = {}'.format(identval)
+
+    # generate the sql for 'show most probable', 'show least probable etc.'
+    def _generate_unary_prob_sql(self, results):
+        direction = 'desc' if results.adj == 'least' else 'asc'
+        order_part = 'order by pe2e1 {}'.format(direction)
+        return self._assemble_sql(results, self._unary_prob_conditional_part(results), order_part)
+
+    def _unary_prob_conditional_part(self, results):
+        conditional_part = 'where identity = {}'.format(int(self.identical)) if not self.identical else ''
+        if self.same_pos and self._wordnet:
+            if conditional_part == '':
+                conditional_part = 'where samepos = 1'
+            else:
+                conditional_part += 'and samepos = 1'
+        if self.unique_tgt and self._wordnet:
+            if conditional_part == '':
+                conditional_part = 'where tgtdupl = 0'
+            else:
+                conditional_part += 'and tgtdupl = 0'
+        return conditional_part
+
+    def _generate_conditional_sql(self, results):
+        order_part = 'order by {}'.format(ORDER_VALUES[self.order])
+        return self._assemble_sql(results, self._conditional_part(results), order_part)
+
+    def _conditional_part(self, results):
+        conditional_part = []
+        identity_clause = False
+
+        for cond in results.condition:
+            if bool(cond.probval):
+                probval = str(round(-math.log(float(cond.probval)), 4))
+                op = FLIPPED_OPS[cond.op]
+                conditional_part.append(' '.join(['pe2e1', op, probval]))
+            elif bool(cond.rhs):
+                if cond.op in ['<', '>']:
+                    op = FLIPPED_OPS[cond.op] if cond.lhs == 'source' else cond.op
+                    if bool(cond.lenclause):
+                        lendiff = '-' + cond.lenclause.lendiff if cond.lhs == 'source' and cond.op == '>' else cond.lenclause.lendiff
+                        conditional_part.append(' '.join(['lendiff = ', lendiff]))
+                    else:
+                        conditional_part.append(' '.join(['lendiff', op, '0']))
+                else:
+                    identval = '1' if cond.op == '=' else '0'
+                    conditional_part.append('identity = ' + identval)
+                    identity_clause = True
+            elif bool(cond.lenclause):
+                fieldname = 'srclen' if cond.lhs == 'source' else 'tgtlen'
+                conditional_part.append(' '.join([fieldname, cond.op, cond.lenclause.len]))
+            elif bool(cond.lemma):
+                if not self.lemmas:
+                    raise ValueError('lemma conditions require a database indexed with lemmas')
+                # the lemmas are added when indexing even if the WordNet
+                # columns are left out, see para_annotate.add_lemmas()
+                single_quoted_lemma = cond.lemma.replace('"', "'")
+                op = 'GLOB' if single_quoted_lemma.find('*') > 0 else '='
+                negation = 'not ' if cond.op == '!=' else ''
+                conditional_part.append('{} {}in (select phrase from lemmas where lemma {} {})'.format(cond.lhs, negation, op, single_quoted_lemma))
+            elif bool(cond.phrase):
+                # we want string literals to always be in single quotes in case
+                # the literal is one of the field names in the database
+                single_quoted_phrase = cond.phrase.replace('"', "'")
+                op = 'GLOB' if single_quoted_phrase.find('*') > 0 else '='
+                # phrase = '*' + cond.phrase + '*' if cond.op == 'contains' else cond.phrase
+                conditional_part.append(' '.join([cond.lhs, op, single_quoted_phrase]))
+            elif bool(cond.relname) and self._wordnet:
+                #Lili Kotlerman: added (WN) relation condition
+                relname = cond.relname
+                if relname in map(str, range(11)):
+                    conditional_part.append(' '.join(['relation', cond.op, relname.replace("'", '')]))
+                else:
+                    relid = para_wn.get_relation_id(relname.replace('"', '').replace("'", ''))
+                    if relid >= 0:
+                        conditional_part.append(' '.join(['relation', cond.op, str(relid)]))
+            elif bool(cond.pivotnum):
+                #Lili Kotlerman: added condition for number of pivots
+                pivotnum = cond.pivotnum
+                if cond.op == 'include':
+                    # In this case pivotnum should hold one pivot's text. Pivots field contains ["pivot:score", "pivot:score",...]
+                    conditional_part.append(' '.join(['pivots LIKE', "'%" + '"' + pivotnum.replace('"', '').replace("'", '') + ":%'"]) + " OR" + ' pivots =="' + pivotnum.replace('"', '').replace("'", '') + '"')
+                else:
+                    conditional_part.append(' '.join(['pivotnum', cond.op, pivotnum]))
+            elif bool(cond.tgtnum):
+                # the number of non-identical paraphrases of the source
+                op = WORD_OPS.get(cond.op, cond.op)
+                if self.source_stats:
+                    conditional_part.append('source in (select source from sourcestats where tgtnum {} {})'.format(op, cond.tgtnum))
+                else:
+                    conditional_part.append('source in (select source from paraphrase where identity = 0 group by source having count(*) {} {})'.format(op, cond.tgtnum))
+            elif bool(cond.simval):
+                if not self.similarity:
+                    raise ValueError('similarity conditions require a database with similarities, use "vectors <path>" to add them')
+                conditional_part.append(' '.join(['similarity', cond.op, str(float(cond.simval))]))
+            elif bool(cond.wndist) and self._wordnet:
+                #Lili Kotlerman: added condition for WordNet distance
+                wndist = cond.wndist
+                conditional_part.append(' '.join(['distance', cond.op, wndist]))
+
+        # AND all the conditions for the conditional part
+        if not identity_clause and not self.identical:
+            conditional_part.append('identity = {}'.format(int(self.identical)))
+        if self.same_pos and self._wordnet:
+            conditional_part.append('samepos = {}'.format(int(self.same_pos)))
+        if self.unique_tgt and self._wordnet:
+            conditional_part.append('tgtdupl = 0')
+        # there may be no conditions at all for "top N per source" queries
+        return 'where ' + ' and '.join(conditional_part) if conditional_part else ''
+
+    # put together the final sql from the conditional and order parts
+    def _assemble_sql(self, results, conditional_part, order_part):
+        table_part = 'from paraphrase'
+        if bool(results.pertop):
+            # for "top N per source" queries, rank the rules for each source in the same
+            # order as the results and only keep the top N. With an index on (source, pe2e1),
+            # SQLite computes the ranks in a single pass over the index.
+            if sqlite3.sqlite_version_info < (3, 25, 0):
+                raise ValueError('top N per source queries require SQLite 3.25 or higher')
+            topk = int(results.pertop.topk)
+            table_part = 'from (select *, rowid as rowid, row_number() over (partition by source {}) as srcrank from paraphrase {})'.format(order_part, conditional_part)
+            conditional_part = 'where srcrank <= {}'.format(topk)
+
+        columns = BASIC_COLUMNS
+        if self.paged and self.is_pageable(results):
+            # break ties by rowid so that every rule has a unique position in the results
+            direction = 'desc' if order_part.endswith('desc') else 'asc'
+            columns += ', rowid'
+            order_part += ', rowid {}'.format(direction)
+            if self._after is not None:
+                # only get the rules that come after the last one seen. Unlike an offset,
+                # this uses the index on pe2e1 to start right at the last position.
+                pe2e1, rowid = self._after
+                op = '>' if direction == 'asc' else '<'
+                keyset_part = 'pe2e1 {}= {!r} and (pe2e1 {} {!r} or rowid {} {})'.format(op, pe2e1, op, pe2e1, op, rowid)
+                conditional_part = 'where ({}) and {}'.format(conditional_part[len('where '):], keyset_part) if conditional_part else 'where ' + keyset_part
+
+        if self.get_mode(results) == 'basic':
+            # Lili Kotlerman: to remove limit, set limit < 0
+            limit_part = 'limit {}'.format(self.limit) if self.limit > 0 else ''
+            finalsql = ' '.join(['select', columns, table_part, conditional_part, order_part, limit_part])
+        else:
+            #'count'
+            # Lili Kotlerman: to remove grouping, set group_by=''
+            group_part = 'group by "{}"'.format(self.group_by)
+            finalsql = ' '.join([COUNTSELECT.format(self.group_by), table_part, conditional_part, group_part, 'order by cnt asc'])
+        return finalsql
+
+    # method to take a pyparsing ParseResults object and convert
+    # into an appropriate sql query. For paged queries, after is the
+    # (pe2e1, rowid) of the last rule on the previous page.
+    def compile(self, query_results, after=None):
+        self._after = after
+        if bool(query_results.prob):
+            return self._generate_unary_prob_sql(query_results)
+        elif bool(query_results.ident):
+            return self._generate_ident_sql(query_results)
+        elif bool(query_results.condition) or bool(query_results.pertop):
+            return self._generate_conditional_sql(query_results)
+
+    # get just the where clause selecting the rules that match the query, e.g.,
+    # for computing aggregates over all of them. This is not possible for
+    # "top N per source" queries, which do not have a simple where clause.
+    def get_conditional_part(self, query_results):
+        if bool(query_results.pertop):
+            raise ValueError('top N per source queries do not have a conditional part')
+        if bool(query_results.prob):
+            return self._unary_prob_conditional_part(query_results)
+        elif bool(query_results.ident):
+            return self._ident_conditional_part(query_results)
+        return self._conditional_part(query_results)
+
+    # whether the rules matching the query depend on the WordNet columns of
+    # the rules, which are not filled in yet in lazily indexed databases
+    def uses_wordnet(self, query_results):
+        if bool(query_results.ident):
+            return False
+        if self.get_mode(query_results) == 'count' and self.group_by in ['relation', 'distance', 'samepos', 'tgtdupl']:
+            return True
+        if self.same_pos or self.unique_tgt:
+            return True
+        return any([bool(cond.relname) or bool(cond.wndist) for cond in query_results.condition])
+
+    # get the where clause selecting the rules that would match the query
+    # whatever the values of their WordNet columns. Unlike get_conditional_part(),
+    # this also works for "top N per source" queries since all the rules
+    # that may be among the top N are selected.
+    def get_unannotated_conditional_part(self, query_results):
+        self._wordnet = False
+        try:
+            if bool(query_results.prob):
+                return self._unary_prob_conditional_part(query_results)
+            elif bool(query_results.ident):
+                return self._ident_conditional_part(query_results)
+            return self._conditional_part(query_results)
+        finally:
+            self._wordnet = True
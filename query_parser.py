@@ -24,6 +24,13 @@ class Parser:
         WordLenExpr = Group(Word(nums)("len") + oneOf("word words"))
         binarySourceTargetPhraseQueryStr = (sourceOrTarget("lhs") + Op2("op") + (WordLenExpr("lenclause") | Phrase("phrase")))("condition*")
 
+        ####################################################
+        # 3. BINARY source/target lemma query
+        #    Example: source lemma = "run", target lemma != "man"
+        ####################################################
+        OpLemma = oneOf("= is !=")
+        binaryLemmaQueryStr = (sourceOrTarget("lhs") + Literal("lemma") + OpLemma("op") + Phrase("lemma"))("condition*")
+
         ####################################################
         # 3. BINARY relation query
         #    Example: relation = synonym, relation is antonym
@@ -51,6 +58,14 @@ class Parser:
         Distance = Word(nums)
         binaryDistanceQueryStr = (Dist + Op5("op") + Distance("wndist"))("condition*")
 
+        ####################################################
+        # 3. BINARY number of paraphrases per source query
+        #    Example: sources with > 50 paraphrases, sources with more than 50 paraphrases
+        ####################################################
+        Srcs = Literal("sources") + Literal("with")
+        Op7 = oneOf("= != > < >= <=") | Combine(oneOf("more fewer less") + Literal("than"), joinString=" ", adjacent=False)
+        binaryTgtnumQueryStr = (Srcs + Op7("op") + integer("tgtnum") + oneOf("paraphrase paraphrases"))("condition*")
+
         ####################################################
         # 3. BINARY Prob <-> number query
         #    Example: prob < 0.5, prob >= 0.5
@@ -59,6 +74,14 @@ class Parser:
         Op6 = oneOf("> < <= >=")
         binaryProbQueryStr = (Literal("prob")("lhs") + Op6("op") + zeroToOneFloat("probval"))("condition*")
 
+        ####################################################
+        # 3. BINARY similarity <-> number query
+        #    Example: similarity > 0.5, similarity <= -0.1
+        ####################################################
+        signedFloat = Combine(Optional(Literal("-")) + Word(nums) + Optional(Literal(".") + Word(nums)))
+        Op8 = oneOf("= != > < <= >=")
+        binarySimilarityQueryStr = (Literal("similarity") + Op8("op") + signedFloat("simval"))("condition*")
+
         ##################################
         # 3. UNARY identical/non-identical
         ##################################
@@ -76,13 +99,20 @@ class Parser:
         #    Example: most probable, least probable etc.
         ############################################################
         unaryQueryStr = unaryIdentQueryStr | unaryProbQueryStr
-        binaryQueryStr = binarySourceTargetQueryStr | binarySourceTargetPhraseQueryStr | binaryProbQueryStr | binaryRelQueryStr | binaryPivotsQueryStr | binaryDistanceQueryStr
+        binaryQueryStr = binaryLemmaQueryStr | binarySourceTargetQueryStr | binarySourceTargetPhraseQueryStr | binaryProbQueryStr | binaryRelQueryStr | binaryPivotsQueryStr | binaryDistanceQueryStr | binaryTgtnumQueryStr | binarySimilarityQueryStr
         multipleBinaryQueryStr = binaryQueryStr + Optional(OneOrMore(Literal("and") + binaryQueryStr))
 
+        ############################################################
+        # 5. Top N rules for each source string
+        #    Example: top 5 per source where prob > 0.1
+        ############################################################
+        topPerSource = Group(Literal("top") + integer("topk") + Literal("per") + Literal("source"))("pertop")
+        topPerSourceQueryStr = topPerSource + Optional(Literal("where")) + Optional(multipleBinaryQueryStr | unaryQueryStr)
+
         # final query string
         # Lili Kotlerman: added 'count' to queries
         count = Literal("count")
-        self._queryStr = Optional(count("count")) + (multipleBinaryQueryStr | unaryQueryStr)
+        self._queryStr = Optional(count("count")) + (topPerSourceQueryStr | multipleBinaryQueryStr | unaryQueryStr)
 
     def parse(self, query):
         return self._queryStr.parseString(query)
@@ -4,6 +4,8 @@
 # Authors: Nitin Madnani, nmadnani@ets.org, August 2011
 #          Lili Kotlerman, lili.dav@gmail.com, June 2012
 
+import glob
+import itertools
 import math
 import operator
 import os
@@ -15,21 +17,27 @@ from datetime import datetime
 from cmd import Cmd
 
 import query_parser
+import query_compiler
 import para_reader
 import para_wn
 import para_analysis
+import para_annotate
+import para_cache
+import para_compare
+import para_dbanalysis
+import para_export
+import para_lexicon
+import para_db
+import para_pivot
+import para_sampling
+import para_stats
+import para_vectors
 
 
 class ParaQueryApp(Cmd):
 
     # set some basic class-wide variables
-    _BASICSQLCMD = 'select source, target, pe2e1, relation, pivotnum, pivots, distance from paraphrase'
-    # the counting SQL command needs to have a variable since we also want to show the value of the grouping by variable
-    # the {} variable is instantiated later appropriately depending on the value of the group_by setting
-    _COUNTSQLCMD = 'select "{}", count(*) as cnt from paraphrase'
-    _FLIPPED_OPS = dict([('<', '>'), ('>', '<')])
     _POS_IDX_TO_VALUES = {1: 'same', 0: 'different', -1: 'unknown'}
-    _ORDER_VALUES = {'highest first': 'pe2e1 asc', 'lowest first': 'pe2e1 desc'}
 
     #either 'basic' or 'count' depending on the query
     _mode = 'basic'
@@ -40,6 +48,25 @@ class ParaQueryApp(Cmd):
     # by default, we assume interactive and verbose mode
     _interactive = True
 
+    # SQLite connection settings, these are class-wide since a database
+    # may be attached before the command loop sets up the other variables.
+    # None means that the SQLite default is used.
+    _readonly = False
+    # whether the attached database has the per-source statistics table
+    _source_stats = False
+    # whether the attached database has the lemmas table for lemma conditions
+    _lemmas = False
+    # whether the attached database has the similarity column
+    _similarity = False
+    # whether the WordNet columns of the attached database may need to be
+    # filled in, i.e., whether it was indexed with "index <filename> lazy"
+    _lazy = False
+    # the thread annotating the attached database in the background, if any
+    _annotator = None
+    _cache_size = None
+    _mmap_size = None
+    _temp_store = None
+
     # set up the database and cursor before entering the command loop unless
     # it was already set up by using a command line argument. Also set up
     # the default values for the internal variables in either case.
@@ -62,6 +89,14 @@ class ParaQueryApp(Cmd):
         self._explain = False
         self._same_pos = False
         self._unique_tgt = False
+        # seed for the random samples in analysis reports, None means a different sample every time
+        self._seed = None
+        # the relative error of the percentiles in approximate analyses
+        self._approx_error = 0.01
+        # 'on' to reuse cached analyses, 'refresh' to recompute and cache them, 'off' to not use the cache
+        self._analysis_cache = 'on'
+        # the query to continue from and where to continue from for "next"
+        self._next_page = None
 
         # read in the query grammar
         self._query_parser = query_parser.Parser()
@@ -88,51 +123,94 @@ class ParaQueryApp(Cmd):
     #    number of pivots (integers), pivots (list), wordnet relation (integer) if available, wordnet distance (integer), same pos (binary),
     #    duplicate (binary)
     # Each field should be separately indexed.
-    def do_index(self, parafile):
+    def do_index(self, arg):
         """
-        Index a given paraphrase rule file for querying.
+        Index a given paraphrase rule file for querying. Use "index <filename> lazy"
+        to add the rules without their WordNet relations, which are then filled
+        in when they are needed by queries or by the "annotate" command. The
+        rules can also be given as a directory or a glob pattern of gzipped
+        files in any order, which are then read and sorted by source in parallel.
         """
+        parafile = arg
+        lazy = arg.endswith(' lazy')
+        if lazy:
+            parafile = arg[:-len(' lazy')].strip()
+        if not os.path.isdir(parafile) and not glob.has_magic(parafile):
+            self._index(para_reader.ParaReader(parafile), lazy)
+            return
+        try:
+            files = para_reader.input_files(parafile)
+        except IOError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+            return False
+        sys.stderr.write('\n Sorting {} paraphrase rule file(s).\n'.format(len(files)))
+        # the temporary files of the sort are written next to the database
+        self._index(para_reader.ShardedParaReader(files, tmpdir=os.getcwd()), lazy)
 
+    def do_pivot(self, arg):
+        """
+        Pivot the translation rules in the given gzipped file(s), e.g., the
+        ones written by para_extract.py, into paraphrase rules and index them
+        for querying. The rules can be given as a file, a directory or a glob
+        pattern. Use "pivot <rules> lazy" to index them as "index <filename> lazy".
+        """
+        rules = arg
+        lazy = arg.endswith(' lazy')
+        if lazy:
+            rules = arg[:-len(' lazy')].strip()
+        try:
+            files = para_reader.input_files(rules)
+        except IOError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+            return False
+        sys.stderr.write('\n Pivoting {} translation rule file(s).\n'.format(len(files)))
+        # the temporary files of the sorts are written next to the database
+        self._index(para_pivot.pivot_rules(files, tmpdir=os.getcwd()), lazy)
+
+    # index the given paraphrase rules, as returned by para_reader.ParaReader,
+    # into a new database in the current directory
+    def _index(self, reader, lazy):
+        self._stop_annotator()
         # create a database file
-        conn = sqlite3.connect('.paradb')
+        conn = para_db.connect('.paradb', cache_size=self._cache_size, mmap_size=self._mmap_size, temp_store=self._temp_store)
         c = conn.cursor()
+        if lazy:
+            # the rules are annotated in the background while the database is being queried
+            c.execute('''pragma journal_mode = wal''')
 
         sys.stderr.write(str(datetime.now()))
         # create the table
         sys.stderr.write('\n Creating table ... ')
         c.execute('''create table paraphrase (source text, target text, identity integer, srclen integer, tgtlen integer, lendiff integer, pe2e1 real, pivotnum integer, pivots text, relation integer, distance integer, samepos integer, tgtdupl integer)''')
+        # the lemmas of the sources and targets, which are added even if the
+        # WordNet columns are left out
+        para_db.create_lemmas(conn)
         sys.stderr.write('done.\n')
 
         # populate the table
         sys.stderr.write(' Adding records to table ... ')
-        reader = para_reader.ParaReader(parafile)
-        src = ""
-        for fieldtuple in reader:
-            #Input file must be sorted by the source side. When reached a new source, clean the target_lemmas list used to detect duplicate targets (with the same lemma)
-            if src != fieldtuple[0]:
-                src = fieldtuple[0]
-                target_lemmas = set([])
-            tgt = fieldtuple[1]
-            duplicate_target_lemma = 1
-            for tgt_lemma in para_wn.get_lemmas(tgt):
-                #consider the tgt as non-duplicate if at least one of its lemmas was not seen with the current source side before
-                if tgt_lemma not in target_lemmas:
-                    duplicate_target_lemma = 0
-                target_lemmas.add(tgt_lemma)
-            relation = para_wn.get_wordnet_relation(src, tgt)[1]
-            distance = para_wn.get_shortest_path(src, tgt)
-            # 1 -same, 0 - no, -1 - don't know
-            samepos = para_wn.is_same_pos(src, tgt)
-            fieldtuple += (relation, distance, samepos, duplicate_target_lemma)
-            c.execute('insert into paraphrase values (?,?,?,?,?,?,?,?,?,?,?,?,?)', fieldtuple)
-            self._num_records += 1
+        #Input file must be sorted by the source side, so that all the rules of a source are read one after the other
+        #and the WordNet information about the source is looked up only once for all of its targets
+        for src, rules in itertools.groupby(reader, key=operator.itemgetter(0)):
+            rules = list(rules)
+            lemmas = {}
+            if lazy:
+                annotations = [(None, None, None, None)] * len(rules)
+                para_annotate.add_lemmas([src] + [fieldtuple[1] for fieldtuple in rules], lemmas)
+            else:
+                # (relation, distance, samepos, duplicate target), samepos: 1 -same, 0 - no, -1 - don't know
+                annotations = para_annotate.annotate_rules(src, [fieldtuple[1] for fieldtuple in rules], lemmas)
+            para_db.add_lemmas(conn, lemmas)
+            records = [fieldtuple + annotation for (fieldtuple, annotation) in zip(rules, annotations)]
+            c.executemany('insert into paraphrase values (?,?,?,?,?,?,?,?,?,?,?,?,?)', records)
+            self._num_records += len(records)
         sys.stderr.write('done. Added %d records.\n' % self._num_records)
 
         sys.stderr.write(str(datetime.now()))
 
         # create the indices
         sys.stderr.write(' Creating indices ... ')
-        n = 13
+        n = 14
         c.execute('''create index srcidx on paraphrase(source)''')
         sys.stderr.write(' 1 out of ' + str(n))
         c.execute('''create index tgtidx on paraphrase(target)''')
@@ -159,9 +237,17 @@ class ParaQueryApp(Cmd):
         sys.stderr.write(' 12 out of ' + str(n))
         c.execute('''create index tgtduplidx on paraphrase(tgtdupl)''')
         sys.stderr.write(' 13 out of ' + str(n))
+        # used to get the top N rules for each source in a single pass
+        c.execute('''create index srcprobidx on paraphrase(source, pe2e1)''')
+        sys.stderr.write(' 14 out of ' + str(n))
         sys.stderr.write('Done.\n')
         sys.stderr.write(str(datetime.now()))
 
+        # summarize the rules of each source for the per-source analysis and queries
+        sys.stderr.write(' Computing per-source statistics ... ')
+        para_db.create_source_stats(conn)
+        sys.stderr.write('done.\n')
+
         # analyze the indices
         sys.stderr.write(' Analyzing indices ... ')
         c.execute('''analyze''')
@@ -171,18 +257,40 @@ class ParaQueryApp(Cmd):
         conn.commit()
         self._cursor = c
         self._dbfile = os.path.join(os.getcwd(), '.paradb')
-
-    def do_attach(self, dbpath):
+        self._readonly = False
+        self._source_stats = True
+        self._lemmas = True
+        self._similarity = False
+        self._lazy = lazy
+        if lazy:
+            sys.stderr.write(' The WordNet relations will be added as needed.\n Use "annotate" to add all of them in the background.\n\n')
+
+    def do_attach(self, arg):
         """
-        Attach database at given path.
+        Attach database at given path. Use "attach <path> readonly" to
+        open an unchanging database read-only with memory-mapped I/O.
         """
+        dbpath = arg
+        readonly = arg.endswith(' readonly')
+        if readonly:
+            dbpath = arg[:-len(' readonly')].strip()
         dbfile = os.path.join(dbpath, '.paradb')
         if os.path.exists(dbfile):
-            sys.stderr.write('\n Attaching paraphrase database.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a different database.\n\n')
+            self._stop_annotator()
+            sys.stderr.write('\n Attaching paraphrase database{}.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a different database.\n\n'.format(' (read-only)' if readonly else ''))
             self._dbfile = dbfile
-            conn = sqlite3.connect(os.path.join(dbfile))
+            self._readonly = readonly
+            conn = para_db.connect(dbfile, readonly=readonly, cache_size=self._cache_size, mmap_size=self._mmap_size, temp_store=self._temp_store)
             c = conn.cursor()
             self._num_records, = c.execute('''select max(rowid) from paraphrase''').fetchone()
+            self._source_stats = para_db.has_source_stats(conn)
+            self._lemmas = para_db.has_lemmas(conn)
+            self._similarity = para_db.has_similarity(conn)
+            # the rules of lazily indexed databases are annotated as needed
+            self._lazy = not para_annotate.is_annotated(conn)
+            if self._lazy and readonly:
+                sys.stderr.write(' Warning: some rules do not have WordNet relations yet and read-only databases cannot be annotated.\n\n')
+                self._lazy = False
             self._cursor = c
         else:
             sys.stderr.write('\n Error: the path {} does not contain a paraphrase database.\n\n'.format(dbpath))
@@ -255,6 +363,70 @@ class ParaQueryApp(Cmd):
         else:
             self._limit = value
 
+    # set the value for the seed variable
+    def _set_seed_value(self, value):
+        if value.lower() in ['none', 'off']:
+            value = None
+        else:
+            try:
+                value = int(value)
+            except:
+                sys.stderr.write('\n Error: incorrect value for setting.\n\n')
+                return
+        self._seed = value
+        para_sampling.set_seed(value)
+
+    # set the value for the approx_error variable
+    def _set_approx_error_value(self, value):
+        try:
+            value = float(value)
+            assert 0 < value < 1
+        except:
+            sys.stderr.write('\n Error: incorrect value for setting.\n\n')
+        else:
+            self._approx_error = value
+
+    # set the value for the analysis_cache variable
+    def _set_analysis_cache_value(self, value):
+        if value.lower() in ['on', 'off', 'refresh']:
+            self._analysis_cache = value.lower()
+        else:
+            sys.stderr.write('\n Error: incorrect value for setting.\n\n')
+
+    # set the value for the cache_size variable (in pages if positive, in KiB if negative)
+    def _set_cache_size_value(self, value):
+        try:
+            value = int(value)
+        except:
+            sys.stderr.write('\n Error: incorrect value for setting.\n\n')
+        else:
+            self._cache_size = value
+            self._apply_pragmas()
+
+    # set the value for the mmap_size variable (in bytes, 0 turns off memory-mapped I/O)
+    def _set_mmap_size_value(self, value):
+        try:
+            value = int(value)
+            assert value >= 0
+        except:
+            sys.stderr.write('\n Error: incorrect value for setting.\n\n')
+        else:
+            self._mmap_size = value
+            self._apply_pragmas()
+
+    # set the value for the temp_store variable
+    def _set_temp_store_value(self, value):
+        if value.lower() in para_db.TEMP_STORE_VALUES:
+            self._temp_store = value.lower()
+            self._apply_pragmas()
+        else:
+            sys.stderr.write('\n Error: incorrect value for setting.\n\n')
+
+    # apply the SQLite connection settings to the attached database, if any
+    def _apply_pragmas(self):
+        if hasattr(self, '_cursor'):
+            para_db.set_pragmas(self._cursor.connection, cache_size=self._cache_size, mmap_size=self._mmap_size, temp_store=self._temp_store)
+
     # set the value for the group_by variable
     def _set_group_by_value(self, value):
         if value.lower() in ['none', 'off']:
@@ -274,145 +446,95 @@ class ParaQueryApp(Cmd):
         out.append('  unique_tgt: {}'.format(self._unique_tgt))
         out.append('  group_by: {}'.format(self._group_by))
         out.append('  debug: {}'.format(self._debug))
+        out.append('  seed: {}'.format(self._seed))
+        out.append('  approx_error: {}'.format(self._approx_error))
+        out.append('  analysis_cache: {}'.format(self._analysis_cache))
+        out.append('  cache_size: {}'.format('default' if self._cache_size is None else self._cache_size))
+        out.append('  mmap_size: {}'.format('default' if self._mmap_size is None else self._mmap_size))
+        out.append('  temp_store: {}'.format('default' if self._temp_store is None else self._temp_store))
+        out.append('  read-only: {}'.format(self._readonly))
         out.append('\n')
         sys.stdout.write('\n'.join(out))
         sys.stdout.flush()
 
-    # generate the sql for 'show non-identical', 'show same'
-    def _generate_ident_sql(self, results):
-        identval = '1' if results.ident in ['same', 'identical'] else '0'
-        conditional_part = 'where identity = {}'.format(identval)
-        order_part = 'order by random()'
-        if self._mode == 'basic':
-            # Lili Kotlerman: to remove limit, set limit off
-            limit_part = 'limit {}'.format(self._limit) if self._limit > 0 else ''
-            finalsql = ' '.join([ParaQueryApp._BASICSQLCMD, conditional_part, order_part, limit_part])
-        else:
-            #'count'
-            # Lili Kotlerman: to remove grouping, set group_by = ''
-            group_part = 'group by "{}"'.format(self._group_by)
-            finalsql = ' '.join([ParaQueryApp._COUNTSQLCMD.format(self._group_by), conditional_part, group_part, 'order by cnt asc'])
-        return finalsql
-
-    # generate the sql for 'show most probable', 'show least probable etc.'
-    def _generate_unary_prob_sql(self, results):
-        direction = 'desc' if results.adj == 'least' else 'asc'
-        conditional_part = 'where identity = {}'.format(int(self._identical)) if not self._identical else ''
-        if self._same_pos:
-            if conditional_part == '':
-                conditional_part = 'where samepos = 1'
-            else:
-                conditional_part += 'and samepos = 1'
-        if self._unique_tgt:
-            if conditional_part == '':
-                conditional_part = 'where tgtdupl = 0'
-            else:
-                conditional_part += 'and tgtdupl = 0'
-        order_part = 'order by pe2e1 {}'.format(direction)
-        if self._mode == 'basic':
-            # Lili Kotlerman: to remove limit, set limit < 0
-            limit_part = 'limit {}'.format(self._limit) if self._limit > 0 else ''
-            finalsql = ' '.join([ParaQueryApp._BASICSQLCMD, conditional_part, order_part, limit_part])
-        else:
-            #'count'
-            # Lili Kotlerman: to remove grouping, set group_by = ''
-            group_part = 'group by "{}"'.format(self._group_by)
-            finalsql = ' '.join([ParaQueryApp._COUNTSQLCMD.format(self._group_by), conditional_part, group_part, 'order by cnt asc'])
-        return finalsql
-
-    def _generate_conditional_sql(self, results):
-        conditional_part = []
-        order_part = ''
-        identity_clause = False
-
-        for cond in results.condition:
-            if bool(cond.probval):
-                probval = str(round(-math.log(float(cond.probval)), 4))
-                op = ParaQueryApp._FLIPPED_OPS[cond.op]
-                conditional_part.append(' '.join(['pe2e1', op, probval]))
-            elif bool(cond.rhs):
-                if cond.op in ['<', '>']:
-                    op = ParaQueryApp._FLIPPED_OPS[cond.op] if cond.lhs == 'source' else cond.op
-                    if bool(cond.lenclause):
-                        lendiff = '-' + cond.lenclause.lendiff if cond.lhs == 'source' and cond.op == '>' else cond.lenclause.lendiff
-                        conditional_part.append(' '.join(['lendiff = ', lendiff]))
-                    else:
-                        conditional_part.append(' '.join(['lendiff', op, '0']))
-                else:
-                    identval = '1' if cond.op == '=' else '0'
-                    conditional_part.append('identity = ' + identval)
-                    identity_clause = True
-            elif bool(cond.lenclause):
-                fieldname = 'srclen' if cond.lhs == 'source' else 'tgtlen'
-                conditional_part.append(' '.join([fieldname, cond.op, cond.lenclause.len]))
-            elif bool(cond.phrase):
-                # we want string literals to always be in single quotes in case
-                # the literal is one of the field names in the database
-                single_quoted_phrase = cond.phrase.replace('"', "'")
-                op = 'GLOB' if single_quoted_phrase.find('*') > 0 else '='
-                # phrase = '*' + cond.phrase + '*' if cond.op == 'contains' else cond.phrase
-                conditional_part.append(' '.join([cond.lhs, op, single_quoted_phrase]))
-            elif bool(cond.relname):
-                #Lili Kotlerman: added (WN) relation condition
-                relname = cond.relname
-                if relname in map(str, range(11)):
-                    conditional_part.append(' '.join(['relation', cond.op, relname.replace("'", '')]))
-                else:
-                    relid = para_wn.get_relation_id(relname.replace('"', '').replace("'", ''))
-                    if relid >= 0:
-                        conditional_part.append(' '.join(['relation', cond.op, str(relid)]))
-            elif bool(cond.pivotnum):
-                #Lili Kotlerman: added condition for number of pivots
-                pivotnum = cond.pivotnum
-                if cond.op == 'include':
-                    # In this case pivotnum should hold one pivot's text. Pivots field contains ["pivot:score", "pivot:score",...]
-                    conditional_part.append(' '.join(['pivots LIKE', "'%" + '"' + pivotnum.replace('"', '').replace("'", '') + ":%'"]) + " OR" + ' pivots =="' + pivotnum.replace('"', '').replace("'", '') + '"')
-                else:
-                    conditional_part.append(' '.join(['pivotnum', cond.op, pivotnum]))
-            elif bool(cond.wndist):
-                #Lili Kotlerman: added condition for WordNet distance
-                wndist = cond.wndist
-                conditional_part.append(' '.join(['distance', cond.op, wndist]))
-
-        # AND all the conditions for the conditional part
-        if not identity_clause and not self._identical:
-            conditional_part.append('identity = {}'.format(int(self._identical)))
-        if self._same_pos:
-            conditional_part.append('samepos = {}'.format(int(self._same_pos)))
-        if self._unique_tgt:
-            conditional_part.append('tgtdupl = 0')
-        conditional_part = 'where ' + ' and '.join(conditional_part)
-
-        # generate the order part
-        order_part = 'order by {}'.format(self._ORDER_VALUES[self._order])
-
-        if self._mode == 'basic':
-            # Lili Kotlerman: to remove limit, set limit < 0
-            limit_part = 'limit {}'.format(self._limit) if self._limit > 0 else ''
-            finalsql = ' '.join([ParaQueryApp._BASICSQLCMD, conditional_part, order_part, limit_part])
-        else:
-            #'count'
-            # Lili Kotlerman: to remove grouping, set group_by=''
-            group_part = 'group by "{}"'.format(self._group_by)
-            finalsql = ' '.join([ParaQueryApp._COUNTSQLCMD.format(self._group_by), conditional_part, group_part, 'order by cnt asc'])
-        return finalsql
+    # build a query compiler from the current shell settings
+    def _get_compiler(self):
+        return query_compiler.QueryCompiler(limit=self._limit, order=self._order, identical=self._identical, same_pos=self._same_pos, unique_tgt=self._unique_tgt, group_by=self._group_by, source_stats=self._source_stats, lemmas=self._lemmas, similarity=self._similarity)
 
     # method to take a pyparsing ParseResults object and convert
     # into an appropriate sql query.
-    def _generate_sql_from_query(self, query_results):
+    def _generate_sql_from_query(self, query_results, paged=False, after=None):
+        compiler = self._get_compiler()
+        compiler.paged = paged
         # set _mode = 'basic' or 'count' but only for the show command. Nothing else.
-        self._mode = 'count' if query_results.count else 'basic'
-        if bool(query_results.prob):
-            return self._generate_unary_prob_sql(query_results)
-        elif bool(query_results.ident):
-            return self._generate_ident_sql(query_results)
-        elif bool(query_results.condition):
-            return self._generate_conditional_sql(query_results)
-
-    # how to display the output of the query
-    def _display(self):
-        if self._mode == 'basic':
+        self._mode = compiler.get_mode(query_results)
+        return compiler.compile(query_results, after=after)
+
+    # same as _generate_sql_from_query() but writes out an error message
+    # and returns None if the query cannot be run with the current settings
+    def _compile_query(self, query_results, paged=False, after=None):
+        try:
+            return self._generate_sql_from_query(query_results, paged=paged, after=after)
+        except ValueError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+
+    # for lazily indexed databases, fill in the WordNet columns of all the
+    # rules that may match the query if the rules that do match it depend on
+    # them, or always if all the matching rules are needed, e.g., for analyses
+    def _annotate_matching(self, query_results, always=False):
+        if not self._lazy:
+            return
+        compiler = self._get_compiler()
+        if always or compiler.uses_wordnet(query_results):
+            self._annotate(para_annotate.annotate_matching, compiler.get_unannotated_conditional_part(query_results))
+
+    # annotate the rules of a lazily indexed database with the given function
+    # of the connection and the other arguments, showing the progress
+    def _annotate(self, annotate, *args):
+        if not self._lazy:
+            return 0
+        if self._debug:
+            sys.stderr.write('\nAnnotating rules with WordNet relations ... ')
+        num_rules = annotate(self._cursor.connection, *args)
+        if self._debug:
+            sys.stderr.write('done. Annotated {} rules.\n'.format(num_rules))
+        return num_rules
+
+    # run a query and fetch all the rows, annotating the rules in the results
+    # that are not annotated yet and running the query again if there are any
+    def _fetch_annotated(self, sql_query):
+        self._cursor.execute(sql_query)
+        rows = self._cursor.fetchall()
+        if self._mode == 'basic' and self._annotate(para_annotate.annotate_rows, rows) > 0:
+            self._cursor.execute(sql_query)
             rows = self._cursor.fetchall()
+        return rows
+
+    # run a paged query for "show", "explain" or "next" and display the results.
+    # If there may be more results, remember the (pe2e1, rowid) of the last rule
+    # so that "next" can continue from there.
+    def _show_page(self, query_results, sql_query):
+        if self._debug:
+            sys.stderr.write('\nQuery: ' + sql_query + ';\n')
+        self._annotate_matching(query_results)
+        rows = self._fetch_annotated(sql_query)
+        self._next_page = None
+        if self._get_compiler().is_pageable(query_results):
+            if self._limit > 0 and len(rows) == self._limit:
+                last_row = rows[-1]
+                self._next_page = (query_results, (last_row[2], last_row[-1]), self._explain)
+            # remove the rowids before displaying
+            rows = [row[:-1] for row in rows]
+            sys.stdout.write(self._display(rows) + '\n')
+        else:
+            sys.stdout.write(self._display(rows) + '\n')
+        sys.stdout.flush()
+
+    # how to display the output of the query, the rows are fetched
+    # from the cursor unless they are given
+    def _display(self, rows=None):
+        if self._mode == 'basic':
+            rows = self._cursor.fetchall() if rows is None else rows
             if not rows:
                 return ''
             newrows = []
@@ -432,7 +554,7 @@ class ParaQueryApp(Cmd):
             return self._format_display(newrows, self._interactive, maxsrclen, maxtrglen, maxproblen, maxrellen)
         # display the count results
         else:
-            rows = self._cursor.fetchall()
+            rows = self._cursor.fetchall() if rows is None else rows
             if not rows:
                 return ''
             res = ['']
@@ -537,12 +659,9 @@ class ParaQueryApp(Cmd):
         except:
             sys.stderr.write('\n Error: cannot parse query.\n\n')
         else:
-            sql_query = self._generate_sql_from_query(results)
-            if self._debug:
-                sys.stderr.write('\nQuery: ' + sql_query + ';\n')
-            self._cursor.execute(sql_query)
-            sys.stdout.write(self._display() + '\n')
-            sys.stdout.flush()
+            sql_query = self._compile_query(results, paged=True)
+            if sql_query:
+                self._show_page(results, sql_query)
 
     # method that runs the "explain <query>"" command
     def do_explain(self, query):
@@ -567,14 +686,283 @@ class ParaQueryApp(Cmd):
         except:
             sys.stderr.write('\n Error: cannot parse query.\n\n')
         else:
-            sql_query = self._generate_sql_from_query(results)
-            if self._debug:
-                sys.stderr.write('\nQuery: ' + sql_query + ';\n')
-            self._cursor.execute(sql_query)
-            sys.stdout.write(self._display() + '\n')
-            sys.stdout.flush()
+            sql_query = self._compile_query(results, paged=True)
+            if sql_query:
+                self._show_page(results, sql_query)
         self._set_explain_value('off')
 
+    # method that runs the "next" command
+    def do_next(self, arg):
+        """
+        Show the next page of results for the last "show" or "explain" query.
+        Each page has as many rules as the current limit. Each page takes the
+        same time to retrieve, no matter how many pages came before it.
+        """
+        # make sure a database is attached
+        if not hasattr(self, '_dbfile'):
+            sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
+            return False
+
+        # results in random order do not have a next page
+        if self._order == 'random()':
+            sys.stderr.write('\n Error: results in random order cannot be paged.\n Use "set order prob" to page through the results.\n\n')
+            return False
+
+        if not self._next_page:
+            sys.stderr.write('\n Error: there are no more results to show.\n\n')
+            return False
+
+        results, after, explain = self._next_page
+        sql_query = self._compile_query(results, paged=True, after=after)
+        if sql_query:
+            self._explain = explain
+            self._show_page(results, sql_query)
+            self._explain = False
+
+    # method that runs the "export <query> to <file>" command
+    def do_export(self, arg):
+        """
+        Export all the rules matching a query to columnar files. Examples:
+
+        # write one .npy file per column to the directory "man-rules"
+        export source = "man" and prob > 0.01 to man-rules
+
+        # write a single parquet file (requires pyarrow) and include the pivots
+        export relation = "synonym" to synonyms.parquet with pivots
+
+        Pay attention: the exported rules are not limited by the "limit" parameter
+        """
+        # make sure a database is attached
+        if not hasattr(self, '_dbfile'):
+            sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
+            return False
+
+        query, sep, filename = arg.rpartition(' to ')
+        if not sep or not filename.strip():
+            sys.stderr.write('\n Error: usage is "export <query> to <file> [with pivots]".\n\n')
+            return False
+        filename = filename.strip()
+        with_pivots = filename.endswith(' with pivots')
+        if with_pivots:
+            filename = filename[:-len(' with pivots')].strip()
+
+        try:
+            results = self._query_parser.parse(query)
+        except:
+            sys.stderr.write('\n Error: cannot parse query.\n\n')
+            return False
+
+        # cannot export 'count' queries
+        if results.count:
+            sys.stderr.write('\n Error: cannot use "count" modifier for export queries.\n\n')
+            return False
+
+        compiler = self._get_compiler()
+        compiler.limit = -1
+        try:
+            sql_query = compiler.compile(results)
+        except ValueError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+            return False
+        if self._debug:
+            sys.stderr.write('\nQuery: ' + sql_query + ';\n')
+        # all the exported rules need their WordNet relations
+        self._annotate_matching(results, always=True)
+        cursor = self._cursor.connection.cursor()
+        cursor.execute(sql_query)
+        try:
+            num_rows = para_export.export_rules(cursor, filename, with_pivots)
+        except ImportError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+        else:
+            sys.stdout.write('\n Exported {} paraphrase rules to {}.\n\n'.format(num_rows, filename))
+            sys.stdout.flush()
+        finally:
+            cursor.close()
+
+    # method that runs the "compare <path>" command
+    def do_compare(self, arg):
+        """
+        Compare the attached database with the paraphrase database at the
+        given path, e.g., "compare /path/to/de-en". Shows how many paraphrase
+        pairs are in both databases and in only one of them, the correlation
+        of the probabilities of the shared pairs and the differences between
+        the distributions of WordNet relations.
+        """
+        # make sure a database is attached
+        if not hasattr(self, '_dbfile'):
+            sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
+            return False
+
+        dbpath = arg.strip()
+        if not dbpath:
+            sys.stderr.write('\n Error: usage is "compare <path>".\n\n')
+            return False
+        other_dbfile = para_db.find_dbfile(dbpath)
+        if not os.path.exists(other_dbfile):
+            sys.stderr.write('\n Error: the path {} does not contain a paraphrase database.\n\n'.format(dbpath))
+            return False
+
+        # the WordNet relations of all the rules of both databases are needed,
+        # so the rules of lazily indexed databases are annotated first
+        if self._lazy:
+            sys.stderr.write('\n Adding the WordNet relations of the attached database ... ')
+            self._annotate(para_annotate.annotate_matching)
+            sys.stderr.write('done.\n')
+        elif not para_annotate.is_annotated(self._cursor.connection):
+            sys.stderr.write('\n Error: some rules of the attached database do not have WordNet relations yet and read-only databases cannot be annotated.\n\n')
+            return False
+        other_conn = para_db.connect(other_dbfile, readonly=True, cache_size=self._cache_size, mmap_size=self._mmap_size, temp_store=self._temp_store)
+        if not para_annotate.is_annotated(other_conn):
+            other_conn.close()
+            sys.stderr.write('\n Adding the WordNet relations of the database at {} ... '.format(dbpath))
+            other_conn = para_db.connect(other_dbfile, cache_size=self._cache_size, mmap_size=self._mmap_size, temp_store=self._temp_store)
+            try:
+                para_annotate.annotate_matching(other_conn)
+            except sqlite3.Error as e:
+                other_conn.close()
+                sys.stderr.write('\n Error: cannot add the WordNet relations of the database at {} ({}).\n\n'.format(dbpath, e))
+                return False
+            sys.stderr.write('done.\n')
+
+        # both databases are read with their own connections since the
+        # comparison streams the rules of both at the same time
+        sys.stderr.write('\n Comparing databases ... ')
+        conn = para_db.connect(self._dbfile, readonly=self._readonly, cache_size=self._cache_size, mmap_size=self._mmap_size, temp_store=self._temp_store)
+        try:
+            comparison = para_compare.compare(conn, other_conn)
+        except (sqlite3.Error, ValueError) as e:
+            sys.stderr.write('\n Error: cannot compare the databases ({}).\n\n'.format(e))
+            return False
+        finally:
+            conn.close()
+            other_conn.close()
+        sys.stderr.write('done.\n')
+        sys.stdout.write(para_compare.comparison_display((self._dbfile, os.path.abspath(other_dbfile)), comparison))
+        sys.stdout.flush()
+
+    def do_lexicon(self, arg):
+        """
+        Look up WordNet relations in a compact lexicon instead of the NLTK
+        WordNet corpus. Use "lexicon build <path>" to build the lexicon from
+        the NLTK corpus and save it in the given directory, "lexicon <path>"
+        to use a lexicon that was already built and "lexicon off" to use the
+        NLTK corpus again.
+        """
+        args = arg.split(None, 1)
+        if not args:
+            sys.stderr.write('\n Error: usage is "lexicon build <path>", "lexicon <path>" or "lexicon off".\n\n')
+            return False
+        if args[0] == 'off' and len(args) == 1:
+            with para_annotate.wordnet_lock:
+                para_wn.use_lexicon(None)
+            sys.stderr.write('\n Using the NLTK WordNet corpus.\n\n')
+            return False
+        if args[0] == 'build' and len(args) == 2:
+            path = args[1].strip()
+            sys.stderr.write('\n Building WordNet lexicon ... ')
+            try:
+                num_synsets = para_lexicon.build(path)
+            except (IOError, OSError, LookupError) as e:
+                sys.stderr.write('\n Error: cannot build the lexicon ({}).\n\n'.format(e))
+                return False
+            sys.stderr.write('done ({} synsets).\n'.format(num_synsets))
+        else:
+            path = arg.strip()
+        try:
+            # the rules may be being annotated in the background
+            with para_annotate.wordnet_lock:
+                para_wn.use_lexicon(path)
+        except IOError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+            return False
+        sys.stderr.write('\n Using the WordNet lexicon in {}.\n\n'.format(path))
+
+    def do_vectors(self, arg):
+        """
+        Add the distributional similarity of the source and target of every
+        rule of the attached database, computed with word vectors, so that
+        they can be used in "similarity" conditions and analyses. Use
+        "vectors convert <file> <path>" to convert word vectors in the text
+        format of word2vec or GloVe and save them in the given directory, and
+        "vectors <path>" to compute the similarities with converted vectors.
+        """
+        args = arg.split()
+        if len(args) == 3 and args[0] == 'convert':
+            sys.stderr.write('\n Converting word vectors ... ')
+            try:
+                num_words = para_vectors.convert(args[1], args[2])
+            except (IOError, OSError, ValueError) as e:
+                sys.stderr.write('\n Error: cannot convert the word vectors ({}).\n\n'.format(e))
+                return False
+            sys.stderr.write('done ({} words).\n\n'.format(num_words))
+            return False
+        if len(args) != 1:
+            sys.stderr.write('\n Error: usage is "vectors convert <file> <path>" or "vectors <path>".\n\n')
+            return False
+
+        # make sure a database is attached
+        if not hasattr(self, '_dbfile'):
+            sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
+            return False
+        if self._readonly:
+            sys.stderr.write('\n Error: cannot add similarities to read-only databases.\n\n')
+            return False
+        try:
+            vectors = para_vectors.Vectors(args[0])
+        except IOError as e:
+            sys.stderr.write('\n Error: {}.\n\n'.format(e))
+            return False
+        sys.stderr.write('\n Computing similarities ... ')
+        num_rules = para_vectors.add_similarities(self._cursor.connection, vectors)
+        self._similarity = True
+        sys.stderr.write('done. {} rules have a similarity.\n\n'.format(num_rules))
+
+    def do_annotate(self, arg):
+        """
+        Add the WordNet relations of all the rules of a database indexed with
+        "index <filename> lazy" in the background while it can still be
+        queried. Use "annotate status" to see how many rules are left and
+        "annotate stop" to stop annotating them.
+        """
+        # make sure a database is attached
+        if not hasattr(self, '_dbfile'):
+            sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
+            return False
+
+        running = self._annotator is not None and self._annotator.is_alive()
+        arg = arg.strip()
+        if arg == 'status':
+            num_rules = para_annotate.num_unannotated(self._cursor.connection)
+            if self._annotator is not None and self._annotator.error is not None:
+                sys.stderr.write('\n Error: annotating the rules failed ({}).\n'.format(self._annotator.error))
+            sys.stdout.write('\n {} rules do not have WordNet relations yet{}.\n\n'.format(num_rules, ', annotating them in the background' if running else ''))
+            sys.stdout.flush()
+        elif arg == 'stop':
+            if running:
+                self._stop_annotator()
+            sys.stderr.write('\n Stopped annotating the rules.\n\n')
+        elif arg == '':
+            if self._readonly:
+                sys.stderr.write('\n Error: read-only databases cannot be annotated.\n\n')
+            elif running:
+                sys.stderr.write('\n The rules are already being annotated in the background.\n\n')
+            elif not self._lazy or para_annotate.is_annotated(self._cursor.connection):
+                sys.stderr.write('\n All the rules already have WordNet relations.\n\n')
+            else:
+                self._annotator = para_annotate.Annotator(self._dbfile)
+                self._annotator.start()
+                sys.stderr.write('\n Annotating the rules in the background.\n Use "annotate status" to see the progress.\n\n')
+        else:
+            sys.stderr.write('\n Error: usage is "annotate", "annotate status" or "annotate stop".\n\n')
+
+    # stop annotating the rules in the background and wait for the current batch
+    def _stop_annotator(self):
+        if self._annotator is not None:
+            self._annotator.stop()
+            self._annotator.join()
+            self._annotator = None
+
     # Lili Kotlerman: added method returning query output
     # method that returns the "<query>" command results
     # as a list rather than printing them out
@@ -592,8 +980,8 @@ class ParaQueryApp(Cmd):
             sql_query = self._generate_sql_from_query(results)
             if self._debug:
                 sys.stderr.write('\nQuery: ' + sql_query + ';\n')
-            self._cursor.execute(sql_query)
-            res = self._cursor.fetchall()
+            self._annotate_matching(results)
+            res = self._fetch_annotated(sql_query)
         return res
 
     # method to set some internal variables for the query shell
@@ -615,7 +1003,7 @@ class ParaQueryApp(Cmd):
             args = [x.strip() for x in args]
 
         # make sure that only the appropriate settings are being set
-        if args[0] in ['identical', 'order', 'limit', 'debug', 'group_by', 'explain', 'same_pos', 'unique_tgt']:
+        if args[0] in ['identical', 'order', 'limit', 'debug', 'group_by', 'explain', 'same_pos', 'unique_tgt', 'seed', 'approx_error', 'analysis_cache', 'cache_size', 'mmap_size', 'temp_store']:
             exec('self._set_{}_value("{}")'.format(args[0], args[1]))
         else:
             sys.stderr.write('\n Error: incorrect setting name. Use "set" to see current settings.\n\n')
@@ -632,16 +1020,30 @@ class ParaQueryApp(Cmd):
             sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
             return False
 
+    # method to load the attached database into the OS page cache
+    def do_prewarm(self, arg):
+        """
+        Read the attached database file once so that its pages are cached
+        by the operating system before running queries.
+        """
+        if not hasattr(self, '_dbfile'):
+            sys.stderr.write('\n No database attached.\n Use "index <filename>" to generate a new database.\n Use "attach <path>" to attach a database.\n\n')
+            return False
+        sys.stderr.write('\n Prewarming database ... ')
+        num_bytes = para_db.prewarm(self._dbfile)
+        sys.stderr.write('done. Read {} MB.\n\n'.format(num_bytes >> 20))
+
     def _get_rules(self, arg, query):
         # get the currently set limit value since we may have to override it
         old_limit = self._limit
 
         rules = []
         if arg.count('top') > 0:
-            # expected command is "analyze top N", where N is an int
+            # expected command is "analyze top N", where N is an int. The top N
+            # rules are retrieved separately for each source string.
             top_n_rules = int(arg.split()[1])
-            self._set_limit_value(top_n_rules)
-            get_arg = query
+            self._set_limit_value(-1)
+            get_arg = 'top {} per source where {}'.format(top_n_rules, query)
         elif arg.count('all') > 0:
             # expected command is "analyze all"
             self._set_limit_value(-1)
@@ -661,6 +1063,60 @@ class ParaQueryApp(Cmd):
 
         return rules
 
+    # get the where clause selecting the rules to analyze if the analysis can
+    # be computed with aggregate queries in the database, i.e., if it is an
+    # analysis of all the rules matching a query, or if it is an approximate
+    # analysis ("analyze approx [<query>]"). Otherwise return None.
+    def _get_analysis_conditional_part(self, arg, query):
+        if arg.split()[:1] == ['approx']:
+            get_arg = arg.split(None, 1)[1] if len(arg.split()) > 1 else query
+        elif arg.count('top') > 0 or not para_dbanalysis.is_supported():
+            return None
+        elif arg.count('all') > 0:
+            get_arg = query
+        elif self._limit <= 0:
+            get_arg = arg
+        else:
+            return None
+        try:
+            results = self._query_parser.parse(get_arg)
+            conditional_part = self._get_compiler().get_conditional_part(results)
+        except:
+            sys.stderr.write('\n Error: cannot parse query.\n')
+            return None
+        if self._debug:
+            sys.stderr.write('\nConditions: ' + conditional_part + ';\n')
+        # the analysis reads the WordNet relations of all the matching rules
+        self._annotate_matching(results, always=True)
+        return conditional_part
+
+    # get a random sample of the rules for "analyze sample N [stratified] [<query>]"
+    # by looking up random rowids. Returns None if the command cannot be parsed.
+    def _get_sample_rules(self, arg, query):
+        args = arg.split(None, 2)
+        try:
+            sample_len = int(args[1])
+            assert sample_len > 0
+        except:
+            sys.stderr.write('\n Error: expected "analyze sample N [stratified] [<query>]".\n\n')
+            return None
+        rest = args[2] if len(args) > 2 else ''
+        stratified = rest.split()[:1] == ['stratified']
+        if stratified:
+            rest = rest.split(None, 1)[1] if len(rest.split()) > 1 else ''
+        try:
+            results = self._query_parser.parse(rest or query)
+            conditional_part = self._get_compiler().get_conditional_part(results)
+        except:
+            sys.stderr.write('\n Error: cannot parse query.\n\n')
+            return None
+        # the rules that may match need to be annotated in lazily indexed databases
+        # if the query depends on their WordNet columns, otherwise only the
+        # rules that are drawn
+        self._annotate_matching(results)
+        annotate = para_annotate.annotate_rowids if self._lazy else None
+        return para_sampling.sample_rules(self._cursor.connection, conditional_part, sample_len, stratified=stratified, annotate=annotate)
+
     # Lili Kotlerman: added method to analyze the database
     def do_analyze(self, arg):
         """
@@ -681,11 +1137,60 @@ class ParaQueryApp(Cmd):
             sys.stderr.write('\n Error: cannot use "count" modifier for analyze queries.\n\n')
             return False
 
+        approx = arg.split()[:1] == ['approx']
+        sampled = arg.split()[:1] == ['sample']
+        if (approx or sampled) and (arg.count('using') > 0 or arg.count('top') > 0):
+            sys.stderr.write('\n Error: approximate and sample analyses can only be run for queries.\n\n')
+            return False
+
+        # analyses of random samples are only cached if they are reproducible
+        use_cache = self._analysis_cache != 'off' and not (sampled and self._seed is None)
+        cache_key = self._get_analysis_cache_key(arg) if use_cache else None
+        analysis = None
+        if use_cache and self._analysis_cache == 'on':
+            analysis = para_cache.load(self._cursor.connection, cache_key)
+        if analysis is not None:
+            sys.stdout.write('\n Using the cached analysis from {}.\n'.format(analysis['created']))
+        else:
+            # the random samples of every analysis are drawn starting from the
+            # seed so that the same analysis gives the same results every time
+            para_sampling.set_seed(self._seed)
+            analysis = self._compute_analysis(arg, approx, sampled)
+            if analysis is None:
+                return False
+            if use_cache and analysis['size'] > 0 and not self._readonly:
+                try:
+                    para_cache.save(self._cursor.connection, cache_key, 'analyze ' + arg, analysis)
+                except sqlite3.Error as e:
+                    sys.stderr.write('\n Warning: cannot cache the analysis ({}).\n'.format(e))
+        if analysis['size'] > 0:
+            # the reports are the same whether the analysis was cached or not
+            para_sampling.set_seed(self._seed)
+            self._write_analysis(arg, analysis)
+
+    # the cache key for an analysis depends on the command, the settings that
+    # affect the analysis, the database and any external source file
+    def _get_analysis_cache_key(self, arg):
+        settings = {'limit': self._limit, 'order': self._order, 'identical': self._identical, 'same_pos': self._same_pos,
+                    'unique_tgt': self._unique_tgt, 'seed': self._seed, 'approx_error': self._approx_error}
+        for keyword in ['text ', 'terms ']:
+            if arg.count('using') > 0 and arg.count(keyword) > 0:
+                filename = arg.split(keyword)[1]
+                if os.path.exists(filename):
+                    stat = os.stat(filename)
+                    settings['source_file'] = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+        return para_cache.analysis_key('analyze ' + arg, settings, para_cache.database_identity(self._cursor.connection))
+
+    # retrieve and analyze the rules for an analyze command and return the
+    # analysis, i.e., a dictionary with all the data needed to write out the
+    # results, or None if the command is not valid
+    def _compute_analysis(self, arg, approx, sampled):
+        conditional_part = None
         if arg.count('using') > 0:
             # no source conditions allowed unless 'using' is not specified
             if arg.count('source') > 0:
                 sys.stderr.write('\n Error: cannot specify source condition for analyze queries with external source.\n\n')
-                return False
+                return None
             rules = []
             user_srcs = []
             if arg.count('text') > 0:
@@ -697,7 +1202,7 @@ class ParaQueryApp(Cmd):
                 sys.stdout.write('\n Found {} terms.\n'.format(str(len(user_srcs))))
             else:
                 sys.stderr.write('\n Error: cannot parse query.\n\n')
-                return False
+                return None
 
             sys.stdout.write('\n Retrieving rules from the database ... ')
             sys.stdout.flush()
@@ -708,50 +1213,111 @@ class ParaQueryApp(Cmd):
             user_srcs = []
             query = 'source = "*"'
             sys.stdout.flush()
-            rules = self._get_rules(arg, query)
-            sys.stdout.write('\n Retrieving rules from the database ... ')
-
-        db_size = len(rules)
-        if self._limit > 0 and arg.count('using') == 0:
+            # analyses of all the matching rules are computed in the database
+            conditional_part = None if sampled else self._get_analysis_conditional_part(arg, query)
+            if approx and conditional_part is None:
+                return None
+            if sampled:
+                sys.stdout.write('\n Sampling rules from the database ... ')
+                rules = self._get_sample_rules(arg, query)
+                if rules is None:
+                    return None
+            elif conditional_part is not None:
+                sys.stdout.write('\n Counting rules in the database ... ')
+                db_size = para_dbanalysis.get_size(self._cursor.connection, conditional_part)
+            else:
+                rules = self._get_rules(arg, query)
+                sys.stdout.write('\n Retrieving rules from the database ... ')
+
+        if conditional_part is None:
+            db_size = len(rules)
+        # the global limit only applies to regular analyses without "top" or "all"
+        limited = self._limit > 0 and arg.count('using') == 0 and arg.count('top') == 0 and arg.count('all') == 0 and not approx and not sampled
+        if sampled:
+            sys.stdout.write("sampled {} paraphrase rules.\n".format(db_size))
+        elif limited:
             sys.stdout.write("found {} paraphrase rules (limit = {}).\n".format(db_size, self._limit))
         else:
             sys.stdout.write("found {} paraphrase rules.\n".format(db_size))
-        if db_size > 0:
-            sys.stdout.write("\n Analyzing...")
-            # sort to group rules for each source together, one by one
-            rules.sort()
-            out_text = ['\n\n\n===================================================== ANALYSIS =================================================================\n']
-            out_text.append('Command: {}\n'.format('analyze ' + arg))
-            out_text.append(self._dbfile + '\n')
-            out_text.append(str(datetime.now()) + '\n\n')
-            # write out a warning for non "using" queries if the limit was set
-            if self._limit > 0 and arg.count('using') == 0:
-                out_text.append('WARNING: this analysis was conducted with limit set to {}, i.e., only the top {} rules for each source string were analyzed. To analyze all rules, please use "set limit none" before running the analysis command.\n\n'.format(self._limit, self._limit))
-            if user_srcs:
-                out_text.append('Terms analyzed: {}\n'.format(user_srcs))
+
+        analysis = {'size': db_size, 'user_srcs': user_srcs, 'limited': limited, 'approx': approx, 'sampled': sampled}
+        if db_size == 0:
+            return analysis
+        sys.stdout.write("\n Analyzing...")
+        if approx:
+            # the rules are streamed through sketches, see para_dbanalysis.summarize_approx()
+            analysis['summary'] = para_dbanalysis.summarize_approx(self._cursor.connection, conditional_part, self._approx_error, db_size)
+        elif conditional_part is not None:
+            # only the aggregates and the example rules are retrieved from the database
+            analysis['summary'] = para_dbanalysis.summarize(self._cursor.connection, conditional_part, db_size)
+            sys.stdout.write('\n')
+        else:
             # top rules have scores > percentiles[3] percentile, bottom rules have scores < percentiles[0] percentile,
             # middle rules are between percentiles[1] and percentiles[2] percentile
             percentiles = [15, 40, 60, 85]
-            out_text.append("Analyzing: " + str(db_size) + " paraphrase rules.\n")
-            score_distribution = para_analysis.get_score_distribution(rules)
-            out_text.append(para_analysis.scores_and_percentiles_display(score_distribution, para_analysis.intervals, db_size, (0, 1)))
-            percentile_scores = para_analysis.get_percentile_scores(percentiles, score_distribution)
-            data = para_analysis.analyze_rules(rules, percentile_scores)
-
-            # Add analysis of the whole collection
-            analysis_to_print = para_analysis.whole_analysis_display(db_size, data)
-            out_text.append(analysis_to_print)
-            sys.stdout.write(analysis_to_print + '\n\n')
-            sys.stdout.flush()
+            # sort to group rules for each source together, one by one
+            rules.sort()
+            # sorted once for the display and the percentile scores
+            score_distribution = para_stats.Distribution(para_analysis.get_score_distribution(rules))
+            analysis['scores_display'] = para_analysis.scores_and_percentiles_display(score_distribution, para_analysis.intervals, db_size, (0, 1))
+            analysis['percentiles'] = percentiles
+            analysis['percentile_scores'] = para_analysis.get_percentile_scores(percentiles, score_distribution)
+            analysis['data'] = para_analysis.analyze_rules(rules, analysis['percentile_scores'])
+        if self._similarity:
+            if conditional_part is not None:
+                analysis['similarity'] = para_vectors.summarize(self._cursor.connection, conditional_part)
+            else:
+                analysis['similarity'] = para_vectors.summarize_rules(self._cursor.connection, rules)
+        return analysis
+
+    # write out the results of an analysis and append them to "analysis.txt"
+    def _write_analysis(self, arg, analysis):
+        db_size = analysis['size']
+        out_text = ['\n\n\n===================================================== ANALYSIS =================================================================\n']
+        out_text.append('Command: {}\n'.format('analyze ' + arg))
+        out_text.append(self._dbfile + '\n')
+        out_text.append(str(datetime.now()) + '\n\n')
+        if 'created' in analysis:
+            out_text.append('Cached analysis computed on {}\n\n'.format(analysis['created']))
+        # write out a warning for non "using" queries if the limit was set
+        if analysis['limited']:
+            out_text.append('WARNING: this analysis was conducted with limit set to {}, i.e., only the top {} rules for the query were analyzed. To analyze all rules, please use "set limit none" before running the analysis command. To analyze the top N rules for each source string, use "analyze top N".\n\n'.format(self._limit, self._limit))
+        if analysis['user_srcs']:
+            out_text.append('Terms analyzed: {}\n'.format(analysis['user_srcs']))
+        if analysis['sampled']:
+            out_text.append('Analysis of a random sample of rules: the 95% confidence intervals of the averages and percentages are shown in brackets.\n')
+        out_text.append("Analyzing: " + str(db_size) + " paraphrase rules.\n")
+        if analysis['approx']:
+            out_text.append('Approximate analysis: the probabilities at percentiles have a relative error of at most {}.\n'.format(self._approx_error))
+        if 'summary' in analysis:
+            summary = analysis['summary']
+            out_text.append(para_dbanalysis.scores_and_percentiles_display(summary))
+            analysis_to_print = para_dbanalysis.whole_analysis_display(summary)
+        else:
+            data = analysis['data']
+            out_text.append(analysis['scores_display'])
+            analysis_to_print = para_analysis.whole_analysis_display(db_size, data, confidence_intervals=analysis['sampled'])
+
+        if 'similarity' in analysis:
+            analysis_to_print += para_vectors.similarity_display(analysis['similarity'])
 
-            if db_size > 1000:
+        # Add analysis of the whole collection
+        out_text.append(analysis_to_print)
+        sys.stdout.write(analysis_to_print + '\n\n')
+        sys.stdout.flush()
+
+        if db_size > 1000:
+            if 'summary' in analysis:
                 for part in para_analysis.parts:
-                    out_text.append(para_analysis.part_analysis_display(part, data, percentile_scores, percentiles))
+                    out_text.append(para_dbanalysis.part_analysis_display(part, summary))
+            else:
+                # the reports for the parts are generated using all the cores
+                out_text.extend(para_analysis.parts_analysis_display(data, analysis['percentile_scores'], analysis['percentiles']))
 
-            f = open('analysis.txt', 'a')
-            f.write(''.join(out_text))
-            f.flush()
-            f.close()
+        f = open('analysis.txt', 'a')
+        f.write(''.join(out_text))
+        f.flush()
+        f.close()
 
 if __name__ == '__main__':
 